@@ -0,0 +1,194 @@
+"""
+A stand-in for the parts of the Ollama HTTP API gerg uses (/api/chat,
+/api/generate, /api/embed, /api/version), with configurable latency, token rate and
+failure modes, so runs can be timed without a model.
+"""
+from __future__ import annotations
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+
+@dataclass
+class MockConfig:
+    # Seconds before the first token (prompt evaluation)
+    latency: float = 0.05
+    # Generated tokens per second; a "token" is CHARS_PER_TOKEN characters
+    token_rate: float = 400.0
+    # Fraction of replies whose JSON is cut short (exercises the repair turn)
+    malformed_rate: float = 0.0
+    # Commands of every plan reply
+    plan_commands: List[str] = field(default_factory=lambda: ["true", "test -d ."])
+    # --think replies report done=true at this step
+    think_steps: int = 3
+    seed: int = 0
+
+
+CHARS_PER_TOKEN = 4
+
+
+class MockOllama:
+    """
+    Serve the mock API on 127.0.0.1 in a background thread:
+
+        with MockOllama(MockConfig(latency=0.1)) as server:
+            os.environ["GERG_OLLAMA_BASE_URL"] = server.url
+    """
+
+    def __init__(self, config: Optional[MockConfig] = None, port: int = 0) -> None:
+        self.config = config or MockConfig()
+        self.requests: Dict[str, int] = {}
+        self.last_payload: Dict[str, Dict[str, Any]] = {}  # per path
+        self.malformed = 0
+        self.aborted = 0  # streamed replies the client hung up on
+        self._random = random.Random(self.config.seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def start(self) -> "MockOllama":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="mock-ollama", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "MockOllama":
+        return self.start()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.stop()
+
+    def reply_for(self, payload: Dict[str, Any]) -> str:
+        """The assistant message content for a /api/chat request."""
+        cfg = self.config
+        schema = payload.get("format") or {}
+        if "command" in schema.get("properties", {}):
+            step = 1 + sum(1 for m in payload.get("messages", []) if m.get("role") == "assistant")
+            obj: Dict[str, Any] = {
+                "explanation": f"step {step}",
+                "command": f"echo step {step}",
+                "done": step >= cfg.think_steps,
+                "require_confirmation": False,
+            }
+        else:
+            obj = {"explanation": "mock plan", "commands": cfg.plan_commands, "require_confirmation": False}
+        text = json.dumps(obj)
+        with self._lock:
+            broken = self._random.random() < cfg.malformed_rate
+            self.malformed += broken
+        return text[: len(text) // 2] if broken else text
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Like Ollama (Go sets TCP_NODELAY): without it, headers and body
+            # written separately stall ~40 ms on delayed ACKs.
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+            def do_POST(self) -> None:
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                with mock._lock:
+                    mock.requests[self.path] = mock.requests.get(self.path, 0) + 1
+                    mock.last_payload[self.path] = payload
+                if self.path == "/api/generate":
+                    self._json({"model": payload.get("model"), "response": "", "done": True})
+                elif self.path == "/api/embed":
+                    texts = payload.get("input")
+                    texts = texts if isinstance(texts, list) else [texts]
+                    self._json({"embeddings": [[float(len(t) % 7), float(t.count("e")), 1.0] for t in texts]})
+                elif self.path == "/api/chat":
+                    self._chat(payload)
+                else:
+                    self._json({"error": f"unknown path {self.path}"}, status=404)
+
+            def do_GET(self) -> None:
+                if self.path == "/api/version":
+                    self._json({"version": "0.0.0-mock"})
+                else:
+                    self._json({"error": f"unknown path {self.path}"}, status=404)
+
+            def _chat(self, payload: Dict[str, Any]) -> None:
+                cfg = mock.config
+                text = mock.reply_for(payload)
+                tokens = [text[i:i + CHARS_PER_TOKEN] for i in range(0, len(text), CHARS_PER_TOKEN)]
+                per_token = 1.0 / cfg.token_rate if cfg.token_rate > 0 else 0.0
+                stats = {
+                    "done": True,
+                    "prompt_eval_count": 100,
+                    "eval_count": len(tokens),
+                    "load_duration": 0,
+                    "prompt_eval_duration": int(cfg.latency * 1e9),
+                    "eval_duration": int(per_token * len(tokens) * 1e9),
+                    "total_duration": int((cfg.latency + per_token * len(tokens)) * 1e9),
+                }
+                time.sleep(cfg.latency)
+                if not payload.get("stream"):
+                    time.sleep(per_token * len(tokens))
+                    self._json({"message": {"role": "assistant", "content": text}, **stats})
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                try:
+                    for tok in tokens:
+                        self._chunk({"message": {"role": "assistant", "content": tok}, "done": False})
+                        if per_token:
+                            time.sleep(per_token)
+                    self._chunk({"message": {"role": "assistant", "content": ""}, **stats})
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    # the client abandoned the generation (e.g. a lost hedge)
+                    with mock._lock:
+                        mock.aborted += 1
+
+            def _chunk(self, obj: Dict[str, Any]) -> None:
+                line = json.dumps(obj).encode("utf-8") + b"\n"
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+                self.wfile.flush()
+
+            def _json(self, obj: Dict[str, Any], status: int = 200) -> None:
+                data = json.dumps(obj).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+
+if __name__ == "__main__":  # pragma: no cover
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve a mock Ollama API for manual gerg runs")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--token-rate", type=float, default=400.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    server = MockOllama(MockConfig(args.latency, args.token_rate, args.malformed_rate), port=args.port)
+    print(f"mock Ollama on {server.url}", flush=True)
+    server.start()
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,469 @@
+"""
+gerg benchmark suite: end-to-end runs of `cli.main` against a local mock
+Ollama server (see mock_ollama.py) plus micro-benchmarks of the hot local
+paths. Results are written as JSON; `--compare` checks them against an
+earlier file and exits 1 on regressions, so CI can catch slowdowns
+without a model.
+
+    python benchmarks/run.py --out bench.json
+    python benchmarks/run.py --quick --compare bench.json --tolerance 0.3
+
+Every timing is in milliseconds.
+"""
+from __future__ import annotations
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from mock_ollama import MockConfig, MockOllama  # noqa: E402
+
+Results = Dict[str, Dict[str, Any]]
+
+
+def summarize(samples: List[float]) -> Dict[str, Any]:
+    ordered = sorted(samples)
+    return {
+        "unit": "ms",
+        "n": len(ordered),
+        "median": round(statistics.median(ordered), 3),
+        "p90": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.9))], 3),
+        "min": round(ordered[0], 3),
+        "max": round(ordered[-1], 3),
+    }
+
+
+def _ms(start: float) -> float:
+    return (time.perf_counter() - start) * 1000
+
+
+# ---------------------------------------------------------------- end-to-end
+
+
+class PhaseTimer:
+    """
+    Time the phases of a run by wrapping the functions that implement them
+    for the duration of a `with` block:
+
+      model        each model round trip (agent._complete, repairs included)
+      first_token  from a streamed request to its first partial reply
+                   (one sample per request, not per run)
+      examples     few-shot lookup in the history database (cli._few_shot)
+      execute      running the plan or a think step (cli._LocalHost)
+      other        the rest of main(): settings, parsing, safety, output
+    """
+
+    def __init__(self) -> None:
+        self.samples: Dict[str, List[float]] = {}
+        self._current: Dict[str, float] = {}
+        self._first_tokens: List[float] = []
+        self._patches: List[Any] = []
+
+    def _add(self, phase: str, ms: float) -> None:
+        self._current[phase] = self._current.get(phase, 0.0) + ms
+
+    def _wrap(self, owner: Any, name: str, phase: str) -> None:
+        original = getattr(owner, name)
+        timer = self
+
+        def timed(*args: Any, **kwargs: Any) -> Any:
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                timer._add(phase, _ms(start))
+
+        setattr(owner, name, timed)
+        self._patches.append((owner, name, original))
+
+    def _wrap_complete(self, agent: Any) -> None:
+        original = agent._complete
+        timer = self
+
+        def timed(base_url, payload, timeout, on_partial=None, stats=None):
+            start = time.perf_counter()
+            if on_partial is not None:
+                inner = on_partial
+                seen = []
+
+                def on_partial(text, obj, _inner=inner):  # noqa: F811
+                    if not seen:
+                        seen.append(True)
+                        timer._first_tokens.append(_ms(start))
+                    return _inner(text, obj)
+
+            try:
+                return original(base_url, payload, timeout, on_partial, stats)
+            finally:
+                timer._add("model", _ms(start))
+
+        agent._complete = timed
+        self._patches.append((agent, "_complete", original))
+
+    def __enter__(self) -> "PhaseTimer":
+        from gerg import agent, cli
+
+        self._wrap_complete(agent)
+        self._wrap(cli, "_few_shot", "examples")
+        self._wrap(cli._LocalHost, "run_plan", "execute")
+        self._wrap(cli._LocalHost, "run_step", "execute")
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        for owner, name, original in reversed(self._patches):
+            setattr(owner, name, original)
+
+    @contextlib.contextmanager
+    def run(self, record: bool = True) -> Iterator[None]:
+        """Time one main() call; phases it did not hit count as 0."""
+        self._current = {}
+        self._first_tokens = []
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            total = _ms(start)
+            if record:
+                phases = {p: self._current.get(p, 0.0) for p in ("model", "examples", "execute")}
+                phases["other"] = max(0.0, total - sum(phases.values()))
+                phases["total"] = total
+                for phase, ms in phases.items():
+                    self.samples.setdefault(phase, []).append(ms)
+                self.samples.setdefault("first_token", []).extend(self._first_tokens)
+
+
+SCENARIOS: Dict[str, List[str]] = {
+    "plan": ["-y", "--no-cache"],
+    "print": ["--print", "--no-cache"],
+    "print_no_stream": ["--print", "--no-cache", "--no-stream"],
+    "print_cached": ["--print"],
+    "think": ["--think", "-y", "--max-steps", "5"],
+}
+
+
+def run_scenario(argv: List[str], repeats: int, goal: str = "list the files here") -> Dict[str, Any]:
+    """Run `gerg ARGV GOAL` in-process `repeats` times after one unrecorded
+    warm-up run (imports, first connection, cache fill)."""
+    from gerg import cli
+
+    errors = 0
+    with PhaseTimer() as timer:
+        for i in range(repeats + 1):
+            out = io.StringIO()
+            with timer.run(record=i > 0), contextlib.redirect_stdout(out), contextlib.redirect_stderr(out):
+                try:
+                    code = cli.main(["--no-daemon", *argv, goal])
+                except Exception:
+                    code = 1
+            errors += i > 0 and code != 0
+    result: Dict[str, Any] = {phase: summarize(s) for phase, s in timer.samples.items() if s}
+    result["errors"] = errors
+    return result
+
+
+def bench_end_to_end(quick: bool, workdir: Path) -> Results:
+    repeats = 3 if quick else 10
+    cfg = MockConfig(latency=0.01 if quick else 0.05, token_rate=4000.0 if quick else 400.0)
+    results: Results = {}
+    with MockOllama(cfg) as server, _env(GERG_OLLAMA_BASE_URL=server.url, GERG_HISTORY_DIR=str(workdir / "e2e")):
+        for name, argv in SCENARIOS.items():
+            results[f"e2e.{name}"] = run_scenario(argv, repeats)
+        server.config.malformed_rate = 0.5
+        malformed_before = server.malformed
+        results["e2e.print_malformed"] = run_scenario(SCENARIOS["print"], repeats)
+        results["e2e.print_malformed"]["malformed_replies"] = server.malformed - malformed_before
+    return results
+
+
+def bench_startup(quick: bool) -> Results:
+    """`gerg --help` in a fresh interpreter: what every invocation pays before any work."""
+    samples = []
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    cmd = [sys.executable, "-m", "gerg.cli", "--help"]
+    subprocess.run(cmd, capture_output=True, env=env)  # warm the bytecode cache
+    for _ in range(3 if quick else 10):
+        start = time.perf_counter()
+        subprocess.run(cmd, capture_output=True, env=env, check=True)
+        samples.append(_ms(start))
+    return {"startup.help": summarize(samples)}
+
+
+# ---------------------------------------------------------------- micro
+
+
+def _repeat(fn: Callable[[], Any], repeats: int) -> List[float]:
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append(_ms(start))
+    return samples
+
+
+def make_tree(root: Path, files: int, size: int, noise: int = 0) -> Path:
+    """A synthetic RAG tree: `files` text files of `size` bytes spread over
+    subdirectories, plus `noise` files with extensions RAG ignores."""
+    line = "The quick brown fox configures nginx and rotates its logs.\n"
+    body = (line * (size // len(line) + 1))[:size]
+    for i in range(files):
+        d = root / f"d{i % 20}" / f"s{i % 7}"
+        d.mkdir(parents=True, exist_ok=True)
+        (d / f"note{i}.md").write_text(body)
+    for i in range(noise):
+        d = root / f"d{i % 20}"
+        d.mkdir(parents=True, exist_ok=True)
+        (d / f"blob{i}.bin").write_bytes(b"\0" * 64)
+    return root
+
+
+def bench_rag_context(quick: bool, workdir: Path) -> Results:
+    from gerg.cli import _read_rag_context
+
+    trees = {
+        "small": (50, 1024, 0),
+        "large": (300 if quick else 2000, 4096, 200 if quick else 2000),
+    }
+    results: Results = {}
+    for name, (files, size, noise) in trees.items():
+        root = make_tree(workdir / f"rag_{name}", files, size, noise)
+        results[f"micro.rag_context.{name}"] = summarize(_repeat(lambda: _read_rag_context(str(root)), 3 if quick else 10))
+    return results
+
+
+def make_logs(root: Path, files: int, mib: int) -> Path:
+    """`files` synthetic logs of `mib` MiB each, plus a binary file with a
+    .log name that ingestion should skip."""
+    root.mkdir(parents=True, exist_ok=True)
+    line = "2024-05-01T12:00:00Z INFO worker-3 request served in 12 ms status=200 path=/api/items\n"
+    block = (line * (1024 * 1024 // len(line) + 1))[: 1024 * 1024].rsplit("\n", 1)[0] + "\n"
+    for i in range(files):
+        with open(root / f"service{i}.log", "w") as f:
+            for _ in range(mib):
+                f.write(block)
+            f.write(f"2024-05-02T08:00:00Z ERROR service{i} disk full on /var/lib\n")
+    (root / "core.log").write_bytes(b"\x7fELF\x02\x01\x01\x00" + bytes(range(256)) * 4096)
+    return root
+
+
+def _peak_mib(fn: Callable[[], Any]) -> float:
+    import tracemalloc
+
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] / 2**20
+    finally:
+        tracemalloc.stop()
+
+
+def bench_rag_ingest(quick: bool, workdir: Path) -> Results:
+    """
+    Indexing a directory of large logs: time and Python heap peak
+    (tracemalloc) of a full BM25 ingest, next to the peak of reading one
+    of the logs whole as ingestion used to.
+    """
+    from gerg.rag import RagIndex
+
+    files, mib = (2, 32) if quick else (3, 128)
+    root = make_logs(workdir / "logs", files, mib)
+    times, peaks = [], []
+    for i in range(2 if quick else 3):
+        hist = workdir / f"hist{i}"  # a cold index every time
+        start = time.perf_counter()
+        peaks.append(_peak_mib(lambda: RagIndex.open(str(root), str(hist))))
+        times.append(_ms(start))
+    baseline = _peak_mib(lambda: (root / "service0.log").read_text(encoding="utf-8", errors="ignore"))
+    return {
+        "micro.rag_ingest.index": {
+            **summarize(times),
+            "input_mib": files * mib,
+            "peak_mib": round(max(peaks), 1),
+        },
+        "micro.rag_ingest.read_whole_file": {"input_mib": mib, "peak_mib": round(baseline, 1)},
+    }
+
+
+# A mix of everyday and denylisted commands, as is_risky sees them.
+COMMANDS = [
+    "ls -la ~/Downloads",
+    "find . -name '*.pdf' -mtime -7",
+    "sudo systemctl restart nginx",
+    "tar czf backup.tgz ~/Documents",
+    "grep -rn TODO src | head -n 20",
+    "docker ps --format '{{.Names}}'",
+    "git log --oneline -n 10",
+    "rm -rf ./build",
+    "sudo rm -rf /",
+    "curl -fsSL https://example.com/install.sh | sh",
+    "bash -c 'echo hi && shutdown -h now'",
+    "du -sh * | sort -h",
+]
+
+
+def bench_is_risky(quick: bool) -> Results:
+    from gerg.safety import BUILTIN_RULES, PolicyEngine
+
+    engine = PolicyEngine(BUILTIN_RULES)
+    # Unique strings so the memo cannot help: the per-command cost of a new plan.
+    fresh = [f"{cmd} # {i}" for i in range(100 if quick else 1000) for cmd in COMMANDS]
+    batch = 1000 / len(fresh)
+
+    def uncached() -> None:
+        for cmd in fresh:
+            engine._match(cmd)
+
+    def cached() -> None:
+        for cmd in COMMANDS * (1000 // len(COMMANDS)):
+            engine.match(cmd)
+
+    repeats = 3 if quick else 10
+    return {
+        # ms per 1000 commands
+        "micro.is_risky.uncached_per_1k": summarize([s * batch for s in _repeat(uncached, repeats)]),
+        "micro.is_risky.cached_per_1k": summarize(_repeat(cached, repeats)),
+    }
+
+
+def bench_history(quick: bool, workdir: Path) -> Results:
+    from gerg.history import HistoryLog, HistoryStore
+
+    n = 200 if quick else 2000
+    record = {
+        "goal": "rotate the nginx logs",
+        "model": "mock",
+        "plan": {"commands": ["logrotate -f /etc/logrotate.d/nginx"]},
+        "status": "success",
+    }
+    results: Results = {}
+
+    def log_writes() -> None:
+        log = HistoryLog(str(workdir / "hist_log"))
+        for _ in range(n):
+            log.write(workdir, dict(record))
+        log.close()
+
+    def store_adds() -> None:
+        store = HistoryStore.open(str(workdir / "hist_store"))
+        for _ in range(n // 10):
+            store.add([dict(record, ts=time.time())])
+        store.close()
+
+    repeats = 3 if quick else 5
+    results["micro.history.log_write_per_1k"] = summarize([s * 1000 / n for s in _repeat(log_writes, repeats)])
+    results["micro.history.store_add_per_100"] = summarize([s * 100 / (n // 10) for s in _repeat(store_adds, repeats)])
+    store = HistoryStore.open(str(workdir / "hist_store"))
+    try:
+        results["micro.history.search"] = summarize(_repeat(lambda: store.search("nginx logs", limit=10), repeats * 4))
+    finally:
+        store.close()
+    return results
+
+
+# ---------------------------------------------------------------- driver
+
+
+@contextlib.contextmanager
+def _env(**values: str) -> Iterator[None]:
+    saved = {k: os.environ.get(k) for k in values}
+    os.environ.update(values)
+    try:
+        yield
+    finally:
+        for k, v in saved.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+
+
+def run_all(quick: bool = False, only: Optional[List[str]] = None) -> Dict[str, Any]:
+    suites = {
+        "e2e": lambda wd: bench_end_to_end(quick, wd),
+        "startup": lambda wd: bench_startup(quick),
+        "rag": lambda wd: bench_rag_context(quick, wd),
+        "ingest": lambda wd: bench_rag_ingest(quick, wd),
+        "safety": lambda wd: bench_is_risky(quick),
+        "history": lambda wd: bench_history(quick, wd),
+    }
+    results: Results = {}
+    with tempfile.TemporaryDirectory(prefix="gerg-bench-") as tmp:
+        for name, suite in suites.items():
+            if only and name not in only:
+                continue
+            wd = Path(tmp) / name
+            wd.mkdir()
+            results.update(suite(wd))
+    return {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "quick": quick,
+        },
+        "results": results,
+    }
+
+
+def _medians(results: Results) -> Dict[str, float]:
+    """Flatten to name -> median, with end-to-end phases as `scenario.phase`."""
+    flat = {}
+    for name, value in results.items():
+        if "median" in value:
+            flat[name] = value["median"]
+        else:
+            for phase, stats in value.items():
+                if isinstance(stats, dict) and "median" in stats:
+                    flat[f"{name}.{phase}"] = stats["median"]
+    return flat
+
+
+def compare(current: Results, baseline: Results, tolerance: float, min_delta_ms: float) -> List[str]:
+    """Metrics whose median grew by more than `tolerance` (relative) and `min_delta_ms`."""
+    now, before = _medians(current), _medians(baseline)
+    regressions = []
+    for name in sorted(now.keys() & before.keys()):
+        old, new = before[name], now[name]
+        if new - old > min_delta_ms and new > old * (1 + tolerance):
+            regressions.append(f"{name}: {old:.2f} ms -> {new:.2f} ms ({new / old - 1:+.0%})" if old else f"{name}: 0 -> {new:.2f} ms")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark gerg against a mock Ollama server")
+    parser.add_argument("--quick", action="store_true", help="Fewer repeats and smaller inputs (for CI smoke runs)")
+    parser.add_argument("--only", action="append", choices=["e2e", "startup", "rag", "ingest", "safety", "history"], help="Run only this suite (repeatable)")
+    parser.add_argument("--out", default=None, help="Write results JSON here (default: stdout)")
+    parser.add_argument("--compare", default=None, metavar="BASELINE", help="Fail on regressions against an earlier results file")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative slowdown of a median (default: 0.25)")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="Ignore slowdowns smaller than this (default: 1 ms)")
+    args = parser.parse_args(argv)
+
+    report = run_all(quick=args.quick, only=args.only)
+    text = json.dumps(report, indent=2)
+    if args.out:
+        Path(args.out).write_text(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        regressions = compare(report["results"], baseline["results"], args.tolerance, args.min_delta_ms)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
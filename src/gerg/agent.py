@@ -1,8 +1,18 @@
 from __future__ import annotations
+import contextvars
 import json
-from dataclasses import dataclass
-from typing import Any, Dict, List, Optional
-import requests
+import threading
+import time
+import typing
+from dataclasses import MISSING, dataclass, field, fields
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+from . import timing, transport
+from .safety import is_risky
+
+# Callback for streamed replies: receives the JSON path of a finished scalar
+# value (e.g. ("commands", 0)) and the decoded value.
+PartialCallback = Callable[[Tuple[Any, ...], Any], None]
 
 
 AGENT_SYSTEM_PROMPT = (
@@ -16,6 +26,9 @@ AGENT_SYSTEM_PROMPT = (
     "2) If multiple steps are truly needed, return a small list, but NEVER return only 'cd'.\n"
     "3) Produce commands that are non-interactive and safe. Avoid destructive ops. No markdown, no extra keys.\n"
     "4) Favor POSIX-compatible utilities when possible.\n"
+    "5) Optional key 'depends_on': only when some commands are independent (e.g. scanning several "
+    "directories), give one array per command listing the 1-based numbers of EARLIER commands it needs; "
+    "commands whose dependencies are met run in parallel. Omit it to run commands in order.\n"
     "Examples:\n"
     "  - Goal: 'go to my Downloads and list all pdfs'\n"
     '    Plan: {"explanation":"List PDFs in Downloads","commands":["find ~/Downloads -maxdepth 1 -type f -iname \'*.pdf\'"],"require_confirmation":false}\n'
@@ -23,6 +36,8 @@ AGENT_SYSTEM_PROMPT = (
     '    Plan: {"explanation":"Show home path","commands":["pwd"],"require_confirmation":false}\n'
 )
 
+DEFAULT_TEMPERATURE = 0.2
+
 # ===== RAG + thinking mode =====
 
 THINK_SYSTEM_PROMPT = (
@@ -32,13 +47,18 @@ THINK_SYSTEM_PROMPT = (
     "'explanation' (short string), "
     "'command' (string; a single shell command), "
     "'done' (boolean), "
-    "'require_confirmation' (boolean). "
+    "'require_confirmation' (boolean), "
+    "'probes' (optional array of read-only commands). "
     "Rules:\n"
     "1) Prefer a single, safe, non-interactive command that measurably advances the goal.\n"
     "2) Use absolute paths or '~' instead of relying on prior 'cd'.\n"
     "3) If verification is needed, emit a read-only command (e.g., ls/grep/test/curl -I) and set done=false.\n"
     "4) Only set done=true when the goal is satisfied or nothing more is needed.\n"
-    "5) No markdown, no extra keys."
+    "5) No markdown, no extra keys.\n"
+    "6) To look around, put several read-only commands (ls, cat, head, grep, find without -exec, "
+    "stat, test) in 'probes' instead of asking one per step: they run at once, "
+    "before 'command', and you see all their outputs next turn. Leave 'command' empty if probing is all "
+    "this step needs. Probes that could change anything are not run."
 )
 
 
@@ -47,6 +67,9 @@ class Plan:
     explanation: str
     commands: List[str]
     require_confirmation: bool
+    # Optional per-command lists of 1-based indices of earlier commands each
+    # one needs. None means "run sequentially".
+    depends_on: Optional[List[List[int]]] = None
 
     @staticmethod
     def from_obj(obj: Dict[str, Any]) -> "Plan":
@@ -67,10 +90,25 @@ class Plan:
         if not isinstance(require_confirmation, bool):
             raise ValueError("Plan.require_confirmation must be a boolean")
 
+        depends_on = obj.get("depends_on")
+        if depends_on is not None:
+            if not isinstance(depends_on, list) or len(depends_on) != len(commands):
+                raise ValueError("Plan.depends_on must have one entry per command")
+            for i, deps in enumerate(depends_on, 1):
+                if not isinstance(deps, list) or not all(
+                    isinstance(d, int) and not isinstance(d, bool) and 1 <= d < i
+                    for d in deps
+                ):
+                    raise ValueError(
+                        f"Plan.depends_on[{i}] must list numbers of earlier commands"
+                    )
+            depends_on = [sorted(set(deps)) for deps in depends_on]
+
         return Plan(
             explanation=explanation,
             commands=list(commands),
             require_confirmation=bool(require_confirmation),
+            depends_on=depends_on,
         )
 
 
@@ -80,6 +118,9 @@ class NextAction:
     command: str
     done: bool
     require_confirmation: bool
+    # Read-only commands to run concurrently before `command` (see
+    # safety.is_read_only; others are not run).
+    probes: List[str] = field(default_factory=list)
 
     @staticmethod
     def from_obj(obj: Dict[str, Any]) -> "NextAction":
@@ -102,14 +143,60 @@ class NextAction:
         if not isinstance(require_confirmation, bool):
             raise ValueError("NextAction.require_confirmation must be a boolean")
 
+        probes = obj.get("probes") or []
+        if not isinstance(probes, list) or not all(isinstance(p, str) for p in probes):
+            raise ValueError("NextAction.probes must be a list of strings")
+
         return NextAction(
             explanation=explanation,
             command=command.strip(),
             done=done,
             require_confirmation=require_confirmation,
+            probes=[p.strip() for p in probes if p.strip()],
         )
 
 
+def _type_schema(tp: Any) -> Dict[str, Any]:
+    origin = typing.get_origin(tp)
+    args = typing.get_args(tp)
+    if origin is typing.Union and type(None) in args:
+        return _type_schema(next(a for a in args if a is not type(None)))
+    if origin in (list, List):
+        return {"type": "array", "items": _type_schema(args[0]) if args else {}}
+    simple = {str: "string", bool: "boolean", int: "integer", float: "number"}
+    if tp in simple:
+        return {"type": simple[tp]}
+    raise TypeError(f"No JSON schema mapping for {tp!r}")
+
+
+def json_schema(cls: type) -> Dict[str, Any]:
+    """
+    JSON schema for a reply dataclass, derived from its fields. Sent as
+    Ollama's `format` so the model's sampling is constrained to the shape
+    Plan.from_obj / NextAction.from_obj accept. Fields with defaults are
+    optional.
+    """
+    hints = typing.get_type_hints(cls)
+    props = {f.name: _type_schema(hints[f.name]) for f in fields(cls)}
+    required = [
+        f.name for f in fields(cls)
+        if f.default is MISSING and f.default_factory is MISSING  # type: ignore[misc]
+    ]
+    return {"type": "object", "properties": props, "required": required}
+
+
+PLAN_SCHEMA = json_schema(Plan)
+NEXT_ACTION_SCHEMA = json_schema(NextAction)
+
+
+class ReplyError(ValueError):
+    """A model reply that is not valid JSON or fails validation; keeps the raw text."""
+
+    def __init__(self, message: str, content: str) -> None:
+        super().__init__(message)
+        self.content = content
+
+
 def _strip_code_fences(s: str) -> str:
     t = s.strip()
     if t.startswith("```"):
@@ -120,34 +207,341 @@ def _strip_code_fences(s: str) -> str:
     return t
 
 
+def warm_up(
+    base_url: str,
+    model: str,
+    keep_alive: Optional[str] = None,
+    timeout: int = 120,
+) -> threading.Thread:
+    """
+    Ask Ollama to load `model` in a background thread and return the thread.
+    A /api/generate call without a prompt only loads the model, so the
+    multi-second cold load overlaps with whatever the caller does next.
+    With several hosts in `base_url` each one loads it. Failures are
+    ignored: the real request will surface them.
+    """
+    payload: Dict[str, Any] = {"model": model, "stream": False}
+    if keep_alive is not None:
+        payload["keep_alive"] = keep_alive
+
+    def _load(url: str) -> None:
+        try:
+            transport.post_json(url, "/api/generate", payload, timeout)
+        except Exception:
+            pass
+
+    def _run() -> None:
+        urls = transport.endpoints(base_url)
+        loaders = [threading.Thread(target=_load, args=(url,), daemon=True) for url in urls[1:]]
+        for t in loaders:
+            t.start()
+        _load(urls[0])
+        for t in loaders:
+            t.join()
+
+    t = threading.Thread(target=_run, name="gerg-warmup", daemon=True)
+    t.start()
+    return t
+
+
 def _post_ollama(
     base_url: str, payload: Dict[str, Any], timeout: int
 ) -> Dict[str, Any]:
-    url = base_url.rstrip("/") + "/api/chat"
-    resp = requests.post(url, json=payload, timeout=timeout)
-    resp.raise_for_status()
-    return resp.json()
+    return transport.post_json(base_url, "/api/chat", payload, timeout)
 
 
-def request_plan(
+# Usage / timing fields Ollama reports on the final response (durations in ns).
+METRIC_KEYS = (
+    "prompt_eval_count",
+    "prompt_eval_duration",
+    "eval_count",
+    "eval_duration",
+    "load_duration",
+    "total_duration",
+)
+
+
+def _collect_metrics(data: Any, stats: Optional[Dict[str, Any]]) -> None:
+    if stats is None or not isinstance(data, dict):
+        return
+    for key in METRIC_KEYS:
+        if key in data:
+            stats[key] = data[key]
+
+
+def _record_metrics(metrics: Dict[str, Any], span_args: Dict[str, Any]) -> None:
+    """Attach a request's metrics to its timing span and the run's totals."""
+    span_args.update((k, v) for k, v in metrics.items() if k.endswith("_count") or k == "first_token_ms")
+    if "first_token_ms" in metrics:
+        timing.first_token(metrics["first_token_ms"])
+    timing.model_metrics(metrics)
+
+
+_BARE_START = set("-0123456789tfn")
+_BARE_CHARS = set("+-.0123456789eEtrufalsn")
+
+
+class PartialJSONParser:
+    """
+    Incremental scanner for a single JSON object arriving in pieces.
+
+    Every finished scalar is reported through `on_value(path, value)`, where
+    `path` holds the object keys / list indices leading to it, so callers can
+    act on e.g. ("commands", 0) before the rest of the reply is generated.
+    `complete` flips once the top-level object closes; `error` is set as soon
+    as the text seen so far can no longer be the prefix of a valid object.
+    """
+
+    def __init__(self, on_value: Optional[PartialCallback] = None) -> None:
+        self.on_value = on_value
+        self.complete = False
+        self.error: Optional[str] = None
+        self._text = ""
+        self._end = 0
+        # Frames are [kind, key_or_index, state] for each open container.
+        self._stack: List[List[Any]] = []
+        self._in_string = False
+        self._escape = False
+        self._token_start = -1
+        self._bare_start = -1
+
+    @property
+    def text(self) -> str:
+        """Text consumed so far, trimmed to the object once it is complete."""
+        return self._text[: self._end] if self.complete else self._text
+
+    def feed(self, chunk: str) -> None:
+        if self.complete or self.error or not chunk:
+            return
+        start = len(self._text)
+        self._text += chunk
+        for i in range(start, len(self._text)):
+            self._step(i, self._text[i])
+            if self.complete or self.error:
+                return
+
+    def _fail(self, msg: str) -> None:
+        self.error = msg
+
+    def _path(self) -> Tuple[Any, ...]:
+        return tuple(frame[1] for frame in self._stack)
+
+    def _emit(self, value: Any) -> None:
+        if self.on_value is not None:
+            self.on_value(self._path(), value)
+
+    def _step(self, i: int, ch: str) -> None:
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif ch == "\\":
+                self._escape = True
+            elif ch == '"':
+                self._in_string = False
+                self._end_string(self._text[self._token_start : i + 1])
+            elif ch < " ":
+                self._fail("control character inside string")
+            return
+
+        if self._bare_start >= 0:
+            if ch in _BARE_CHARS:
+                return
+            if not self._end_bare(self._text[self._bare_start : i]):
+                return
+
+        if ch.isspace():
+            return
+
+        if not self._stack:
+            if ch != "{":
+                self._fail(f"expected '{{' but got {ch!r}")
+                return
+            self._stack.append(["{", None, "first_key"])
+            return
+
+        frame = self._stack[-1]
+        kind, state = frame[0], frame[2]
+
+        if state in ("value", "first_value"):
+            if ch == '"':
+                self._in_string = True
+                self._token_start = i
+            elif ch in "{[":
+                frame[2] = "comma"
+                if ch == "{":
+                    self._stack.append(["{", None, "first_key"])
+                else:
+                    self._stack.append(["[", 0, "first_value"])
+            elif ch in _BARE_START:
+                self._bare_start = i
+            elif ch == "]" and state == "first_value":
+                self._close(i)
+            else:
+                self._fail(f"unexpected {ch!r} where a value was expected")
+        elif state in ("key", "first_key"):
+            if ch == '"':
+                self._in_string = True
+                self._token_start = i
+            elif ch == "}" and state == "first_key":
+                self._close(i)
+            else:
+                self._fail(f"unexpected {ch!r} where a key was expected")
+        elif state == "colon":
+            if ch == ":":
+                frame[2] = "value"
+            else:
+                self._fail(f"expected ':' but got {ch!r}")
+        elif state == "comma":
+            if ch == ",":
+                if kind == "{":
+                    frame[2] = "key"
+                else:
+                    frame[1] += 1
+                    frame[2] = "value"
+            elif (ch == "}" and kind == "{") or (ch == "]" and kind == "["):
+                self._close(i)
+            else:
+                self._fail(f"unexpected {ch!r} after value")
+
+    def _end_string(self, raw: str) -> None:
+        try:
+            value = json.loads(raw)
+        except json.JSONDecodeError as e:
+            self._fail(f"invalid string literal: {e}")
+            return
+        frame = self._stack[-1]
+        if frame[0] == "{" and frame[2] in ("key", "first_key"):
+            frame[1] = value
+            frame[2] = "colon"
+            return
+        self._emit(value)
+        frame[2] = "comma"
+
+    def _end_bare(self, raw: str) -> bool:
+        self._bare_start = -1
+        try:
+            value = json.loads(raw)
+        except json.JSONDecodeError:
+            self._fail(f"invalid literal {raw!r}")
+            return False
+        self._emit(value)
+        self._stack[-1][2] = "comma"
+        return True
+
+    def _close(self, i: int) -> None:
+        self._stack.pop()
+        if not self._stack:
+            self.complete = True
+            self._end = i + 1
+
+
+class _Cancelled(Exception):
+    """Raised inside a hedged sample once another sample has won."""
+
+
+class _ChatStream:
+    """
+    Reads a streamed /api/chat reply one NDJSON line at a time, for the
+    blocking and the asyncio clients alike. Every finished value goes to
+    `on_partial`; ReplyError is raised as soon as the reply can no longer be
+    valid JSON. Model metrics and `first_token_ms` (time to the first
+    content) go to `stats` if given.
+    """
+
+    def __init__(self, on_partial: Optional[PartialCallback], stats: Optional[Dict[str, Any]]) -> None:
+        self.parser = PartialJSONParser(on_partial)
+        self.stats = stats
+        self.finished = False  # the final chunk (with the metrics) was seen
+        self._start = time.perf_counter()
+
+    @property
+    def text(self) -> str:
+        return self.parser.text
+
+    @property
+    def wants_metrics(self) -> bool:
+        """Whether the object is complete but the final chunk not yet read."""
+        return self.parser.complete and not self.finished and self.stats is not None
+
+    def feed(self, line: bytes) -> bool:
+        """Handle one line; True once the reply is complete."""
+        if not line.strip():
+            return False
+        chunk = json.loads(line)
+        if isinstance(chunk, dict) and chunk.get("error"):
+            raise ValueError(f"Ollama error: {chunk['error']}")
+        _collect_metrics(chunk, self.stats)
+        content = _extract_content(chunk)
+        if content and self.stats is not None and "first_token_ms" not in self.stats:
+            self.stats["first_token_ms"] = round((time.perf_counter() - self._start) * 1000, 1)
+        self.parser.feed(content)
+        if self.parser.error:
+            raise ReplyError(
+                f"Streamed JSON is invalid: {self.parser.error}\nRaw content:\n{self.parser.text}",
+                self.parser.text,
+            )
+        if chunk.get("done"):
+            self.finished = True
+            return True
+        return self.parser.complete
+
+    def drain(self, line: bytes) -> bool:
+        """
+        Handle a line read after the object completed, looking for the final
+        chunk with Ollama's metrics; True when there is no point reading on.
+        """
+        try:
+            chunk = json.loads(line)
+        except ValueError:
+            return True
+        if isinstance(chunk, dict) and chunk.get("done"):
+            _collect_metrics(chunk, self.stats)
+            self.finished = True
+            return True
+        return False
+
+
+def _stream_ollama(
     base_url: str,
-    model: str,
-    user_goal: str,
-    temperature: float = 0.2,
-    timeout: int = 120,
-) -> Plan:
-    payload = {
-        "model": model,
-        "messages": [
-            {"role": "system", "content": AGENT_SYSTEM_PROMPT},
-            {"role": "user", "content": user_goal},
-        ],
-        "format": "json",  # ask for valid JSON
-        "stream": False,
-        "options": {"temperature": temperature},
-    }
-    data = _post_ollama(base_url, payload, timeout)
+    payload: Dict[str, Any],
+    timeout: int,
+    on_partial: Optional[PartialCallback] = None,
+    stats: Optional[Dict[str, Any]] = None,
+    cancel: Optional[threading.Event] = None,
+) -> str:
+    """
+    Stream /api/chat through a _ChatStream and return the JSON text. Stops
+    reading as soon as the object is complete; model metrics reach `stats`
+    if the final chunk follows within METRICS_GRACE_CHUNKS.
+    Setting `cancel` aborts the request at the next chunk (_Cancelled).
+    """
+    stream = _ChatStream(on_partial, stats)
+    with transport.post_stream(base_url, "/api/chat", dict(payload, stream=True), timeout) as lines:
+        for line in lines:
+            if cancel is not None and cancel.is_set():
+                raise _Cancelled()
+            if stream.feed(line):
+                if stream.wants_metrics:
+                    _drain_metrics(lines, stream)
+                break
+    return stream.text
+
+
+# After a complete object, read at most this many more chunks looking for the
+# final one with Ollama's metrics. A schema-constrained reply ends right
+# away; a model padding with whitespace tokens is cut off.
+METRICS_GRACE_CHUNKS = 3
+
+
+def _drain_metrics(lines: Iterator[bytes], stream: _ChatStream) -> None:
+    for _, line in zip(range(METRICS_GRACE_CHUNKS), lines):
+        if stream.drain(line):
+            if stream.finished:
+                next(lines, None)  # the end of the reply, so the connection can be reused
+            return
+
 
+def _extract_content(data: Any) -> str:
     content = ""
     if isinstance(data, dict):
         msg = data.get("message") or {}
@@ -155,38 +549,270 @@ def request_plan(
             content = msg.get("content", "") or ""
         if not content and "content" in data:
             content = str(data["content"])
+    return content
 
+
+def _complete(
+    base_url: str,
+    payload: Dict[str, Any],
+    timeout: int,
+    on_partial: Optional[PartialCallback] = None,
+    stats: Optional[Dict[str, Any]] = None,
+) -> str:
+    """
+    One /api/chat round trip, streamed through `on_partial` if given.
+    Recorded as a "model" timing span together with Ollama's metrics, which
+    also go to `stats` if given.
+    """
+    metrics: Dict[str, Any] = {}
+    with timing.span("model", streamed=on_partial is not None) as span_args:
+        if on_partial is not None:
+            content = _stream_ollama(base_url, payload, timeout, on_partial, metrics)
+        else:
+            data = _post_ollama(base_url, payload, timeout)
+            _collect_metrics(data, metrics)
+            content = _extract_content(data)
+        _record_metrics(metrics, span_args)
+    if stats is not None:
+        stats.update(metrics)
+    return _reply_content(content)
+
+
+def _reply_content(content: str) -> str:
     if not content:
         raise ValueError("Ollama response missing message content")
+    return _strip_code_fences(content)
+
+
+def request_embeddings(
+    base_url: str,
+    model: str,
+    inputs: List[str],
+    timeout: int = 120,
+    keep_alive: Optional[str] = None,
+) -> List[List[float]]:
+    """Embed several texts with one multi-input /api/embed call."""
+    payload: Dict[str, Any] = {"model": model, "input": list(inputs)}
+    if keep_alive is not None:
+        payload["keep_alive"] = keep_alive
+    embeddings = transport.post_json(base_url, "/api/embed", payload, timeout).get("embeddings")
+    if not isinstance(embeddings, list) or len(embeddings) != len(inputs):
+        raise ValueError("Ollama embed response has the wrong number of embeddings")
+    return embeddings
+
 
-    content = _strip_code_fences(content)
+T = TypeVar("T")
+
+
+def system_prompt(prompt: str, environment: Optional[str] = None) -> str:
+    """`prompt` with the environment fingerprint (if any) appended."""
+    return f"{prompt}\n\n{environment}" if environment else prompt
+
+
+def _examples_message(examples: str) -> Dict[str, str]:
+    return {
+        "role": "system",
+        "content": "Commands that achieved similar goals on this machine before "
+        f"(adapt them, do not copy blindly):\n{examples}",
+    }
+
+
+def _parse_reply(content: str, cls: Any, what: str) -> Any:
     try:
         obj = json.loads(content)
     except json.JSONDecodeError as e:
-        raise ValueError(
-            f"Failed to parse plan JSON: {e}\nRaw content:\n{content}"
+        raise ReplyError(
+            f"Failed to parse {what} JSON: {e}\nRaw content:\n{content}", content
         ) from e
+    try:
+        return cls.from_obj(obj)
+    except ValueError as e:
+        raise ReplyError(f"{e}\nRaw content:\n{content}", content) from e
+
+
+def _repair_payload(payload: Dict[str, Any], error: ReplyError) -> Dict[str, Any]:
+    problem = str(error).split("\nRaw content:", 1)[0]
+    messages = list(payload["messages"]) + [
+        {"role": "assistant", "content": error.content},
+        {
+            "role": "user",
+            "content": f"That reply was invalid: {problem}. "
+            "Reply again with only the corrected JSON object.",
+        },
+    ]
+    options = dict(payload.get("options") or {}, temperature=0)
+    return dict(payload, messages=messages, options=options)
 
-    return Plan.from_obj(obj)
 
+def _hedge_payload(payload: Dict[str, Any], i: int) -> Dict[str, Any]:
+    """Sample `i` of a hedged request, at a temperature spread out from the base one."""
+    base_temp = float((payload.get("options") or {}).get("temperature", DEFAULT_TEMPERATURE))
+    return dict(payload, options=dict(payload.get("options") or {}, temperature=min(1.0, base_temp + 0.3 * i)))
 
-def request_next_action(
+
+def _repair(
+    base_url: str,
+    payload: Dict[str, Any],
+    error: ReplyError,
+    parse: Callable[[str], T],
+    timeout: int,
+    stats: Optional[Dict[str, Any]],
+) -> T:
+    """
+    One cheap follow-up turn: show the model its invalid reply and the
+    validation error, ask for the corrected object only. Raises the original
+    error if the second reply is no better.
+    """
+    try:
+        with timing.span("repair"):
+            content = _complete(base_url, _repair_payload(payload, error), timeout, stats=stats)
+            with timing.span("parse"):
+                return parse(content)
+    except ReplyError:
+        raise error from None
+
+
+def _hedged(
+    base_url: str,
+    payload: Dict[str, Any],
+    parse: Callable[[str], T],
+    accept: Callable[[T], bool],
+    samples: int,
+    timeout: int,
+    stats: Optional[Dict[str, Any]],
+) -> T:
+    """
+    Fire `samples` streamed requests at spread-out temperatures and return
+    the first reply that validates and passes `accept`; the rest are
+    cancelled. If all replies are valid but none is accepted, the first valid
+    one is returned so the caller's own checks decide; if none is valid, one
+    repair round-trip is tried on the first failure.
+    """
+    from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+    cancel = threading.Event()
+
+    def sample(i: int) -> Tuple[T, Dict[str, Any]]:
+        sample_stats: Dict[str, Any] = {}
+        sample_payload = _hedge_payload(payload, i)
+        with timing.span("model", sample=i, temperature=sample_payload["options"]["temperature"]) as span_args:
+            content = _stream_ollama(base_url, sample_payload, timeout, None, sample_stats, cancel)
+            _record_metrics(sample_stats, span_args)
+        with timing.span("parse", sample=i):
+            return parse(_strip_code_fences(content)), sample_stats
+
+    pool = ThreadPoolExecutor(max_workers=samples, thread_name_prefix="gerg-hedge")
+    # Each sample runs in a copy of our context so its spans nest under ours
+    pending = {pool.submit(contextvars.copy_context().run, sample, i) for i in range(samples)}
+    fallback: Optional[Tuple[T, Dict[str, Any]]] = None
+    first_error: Optional[BaseException] = None
+    try:
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                try:
+                    result = fut.result()
+                except Exception as e:  # invalid reply or transport error
+                    first_error = first_error or e
+                    continue
+                if accept(result[0]):
+                    if stats is not None:
+                        stats.update(result[1])
+                    return result[0]
+                fallback = fallback or result
+    finally:
+        cancel.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    if fallback is not None:
+        if stats is not None:
+            stats.update(fallback[1])
+        return fallback[0]
+    if isinstance(first_error, ReplyError):
+        return _repair(base_url, payload, first_error, parse, timeout, stats)
+    assert first_error is not None
+    raise first_error
+
+
+def _request_structured(
     base_url: str,
+    request: _Request,
+    timeout: int,
+    on_partial: Optional[PartialCallback],
+    stats: Optional[Dict[str, Any]],
+    hedge: int,
+) -> Any:
+    if hedge > 1:
+        with timing.span("hedge", samples=hedge):
+            return _hedged(base_url, request.payload, request.parse, request.accept, hedge, timeout, stats)
+    try:
+        content = _complete(base_url, request.payload, timeout, on_partial, stats)
+        with timing.span("parse"):
+            return request.parse(content)
+    except ReplyError as e:
+        return _repair(base_url, request.payload, e, request.parse, timeout, stats)
+
+
+@dataclass
+class _Request:
+    """
+    A structured request as both the blocking and the asyncio clients send
+    it: the /api/chat payload, the reply parser and the check hedged
+    samples must pass.
+    """
+    payload: Dict[str, Any]
+    parse: Callable[[str], Any]
+    accept: Callable[[Any], bool]
+
+
+def _chat_payload(
+    model: str, messages: List[Dict[str, str]], schema: Dict[str, Any], temperature: float, keep_alive: Optional[str]
+) -> Dict[str, Any]:
+    payload = {
+        "model": model,
+        "messages": messages,
+        "format": schema,  # ask for valid JSON of this shape
+        "stream": False,
+        "options": {"temperature": temperature},
+    }
+    if keep_alive is not None:
+        payload["keep_alive"] = keep_alive
+    return payload
+
+
+def _plan_request(
     model: str,
     user_goal: str,
+    temperature: float = DEFAULT_TEMPERATURE,
+    keep_alive: Optional[str] = None,
+    examples: Optional[str] = None,
+    environment: Optional[str] = None,
+) -> _Request:
+    messages = [{"role": "system", "content": system_prompt(AGENT_SYSTEM_PROMPT, environment)}]
+    if examples:
+        messages.append(_examples_message(examples))
+    messages.append({"role": "user", "content": user_goal})
+    return _Request(
+        _chat_payload(model, messages, PLAN_SCHEMA, temperature, keep_alive),
+        lambda content: _parse_reply(content, Plan, "plan"),
+        lambda plan: not any(is_risky(c) for c in plan.commands),
+    )
+
+
+def _next_action_request(
+    model: str,
     conversation: List[Dict[str, str]],
     rag_context: Optional[str] = None,
-    temperature: float = 0.2,
-    timeout: int = 120,
-) -> NextAction:
-    """
-    Ask for the next single action. `conversation` should be a list of messages like:
-      [{"role":"user","content": "<goal>"}, {"role":"assistant","content":"<prev command/explanation>"}, {"role":"user","content":"OBSERVATION: <stdout/stderr>"} ...]
-    Optionally include `rag_context` (short text) to help reasoning.
-    """
+    temperature: float = DEFAULT_TEMPERATURE,
+    keep_alive: Optional[str] = None,
+    examples: Optional[str] = None,
+    environment: Optional[str] = None,
+) -> _Request:
     messages: List[Dict[str, str]] = [
-        {"role": "system", "content": THINK_SYSTEM_PROMPT}
+        {"role": "system", "content": system_prompt(THINK_SYSTEM_PROMPT, environment)}
     ]
+    if examples:
+        messages.append(_examples_message(examples))
     if rag_context:
         messages.append(
             {
@@ -195,34 +821,66 @@ def request_next_action(
             }
         )
     messages.extend(conversation)
+    return _Request(
+        _chat_payload(model, messages, NEXT_ACTION_SCHEMA, temperature, keep_alive),
+        lambda content: _parse_reply(content, NextAction, "next-action"),
+        lambda action: not is_risky(action.command),
+    )
 
-    payload = {
-        "model": model,
-        "messages": messages,
-        "format": "json",
-        "stream": False,
-        "options": {"temperature": temperature},
-    }
 
-    data = _post_ollama(base_url, payload, timeout)
-
-    content = ""
-    if isinstance(data, dict):
-        msg = data.get("message") or {}
-        if isinstance(msg, dict):
-            content = msg.get("content", "") or ""
-        if not content and "content" in data:
-            content = str(data["content"])
-
-    if not content:
-        raise ValueError("Ollama response missing message content")
+def request_plan(
+    base_url: str,
+    model: str,
+    user_goal: str,
+    temperature: float = DEFAULT_TEMPERATURE,
+    timeout: int = 120,
+    on_partial: Optional[PartialCallback] = None,
+    keep_alive: Optional[str] = None,
+    stats: Optional[Dict[str, Any]] = None,
+    hedge: int = 1,
+    examples: Optional[str] = None,
+    environment: Optional[str] = None,
+) -> Plan:
+    """
+    Ask for a whole plan. Pass `on_partial` to stream the reply and be told
+    about the explanation and each finished command as soon as they arrive.
+    `keep_alive` (e.g. "30m") tells Ollama how long to keep the model loaded.
+    If `stats` is given it receives the model metrics (see METRIC_KEYS).
+
+    The reply is constrained by PLAN_SCHEMA; an invalid one gets a single
+    repair round-trip before ValueError is raised. With `hedge` > 1 that many
+    samples race and the first valid plan without risky commands wins
+    (streaming callbacks are not used then). `examples` (see
+    examples.format_examples) is sent as a system message after the prompt.
+    `environment` (see environment.fingerprint) is appended to the prompt.
+    gerg.aio.request_plan is the asyncio version.
+    """
+    request = _plan_request(model, user_goal, temperature, keep_alive, examples, environment)
+    return _request_structured(base_url, request, timeout, on_partial, stats, hedge)
 
-    content = _strip_code_fences(content)
-    try:
-        obj = json.loads(content)
-    except json.JSONDecodeError as e:
-        raise ValueError(
-            f"Failed to parse next-action JSON: {e}\nRaw content:\n{content}"
-        ) from e
 
-    return NextAction.from_obj(obj)
+def request_next_action(
+    base_url: str,
+    model: str,
+    user_goal: str,
+    conversation: List[Dict[str, str]],
+    rag_context: Optional[str] = None,
+    temperature: float = DEFAULT_TEMPERATURE,
+    timeout: int = 120,
+    on_partial: Optional[PartialCallback] = None,
+    keep_alive: Optional[str] = None,
+    stats: Optional[Dict[str, Any]] = None,
+    hedge: int = 1,
+    examples: Optional[str] = None,
+    environment: Optional[str] = None,
+) -> NextAction:
+    """
+    Ask for the next single action. `conversation` should be a list of messages like:
+      [{"role":"user","content": "<goal>"}, {"role":"assistant","content":"<prev command/explanation>"}, {"role":"user","content":"OBSERVATION: <stdout/stderr>"} ...]
+    Optionally include `rag_context` (short text) to help reasoning, and
+    `on_partial` to stream the reply. Validation, repair, `hedge`,
+    `examples` and `environment` work as in request_plan.
+    gerg.aio.request_next_action is the asyncio version.
+    """
+    request = _next_action_request(model, conversation, rag_context, temperature, keep_alive, examples, environment)
+    return _request_structured(base_url, request, timeout, on_partial, stats, hedge)
@@ -0,0 +1,693 @@
+"""
+asyncio API for embedding gerg in services: request_plan,
+request_next_action and a think() loop with pluggable command execution and
+confirmation.
+
+Requests go over a small non-blocking HTTP/1.1 client, so one event loop
+can serve many users, and cancelling the task that awaits a request closes
+its connection, which makes Ollama stop generating. Prompts, validation,
+repair and hedging are shared with gerg.agent, whose blocking functions
+take the same arguments.
+"""
+from __future__ import annotations
+import asyncio
+import codecs
+import inspect
+import json
+import os
+import signal
+import subprocess
+import time
+import weakref
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar, Union
+
+from . import timing, transport
+from .agent import (
+    DEFAULT_TEMPERATURE,
+    METRICS_GRACE_CHUNKS,
+    THINK_SYSTEM_PROMPT,
+    NextAction,
+    PartialCallback,
+    Plan,
+    ReplyError,
+    _ChatStream,
+    _collect_metrics,
+    _extract_content,
+    _hedge_payload,
+    _next_action_request,
+    _plan_request,
+    _record_metrics,
+    _repair_payload,
+    _reply_content,
+    _Request,
+    _strip_code_fences,
+    system_prompt,
+)
+from .compress import Compressor, apply_results, compress
+from .conversation import ConversationManager, Result, estimate_tokens, probe_results, step_record
+from .executor import KILLED_EXIT_CODE, OutputBuffer, change_directory, kill_note
+from .safety import is_risky, probe_refusals
+
+T = TypeVar("T")
+
+_Key = Tuple[str, str, int]
+_Stream = Tuple[asyncio.StreamReader, asyncio.StreamWriter]
+
+
+async def _wait(aw: Awaitable[T], timeout: Optional[float]) -> T:
+    """await `aw`, raising the builtin TimeoutError (an OSError, like a socket timeout)."""
+    try:
+        return await asyncio.wait_for(aw, timeout)
+    except asyncio.TimeoutError:
+        raise TimeoutError(f"no answer from Ollama within {timeout:g}s") from None
+
+
+# ---- HTTP ----
+
+# Idle keep-alive connections per event loop and (scheme, host, port).
+_IDLE: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[_Key, List[_Stream]]]" = weakref.WeakKeyDictionary()
+
+
+def _idle(key: _Key) -> List[_Stream]:
+    return _IDLE.setdefault(asyncio.get_running_loop(), {}).setdefault(key, [])
+
+
+def close_idle() -> None:
+    """Close the running loop's idle keep-alive connections (e.g. before the loop shuts down)."""
+    for idle in _IDLE.pop(asyncio.get_running_loop(), {}).values():
+        for _, writer in idle:
+            writer.close()
+
+
+class _Response:
+    """
+    A response whose head has arrived. The body is read with read() or
+    readline() (which undo chunked transfer encoding); release() returns
+    the connection to the idle pool if the body was read to its end.
+    """
+
+    def __init__(self, key: _Key, stream: _Stream, timeout: float) -> None:
+        self.key = key
+        self.reader, self.writer = stream
+        self.timeout = timeout
+        self.status = 0
+        self.reason = ""
+        self.headers: Dict[str, str] = {}
+        self.will_close = False
+        self.complete = False  # the body was read to its end
+        self._chunked = False
+        self._remaining: Optional[int] = None
+        self._buffer = b""
+
+    async def read_head(self) -> None:
+        status_line = await _wait(self.reader.readline(), self.timeout)
+        if not status_line:
+            raise ConnectionResetError("connection closed before the response")
+        version, _, rest = status_line.decode("latin-1").strip().partition(" ")
+        status, _, self.reason = rest.partition(" ")
+        self.status = int(status)
+        while True:
+            line = await _wait(self.reader.readline(), self.timeout)
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            self.headers[name.strip().lower()] = value.strip()
+        self.will_close = version == "HTTP/1.0" or self.headers.get("connection", "").lower() == "close"
+        self._chunked = self.headers.get("transfer-encoding", "").lower() == "chunked"
+        if not self._chunked and "content-length" in self.headers:
+            self._remaining = int(self.headers["content-length"])
+
+    async def _chunk(self) -> bytes:
+        """The next piece of the body; b"" at its end."""
+        if self.complete:
+            return b""
+        if self._chunked:
+            size_line = await _wait(self.reader.readline(), self.timeout)
+            if not size_line:
+                raise ConnectionResetError("connection closed in the middle of the reply")
+            size = int(size_line.split(b";", 1)[0].strip(), 16)
+            if size == 0:
+                while await _wait(self.reader.readline(), self.timeout) not in (b"\r\n", b"\n", b""):
+                    pass  # trailers
+                self.complete = True
+                return b""
+            return (await _wait(self.reader.readexactly(size + 2), self.timeout))[:-2]
+        if self._remaining == 0:
+            self.complete = True
+            return b""
+        data = await _wait(self.reader.read(min(self._remaining or 65536, 65536)), self.timeout)
+        if self._remaining is None:
+            if not data:  # the body ends with the connection
+                self.complete = self.will_close = True
+            return data
+        if not data:
+            raise ConnectionResetError("connection closed in the middle of the reply")
+        self._remaining -= len(data)
+        return data
+
+    async def read(self) -> bytes:
+        parts = [self._buffer]
+        self._buffer = b""
+        while True:
+            data = await self._chunk()
+            if not data:
+                return b"".join(parts)
+            parts.append(data)
+
+    async def readline(self) -> bytes:
+        """The next line of the body including its newline; b"" at the end."""
+        while b"\n" not in self._buffer:
+            data = await self._chunk()
+            if not data:
+                line, self._buffer = self._buffer, b""
+                return line
+            self._buffer += data
+        line, _, self._buffer = self._buffer.partition(b"\n")
+        return line + b"\n"
+
+    def release(self) -> None:
+        if self.complete and not self.will_close and not self._buffer:
+            _idle(self.key).append((self.reader, self.writer))
+        else:
+            self.close()
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+async def _open(url: str, method: str, path: str, body: Optional[bytes], timeout: float) -> _Response:
+    key, target = transport._split(url, path)
+    scheme, host, port = key
+    head = f"{method} {target} HTTP/1.1\r\nHost: {host}:{port}\r\nAccept: application/json\r\n"
+    if body is not None:
+        head += f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+    request = (head + "\r\n").encode("latin-1") + (body or b"")
+    idle = _idle(key)
+    while True:
+        reused = False
+        while idle and not reused:
+            reader, writer = idle.pop()
+            reused = not (reader.at_eof() or writer.is_closing())
+            if not reused:
+                writer.close()
+        if not reused:
+            reader, writer = await _wait(
+                asyncio.open_connection(host, port, ssl=True if scheme == "https" else None), timeout
+            )
+        resp = _Response(key, (reader, writer), timeout)
+        try:
+            writer.write(request)
+            await _wait(writer.drain(), timeout)
+            await resp.read_head()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            writer.close()
+            if reused:
+                continue  # the server dropped an idle keep-alive connection; retry fresh
+            raise
+        except BaseException:
+            writer.close()
+            raise
+        if resp.status >= 400:
+            try:
+                message = transport._error_text((await resp.read())[:4096], resp.reason)
+            finally:
+                writer.close()
+            raise transport.HTTPError(resp.status, message)
+        return resp
+
+
+async def _send(base_url: str, path: str, payload: Any, timeout: float) -> Tuple[_Response, Callable[[], None]]:
+    """
+    Open the request on one of the hosts of `base_url`, balanced and failed
+    over like transport._send (sharing its per-host state), and return the
+    response and a callback to run once the reply has been consumed.
+    """
+    body = json.dumps(payload).encode("utf-8")
+    urls = transport.endpoints(base_url)
+    if len(urls) == 1:
+        return await _open(urls[0], "POST", path, body, timeout), lambda: None
+    balancer = transport._balancer(base_url, urls)
+    tried: List[transport._Endpoint] = []
+    for _ in urls:
+        ep = balancer.acquire(tried)
+        start = time.monotonic()
+        try:
+            resp = await _open(ep.url, "POST", path, body, timeout)
+        except BaseException as e:
+            balancer.release(ep)
+            if not isinstance(e, Exception) or not transport._try_elsewhere(e):
+                raise
+            if transport._host_failed(e):
+                balancer.failed(ep)
+            tried.append(ep)
+            error = e
+            continue
+        balancer.succeeded(ep, time.monotonic() - start)
+        return resp, lambda: balancer.release(ep)
+    raise error
+
+
+async def post_json(base_url: str, path: str, payload: Any, timeout: float = 120) -> Any:
+    """POST `payload` as JSON to base_url + path and return the decoded reply."""
+    resp, done = await _send(base_url, path, payload, timeout)
+    try:
+        data = await resp.read()
+    except BaseException:
+        resp.close()
+        raise
+    finally:
+        done()
+    resp.release()
+    return json.loads(data)
+
+
+@asynccontextmanager
+async def post_stream(base_url: str, path: str, payload: Any, timeout: float = 120) -> AsyncIterator[_Response]:
+    """
+    POST `payload` and yield the response, to be read with readline().
+    Leaving the block early (or being cancelled) closes the connection,
+    which is how a generation is abandoned; a fully read reply keeps it for
+    reuse.
+    """
+    resp, done = await _send(base_url, path, payload, timeout)
+    try:
+        yield resp
+    except BaseException:
+        resp.close()
+        raise
+    finally:
+        done()
+    resp.release()
+
+
+# ---- Model requests ----
+
+async def _stream_ollama(
+    base_url: str,
+    payload: Dict[str, Any],
+    timeout: int,
+    on_partial: Optional[PartialCallback] = None,
+    stats: Optional[Dict[str, Any]] = None,
+) -> str:
+    """agent._stream_ollama for asyncio; cancel the awaiting task to abort."""
+    stream = _ChatStream(on_partial, stats)
+    async with post_stream(base_url, "/api/chat", dict(payload, stream=True), timeout) as resp:
+        while True:
+            line = await resp.readline()
+            if not line:
+                break
+            if stream.feed(line):
+                await _drain_metrics(resp, stream)
+                break
+    return stream.text
+
+
+async def _drain_metrics(resp: _Response, stream: _ChatStream) -> None:
+    if stream.wants_metrics:
+        for _ in range(METRICS_GRACE_CHUNKS):
+            line = await resp.readline()
+            if not line or stream.drain(line):
+                break
+    if stream.finished:
+        await resp.readline()  # the end of the reply, so the connection can be reused
+
+
+async def _complete(
+    base_url: str,
+    payload: Dict[str, Any],
+    timeout: int,
+    on_partial: Optional[PartialCallback] = None,
+    stats: Optional[Dict[str, Any]] = None,
+) -> str:
+    """agent._complete for asyncio: one /api/chat round trip, recorded as a "model" span."""
+    metrics: Dict[str, Any] = {}
+    with timing.span("model", streamed=on_partial is not None) as span_args:
+        if on_partial is not None:
+            content = await _stream_ollama(base_url, payload, timeout, on_partial, metrics)
+        else:
+            data = await post_json(base_url, "/api/chat", payload, timeout)
+            _collect_metrics(data, metrics)
+            content = _extract_content(data)
+        _record_metrics(metrics, span_args)
+    if stats is not None:
+        stats.update(metrics)
+    return _reply_content(content)
+
+
+async def _repair(
+    base_url: str,
+    payload: Dict[str, Any],
+    error: ReplyError,
+    parse: Callable[[str], T],
+    timeout: int,
+    stats: Optional[Dict[str, Any]],
+) -> T:
+    try:
+        with timing.span("repair"):
+            content = await _complete(base_url, _repair_payload(payload, error), timeout, stats=stats)
+            with timing.span("parse"):
+                return parse(content)
+    except ReplyError:
+        raise error from None
+
+
+async def _hedged(
+    base_url: str, request: _Request, samples: int, timeout: int, stats: Optional[Dict[str, Any]]
+) -> Any:
+    """agent._hedged for asyncio; the losing samples are cancelled, which closes their connections."""
+    async def sample(i: int) -> Tuple[Any, Dict[str, Any]]:
+        sample_stats: Dict[str, Any] = {}
+        payload = _hedge_payload(request.payload, i)
+        with timing.span("model", sample=i, temperature=payload["options"]["temperature"]) as span_args:
+            content = await _stream_ollama(base_url, payload, timeout, None, sample_stats)
+            _record_metrics(sample_stats, span_args)
+        with timing.span("parse", sample=i):
+            return request.parse(_strip_code_fences(content)), sample_stats
+
+    pending = {asyncio.ensure_future(sample(i)) for i in range(samples)}
+    fallback: Optional[Tuple[Any, Dict[str, Any]]] = None
+    first_error: Optional[BaseException] = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for fut in done:
+                try:
+                    result = fut.result()
+                except Exception as e:  # invalid reply or transport error
+                    first_error = first_error or e
+                    continue
+                if request.accept(result[0]):
+                    if stats is not None:
+                        stats.update(result[1])
+                    return result[0]
+                fallback = fallback or result
+    finally:
+        for fut in pending:
+            fut.cancel()
+        if pending:
+            await asyncio.wait(pending)
+
+    if fallback is not None:
+        if stats is not None:
+            stats.update(fallback[1])
+        return fallback[0]
+    if isinstance(first_error, ReplyError):
+        return await _repair(base_url, request.payload, first_error, request.parse, timeout, stats)
+    assert first_error is not None
+    raise first_error
+
+
+async def _request_structured(
+    base_url: str,
+    request: _Request,
+    timeout: int,
+    on_partial: Optional[PartialCallback],
+    stats: Optional[Dict[str, Any]],
+    hedge: int,
+) -> Any:
+    if hedge > 1:
+        with timing.span("hedge", samples=hedge):
+            return await _hedged(base_url, request, hedge, timeout, stats)
+    try:
+        content = await _complete(base_url, request.payload, timeout, on_partial, stats)
+        with timing.span("parse"):
+            return request.parse(content)
+    except ReplyError as e:
+        return await _repair(base_url, request.payload, e, request.parse, timeout, stats)
+
+
+async def request_plan(
+    base_url: str,
+    model: str,
+    user_goal: str,
+    temperature: float = DEFAULT_TEMPERATURE,
+    timeout: int = 120,
+    on_partial: Optional[PartialCallback] = None,
+    keep_alive: Optional[str] = None,
+    stats: Optional[Dict[str, Any]] = None,
+    hedge: int = 1,
+    examples: Optional[str] = None,
+    environment: Optional[str] = None,
+) -> Plan:
+    """agent.request_plan for asyncio. Cancelling the awaiting task aborts the request."""
+    request = _plan_request(model, user_goal, temperature, keep_alive, examples, environment)
+    return await _request_structured(base_url, request, timeout, on_partial, stats, hedge)
+
+
+async def request_next_action(
+    base_url: str,
+    model: str,
+    user_goal: str,
+    conversation: List[Dict[str, str]],
+    rag_context: Optional[str] = None,
+    temperature: float = DEFAULT_TEMPERATURE,
+    timeout: int = 120,
+    on_partial: Optional[PartialCallback] = None,
+    keep_alive: Optional[str] = None,
+    stats: Optional[Dict[str, Any]] = None,
+    hedge: int = 1,
+    examples: Optional[str] = None,
+    environment: Optional[str] = None,
+) -> NextAction:
+    """agent.request_next_action for asyncio. Cancelling the awaiting task aborts the request."""
+    request = _next_action_request(model, conversation, rag_context, temperature, keep_alive, examples, environment)
+    return await _request_structured(base_url, request, timeout, on_partial, stats, hedge)
+
+
+# ---- Commands ----
+
+async def _kill(proc: asyncio.subprocess.Process, grace: float = 2.0) -> None:
+    """SIGTERM the command's whole process group, then SIGKILL if it lingers."""
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+        try:
+            os.killpg(proc.pid, sig)
+        except (ProcessLookupError, PermissionError):
+            return
+        try:
+            await asyncio.wait_for(proc.wait(), grace)
+            return
+        except asyncio.TimeoutError:
+            continue
+
+
+async def run_command(
+    cmd: str,
+    cwd: Path,
+    timeout: Optional[float] = None,
+    max_output_bytes: Optional[int] = None,
+    head_chars: int = 1000,
+    tail_chars: int = 3000,
+) -> subprocess.CompletedProcess:
+    """
+    executor.run_streaming for asyncio, without the echo: run `cmd` through
+    the shell in its own process group with stdin closed, keep head/tail
+    OutputBuffers, and kill it past `timeout` seconds or `max_output_bytes`
+    (returncode KILLED_EXIT_CODE and a note at the end of stderr).
+    Cancelling the awaiting task kills the command too.
+    """
+    proc = await asyncio.create_subprocess_shell(
+        cmd,
+        cwd=str(cwd),
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        start_new_session=True,
+    )
+    out_buf, err_buf = OutputBuffer(head_chars, tail_chars), OutputBuffer(head_chars // 2, tail_chars // 2)
+    total = 0
+    timed_out = output_limited = False
+
+    async def pump(stream: asyncio.StreamReader, buf: OutputBuffer) -> None:
+        nonlocal total, output_limited
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        while True:
+            data = await stream.read(65536)
+            if not data:
+                break
+            total += len(data)
+            buf.write(decoder.decode(data))
+            if max_output_bytes is not None and total > max_output_bytes and not output_limited:
+                output_limited = True
+                asyncio.ensure_future(_kill(proc))
+        buf.write(decoder.decode(b"", final=True))
+
+    pumps = asyncio.gather(pump(proc.stdout, out_buf), pump(proc.stderr, err_buf))  # type: ignore[arg-type]
+    try:
+        try:
+            await asyncio.wait_for(proc.wait(), timeout)
+        except asyncio.TimeoutError:
+            timed_out = True
+            await _kill(proc)
+        # Background jobs may keep the pipes open after the shell exits;
+        # give them a moment, then stop waiting for EOF.
+        await asyncio.wait({pumps}, timeout=1.0)
+    finally:
+        if proc.returncode is None:  # cancelled
+            await _kill(proc)
+        pumps.cancel()
+
+    returncode = proc.returncode
+    if timed_out or output_limited:
+        err_buf.write(kill_note(timed_out, timeout, max_output_bytes))
+        returncode = KILLED_EXIT_CODE
+    cp = subprocess.CompletedProcess(
+        args=cmd, returncode=returncode, stdout=out_buf.getvalue(), stderr=err_buf.getvalue()
+    )
+    cp.timed_out = timed_out  # type: ignore[attr-defined]
+    cp.output_limited = output_limited  # type: ignore[attr-defined]
+    return cp
+
+
+# ---- Think loop ----
+
+# execute(command, cwd) runs one command and returns its CompletedProcess
+# (or an awaitable of it). A `new_cwd` attribute on the result moves later
+# steps there, as executor.change_directory does for `cd`.
+Execute = Callable[[str, Path], Union[subprocess.CompletedProcess, Awaitable[subprocess.CompletedProcess]]]
+# confirm(action) says whether action.command may run (bool or an awaitable of it).
+Confirm = Callable[[NextAction], Union[bool, Awaitable[bool]]]
+# on_step(record) is told about every finished step (its return value may be awaitable).
+StepCallback = Callable[[Dict[str, Any]], Any]
+
+
+@dataclass
+class ThinkResult:
+    # "success", "done_with_errors", "blocked_unsafe", "aborted" or "max_steps_reached"
+    status: str
+    cwd: Path
+    # One record per step, as `gerg --think` stores them in history
+    steps: List[Dict[str, Any]] = field(default_factory=list)
+
+
+async def _resolve(value: Union[T, Awaitable[T]]) -> T:
+    return await value if inspect.isawaitable(value) else value  # type: ignore[misc]
+
+
+def _local_executor(timeout: Optional[float], max_output_bytes: Optional[int]) -> Execute:
+    """run_command with cd emulation (executor.change_directory)."""
+    async def execute(command: str, cwd: Path) -> subprocess.CompletedProcess:
+        return change_directory(command, cwd) or await run_command(
+            command, cwd, timeout=timeout, max_output_bytes=max_output_bytes
+        )
+
+    return execute
+
+
+async def _run_probes(execute: Execute, probes: List[str], max_probes: int, cwd: Path) -> List[Result]:
+    """Run a step's read-only probes concurrently, like cli._run_probes (without the report)."""
+    refusals = probe_refusals(probes, max_probes)
+    allowed = [p for p, refusal in zip(probes, refusals) if refusal is None]
+    return probe_results(probes, refusals, await asyncio.gather(*(_resolve(execute(p, cwd)) for p in allowed)))
+
+
+async def think(
+    base_url: str,
+    model: str,
+    goal: str,
+    cwd: Union[str, Path] = ".",
+    execute: Optional[Execute] = None,
+    confirm: Optional[Confirm] = None,
+    auto_confirm: bool = False,
+    on_step: Optional[StepCallback] = None,
+    max_steps: int = 10,
+    allow_unsafe: bool = False,
+    rag_context: Optional[str] = None,
+    examples: Optional[str] = None,
+    environment: Optional[str] = None,
+    compressor: Optional[Compressor] = compress,
+    max_probes: int = 6,
+    token_budget: int = 4000,
+    command_timeout: Optional[float] = 300,
+    max_output_bytes: Optional[int] = 20 * 1024 * 1024,
+    timeout: int = 120,
+    keep_alive: Optional[str] = None,
+    hedge: int = 1,
+) -> ThinkResult:
+    """
+    Drive a `gerg --think` session for `goal`: ask for the next action, run
+    its read-only probes and its command, feed the (compressed) output back,
+    until the model reports done or `max_steps` is reached. A risky command
+    ends the session unless `allow_unsafe`.
+
+    `execute` defaults to run_command (with `command_timeout` and
+    `max_output_bytes`) plus cd emulation. Before the first command, and
+    whenever an action asks for confirmation, `confirm` is consulted; a
+    refusal ends the session as "aborted", and so does having no `confirm`.
+    Pass `auto_confirm=True` to run commands unasked, like
+    `gerg --think --yes`. Read-only probes never need confirmation.
+
+    Cancelling the awaiting task aborts the request or command in flight.
+    """
+    if execute is None:
+        execute = _local_executor(command_timeout, max_output_bytes)
+    cur_cwd = Path(cwd).expanduser().resolve()
+    conversation = ConversationManager(
+        goal,
+        budget=token_budget,
+        fixed_tokens=(
+            estimate_tokens(system_prompt(THINK_SYSTEM_PROMPT, environment))
+            + estimate_tokens(rag_context or "")
+            + estimate_tokens(examples or "")
+        ),
+    )
+    result = ThinkResult("max_steps_reached", cur_cwd)
+    confirmed = False
+
+    for step in range(1, max(1, max_steps) + 1):
+        messages = conversation.messages()
+        stats: Dict[str, Any] = {}
+        nxt = await request_next_action(
+            base_url,
+            model,
+            goal,
+            messages,
+            rag_context=rag_context,
+            timeout=timeout,
+            keep_alive=keep_alive,
+            stats=stats,
+            hedge=hedge,
+            examples=examples,
+            environment=environment,
+        )
+        if is_risky(nxt.command) and not allow_unsafe:
+            result.status = "blocked_unsafe"
+            return result
+
+        results: List[Result] = []
+        if nxt.probes and max_probes > 0:
+            with timing.span("probes", step=step, count=len(nxt.probes)):
+                results = await _run_probes(execute, nxt.probes, max_probes, cur_cwd)
+        will_run = bool(nxt.command) or not results
+        code, out, err = 0, "", ""
+
+        if will_run and not auto_confirm and (nxt.require_confirmation or not confirmed):
+            with timing.span("confirm", step=step):
+                if confirm is None or not await _resolve(confirm(nxt)):
+                    result.status = "aborted"
+                    return result
+            confirmed = True
+
+        if will_run:
+            with timing.span("execute", step=step):
+                cp = await _resolve(execute(nxt.command, cur_cwd))
+            out, err, code = cp.stdout or "", cp.stderr or "", cp.returncode
+            cur_cwd = result.cwd = getattr(cp, "new_cwd", cur_cwd)
+            results.append((nxt.command, code, out, err))
+
+        with timing.span("compress", step=step) as span_args:
+            observed, saved = apply_results(compressor, results)
+            span_args["chars_saved"] = saved
+        conversation.add_results(cur_cwd, observed)
+
+        record = step_record(step, nxt, cur_cwd, results, will_run, stats, saved)
+        result.steps.append(record)
+        if on_step is not None:
+            await _resolve(on_step(record))
+
+        if nxt.done:
+            result.status = "success" if code == 0 else "done_with_errors"
+            return result
+    return result
@@ -0,0 +1,140 @@
+from __future__ import annotations
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from .agent import Plan
+from .safety import is_risky
+
+
+@dataclass
+class BatchGoal:
+    index: int
+    goal: str
+    id: Any = None
+    cwd: Optional[str] = None
+
+
+def read_goals(stream: Iterable[str]) -> Iterator[BatchGoal]:
+    """
+    Parse goals, one per line: a JSON object with "goal" (and optional "id",
+    "cwd"), a JSON string, or plain text. Blank lines and lines starting with
+    '#' are skipped.
+    """
+    index = 0
+    for raw in stream:
+        line = raw.strip()
+        if not line or line.startswith("#"):
+            continue
+        goal: Any = line
+        ident = cwd = None
+        if line[0] in '{"':
+            try:
+                obj = json.loads(line)
+            except json.JSONDecodeError:
+                obj = line
+            if isinstance(obj, dict):
+                goal, ident, cwd = obj.get("goal"), obj.get("id"), obj.get("cwd")
+            elif isinstance(obj, str):
+                goal = obj
+        if not isinstance(goal, str) or not goal.strip():
+            raise ValueError(f"Line {index + 1}: no goal found in {line[:80]!r}")
+        yield BatchGoal(index=index, goal=goal.strip(), id=ident, cwd=cwd)
+        index += 1
+
+
+# Plans one goal; returns the plan and whether it came from the plan cache.
+PlanFn = Callable[[BatchGoal], Tuple[Plan, bool]]
+
+
+def _plan_one(item: BatchGoal, plan_fn: PlanFn) -> Dict[str, Any]:
+    result: Dict[str, Any] = {
+        "index": item.index,
+        "id": item.id,
+        "goal": item.goal,
+        "cwd": item.cwd,
+        "plan": None,
+        "cached": False,
+        "validation_error": None,
+        "error": None,
+        "risky_commands": [],
+        "safe": None,
+    }
+    start = time.perf_counter()
+    try:
+        plan, cached = plan_fn(item)
+    except ValueError as e:
+        # Malformed JSON or a plan that failed Plan.from_obj
+        result["validation_error"] = str(e)
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    else:
+        risky = [c for c in plan.commands if is_risky(c)]
+        result.update(plan=plan.__dict__, cached=cached, risky_commands=risky, safe=not risky)
+    result["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    return result
+
+
+def run_batch(
+    goals: Iterable[BatchGoal],
+    plan_fn: PlanFn,
+    out: TextIO,
+    concurrency: int = 4,
+    on_result: Optional[Callable[[Dict[str, Any]], None]] = None,
+    log: Optional[TextIO] = None,
+) -> Dict[str, Any]:
+    """
+    Plan every goal with at most `concurrency` requests in flight and write
+    one JSON line per goal to `out` as soon as it finishes (completion order;
+    "index" gives the input position). Nothing is executed. Returns and logs
+    a throughput summary.
+    """
+    log = log or sys.stderr
+    lock = threading.Lock()
+    counts = {"total": 0, "ok": 0, "unsafe": 0, "invalid": 0, "errors": 0, "cached": 0}
+    latencies: List[float] = []
+    start = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        futures = [pool.submit(_plan_one, item, plan_fn) for item in goals]
+        for fut in as_completed(futures):
+            result = fut.result()
+            with lock:
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                out.flush()
+                counts["total"] += 1
+                latencies.append(result["latency_ms"])
+                if result["error"]:
+                    counts["errors"] += 1
+                elif result["validation_error"]:
+                    counts["invalid"] += 1
+                elif result["safe"]:
+                    counts["ok"] += 1
+                else:
+                    counts["unsafe"] += 1
+                counts["cached"] += bool(result["cached"])
+                if on_result is not None:
+                    on_result(result)
+
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    summary: Dict[str, Any] = dict(
+        counts,
+        elapsed_s=round(elapsed, 3),
+        goals_per_s=round(counts["total"] / elapsed, 2) if elapsed > 0 else None,
+        p50_ms=latencies[len(latencies) // 2] if latencies else None,
+        p95_ms=latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] if latencies else None,
+    )
+    print(
+        f"Planned {counts['total']} goals in {summary['elapsed_s']}s "
+        f"({summary['goals_per_s']} goals/s, concurrency {concurrency}): "
+        f"{counts['ok']} ok, {counts['unsafe']} unsafe, {counts['invalid']} invalid, "
+        f"{counts['errors']} errors, {counts['cached']} from cache; "
+        f"latency p50 {summary['p50_ms']}ms p95 {summary['p95_ms']}ms",
+        file=log,
+    )
+    return summary
@@ -0,0 +1,96 @@
+from __future__ import annotations
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Optional
+
+from .agent import Plan
+
+
+def plan_cache_key(
+    goal: str,
+    model: str,
+    system_prompt: str,
+    temperature: float,
+    cwd: Path,
+) -> str:
+    """Hash everything that can change the plan the model would return."""
+    material = json.dumps(
+        [goal.strip(), model, system_prompt, temperature, str(cwd)],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class PlanCache:
+    """
+    On-disk cache of validated plans, one small JSON file per key.
+
+    Entries expire `ttl` seconds after they were stored. A hit refreshes the
+    file's mtime, and once more than `max_entries` files exist the least
+    recently used ones are removed, so the directory stays bounded.
+    """
+
+    def __init__(self, root: Path, max_entries: int = 256, ttl: float = 7 * 86400) -> None:
+        self.root = Path(root).expanduser()
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = float(ttl)
+
+    def _path(self, key: str) -> Path:
+        return self.root / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Plan]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            if time.time() - float(entry["created"]) > self.ttl:
+                path.unlink()
+                return None
+            plan = Plan.from_obj(entry["plan"])
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # Corrupt or outdated entry: drop it and act as a miss
+            try:
+                path.unlink()
+            except OSError:
+                pass
+            return None
+        try:
+            os.utime(path)  # mark as recently used
+        except OSError:
+            pass
+        return plan
+
+    def put(self, key: str, plan: Plan) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        entry = {"created": time.time(), "plan": plan.__dict__}
+        path = self._path(key)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp, path)
+        self._prune()
+
+    def _prune(self) -> None:
+        entries = []
+        now = time.time()
+        for p in self.root.glob("*.json"):
+            try:
+                mtime = p.stat().st_mtime
+            except OSError:
+                continue
+            # mtime is bumped on hits, so an entry untouched for longer than the
+            # TTL is certainly expired.
+            if now - mtime > self.ttl:
+                p.unlink(missing_ok=True)
+                continue
+            entries.append((mtime, p))
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort()
+        for _, p in entries[: len(entries) - self.max_entries]:
+            p.unlink(missing_ok=True)
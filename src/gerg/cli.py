@@ -1,15 +1,25 @@
 from __future__ import annotations
 import argparse
+import atexit
 import os
-import subprocess
 import sys
+import threading
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import TYPE_CHECKING, Any, List, Dict, Optional, Tuple
 
+from . import timing
 from .config import load_settings
-from .agent import request_plan, request_next_action
-from .safety import is_risky
-from .utils import write_history_line
+
+# Everything else is imported where it is used: `gerg --help`, argument
+# errors and `gerg history` never load the HTTP client, and a plain plan run
+# never loads the think-mode, RAG, batch or shell machinery.
+if TYPE_CHECKING:
+    import subprocess
+    from .batch import BatchGoal
+    from .cache import PlanCache
+    from .history import HistoryLog
+    from .routing import Router
+    from .shell import ShellSession
 
 ANSI_BOLD = "\033[1m"
 ANSI_DIM = "\033[2m"
@@ -20,47 +30,190 @@ def _print_plan(plan) -> None:
     print(f"{ANSI_BOLD}Plan:{ANSI_RESET} {plan.explanation}")
     for i, cmd in enumerate(plan.commands, 1):
         print(f"  {i:>2}. {cmd}")
+    _print_dependencies(plan)
+
+
+def _print_dependencies(plan) -> None:
+    if not plan.depends_on:
+        return
+    parts = [
+        f"{i} after {', '.join(map(str, deps))}" if deps else f"{i} right away"
+        for i, deps in enumerate(plan.depends_on, 1)
+    ]
+    print(f"{ANSI_DIM}Order: {'; '.join(parts)}{ANSI_RESET}")
+
+
+class _PlanStreamPrinter:
+    """
+    `on_partial` callback for request_plan: prints the explanation and each
+    finished command while the model is still generating the rest.
+    Commands that arrive before the explanation are held back so the output
+    looks the same as _print_plan.
+    """
+
+    def __init__(self) -> None:
+        self.shown = False
+        self._pending: List[str] = []
+        self._explanation = ""
+        self._commands: List[str] = []
+
+    def __call__(self, path, value) -> None:
+        if path == ("explanation",) and isinstance(value, str) and not self.shown:
+            print()
+            print(f"{ANSI_BOLD}Plan:{ANSI_RESET} {value}", flush=True)
+            self.shown = True
+            self._explanation = value
+            self._flush()
+        elif len(path) == 2 and path[0] == "commands" and isinstance(value, str):
+            self._pending.append(value)
+            if self.shown:
+                self._flush()
+
+    def _flush(self) -> None:
+        for cmd in self._pending:
+            self._commands.append(cmd)
+            print(f"  {len(self._commands):>2}. {cmd}", flush=True)
+        self._pending.clear()
+
+    def finish(self, plan) -> None:
+        """
+        Print whatever part of `plan` the stream has not shown yet, or all of
+        it again if what was streamed differs (the reply needed repair).
+        """
+        if not self.shown:
+            print()
+            _print_plan(plan)
+            return
+        count = len(self._commands)
+        if self._explanation != plan.explanation or self._commands != plan.commands[:count]:
+            print(f"\n{ANSI_DIM}That reply was invalid and has been corrected; this is the plan:{ANSI_RESET}")
+            _print_plan(plan)
+            return
+        for i, cmd in enumerate(plan.commands[count:], count + 1):
+            print(f"  {i:>2}. {cmd}")
+        _print_dependencies(plan)
+
+
+class _StepStreamPrinter:
+    """`on_partial` callback for request_next_action in think mode."""
+
+    def __init__(self, step: int) -> None:
+        self.step = step
+        self.explanation_shown: Optional[str] = None
+        self.command_shown: Optional[str] = None
+        self._command: Optional[str] = None
+
+    def __call__(self, path, value) -> None:
+        if not isinstance(value, str):
+            return
+        if path == ("explanation",) and self.explanation_shown is None:
+            self._show_explanation(value)
+            if self._command is not None:
+                self._show_command(self._command)
+        elif path == ("command",) and self.command_shown is None:
+            self._command = value.strip()
+            if self.explanation_shown is not None:
+                self._show_command(self._command)
+
+    def _show_explanation(self, explanation: str) -> None:
+        print(f"\n{ANSI_BOLD}Step {self.step}:{ANSI_RESET} {explanation}", flush=True)
+        self.explanation_shown = explanation
+
+    def _show_command(self, command: str) -> None:
+        if command:  # empty when the step only probes
+            print(f"{ANSI_DIM}Command:{ANSI_RESET} {command}", flush=True)
+        self.command_shown = command
+
+    def finish(self, nxt) -> None:
+        """Show what the stream has not, or the whole step again if the
+        streamed reply differs from `nxt` (it needed repair)."""
+        if self.explanation_shown not in (None, nxt.explanation) or self.command_shown not in (None, nxt.command):
+            print(f"{ANSI_DIM}That reply was invalid and has been corrected:{ANSI_RESET}")
+            self.explanation_shown = self.command_shown = None
+        if self.explanation_shown is None:
+            self._show_explanation(nxt.explanation)
+        if self.command_shown is None:
+            self._show_command(nxt.command)
+
+
+def _run_probes(host, probes: List[str], max_probes: int, cwd: Path, timeout, max_output_bytes):
+    """
+    Run a --think step's read-only probes concurrently and print a short
+    report of each. Probes safety.is_read_only rejects, or past
+    `max_probes`, are not run; the model is told why. Returns
+    conversation.Result tuples.
+    """
+    from .conversation import probe_results
+    from .safety import probe_refusals
+
+    refusals = probe_refusals(probes, max_probes)
+    allowed = [p for p, refusal in zip(probes, refusals) if refusal is None]
+    results = probe_results(
+        probes, refusals, host.run_probes(allowed, cwd, timeout, max_output_bytes) if allowed else []
+    )
+    for i, (probe, code, out, _) in enumerate(results):
+        if i >= max_probes:
+            continue
+        if code is None:
+            print(f"{ANSI_DIM}Probe skipped (not read-only):{ANSI_RESET} {probe}")
+            continue
+        print(f"{ANSI_DIM}Probe:{ANSI_RESET} {probe} {ANSI_DIM}(exit {code}){ANSI_RESET}")
+        shown = out if len(out) < 400 else out[:400] + "\n...[truncated]..."
+        if shown.strip():
+            print(shown, end="" if shown.endswith("\n") else "\n")
+    return results
 
 
 def _read_rag_context(rag_dir: Optional[str], max_chars: int = 20000) -> Optional[str]:
     if not rag_dir:
         return None
+    from .rag import iter_rag_files, read_text_window
+
     base = Path(rag_dir).expanduser().resolve()
     if not base.exists() or not base.is_dir():
         return None
 
-    exts = {".md", ".txt", ".log", ".json", ".cfg", ".ini", ".toml", ".yml", ".yaml"}
     chunks: List[str] = []
     total = 0
 
-    for p in sorted(base.rglob("*")):
-        if p.is_file() and p.suffix.lower() in exts:
-            try:
-                text = p.read_text(encoding="utf-8", errors="ignore")
-            except Exception:
-                continue
-            header = f"\n# File: {p.relative_to(base)}\n"
-            piece = header + text[: max(0, max_chars - len(header))]
-            if total + len(piece) > max_chars:
-                piece = piece[: max_chars - total]
-            chunks.append(piece)
-            total += len(piece)
-            if total >= max_chars:
-                break
+    for p in iter_rag_files(base):
+        header = f"\n# File: {p.relative_to(base)}\n"
+        # Only what can still fit is read (head and tail for logs)
+        text = read_text_window(p, max(0, max_chars - total - len(header)))
+        if text is None:
+            continue
+        piece = header + text
+        if total + len(piece) > max_chars:
+            piece = piece[: max_chars - total]
+        chunks.append(piece)
+        total += len(piece)
+        if total >= max_chars:
+            break
 
     return "".join(chunks) if chunks else None
 
 
-def _persisting_execute(commands: List[str], cwd: Path) -> int:
+def _persisting_execute(commands: List[str], cwd: Path, session: Optional[ShellSession] = None) -> int:
     """
     Execute a list of shell commands, persisting 'cd' across subsequent commands.
     Captures exit codes but streams output directly to the terminal.
+    With a ShellSession, commands run in that shell, so cd/export persist for real.
     """
+    import subprocess
+
     cur_cwd = cwd
 
     for i, raw_cmd in enumerate(commands, 1):
         cmd = raw_cmd.strip()
 
+        if session is not None:
+            print(f"\n{ANSI_BOLD}▶ Running {i}/{len(commands)}:{ANSI_RESET} {cmd}")
+            cp = session.run(cmd, head_chars=0, tail_chars=0)
+            if cp.returncode != 0:
+                print(f"Command failed with return code {cp.returncode}", file=sys.stderr)
+                return cp.returncode
+            continue
+
         # Handle 'cd' locally so it persists
         if cmd.lower().startswith("cd "):
             target = cmd[3:].strip()
@@ -84,34 +237,466 @@ def _persisting_execute(commands: List[str], cwd: Path) -> int:
     return 0
 
 
-def _execute_one_capture(cmd: str, cwd: Path) -> subprocess.CompletedProcess:
+def _parallel_execute(commands: List[str], depends_on: List[List[int]], cwd: Path, max_workers: int) -> int:
+    """
+    Run a plan that carries dependency hints, independent commands in
+    parallel. Returns the exit code of the first failed command (0 if none).
+    """
+    from .executor import run_dependency_graph
+
+    print(f"\n{ANSI_BOLD}▶ Running {len(commands)} commands, up to {max_workers} at a time{ANSI_RESET}")
+    results = run_dependency_graph(commands, depends_on, cwd, max_workers=max_workers)
+    failed = [rc for rc in results if rc]  # skipped commands (None) imply an earlier failure
+    return failed[0] if failed else 0
+
+
+def _execute_one_capture(
+    cmd: str,
+    cwd: Path,
+    timeout: Optional[float] = None,
+    max_output_bytes: Optional[int] = None,
+    session: Optional[ShellSession] = None,
+) -> subprocess.CompletedProcess:
     """
     Execute a single command and capture stdout/stderr so we can feed observations
     back to the model. Persists cd by returning updated cwd if needed.
+    Output is streamed to the terminal as it arrives; only a bounded head/tail
+    is kept, and the command is killed past `timeout` / `max_output_bytes`.
+    With a ShellSession the command runs in that shell and cd is real.
     """
-    if cmd.lower().startswith("cd "):
-        target = cmd[3:].strip()
-        new_dir = Path(target).expanduser()
-        if not new_dir.is_absolute():
-            new_dir = (cwd / new_dir).resolve()
-        if not new_dir.exists() or not new_dir.is_dir():
-            # Simulate a failing process for invalid cd
-            cp = subprocess.CompletedProcess(args=cmd, returncode=1, stdout="", stderr=f"Directory not found: {new_dir}\n")
-            return cp
-        # Fake a successful "cd" with a message in stdout so the model can observe
-        cp = subprocess.CompletedProcess(args=cmd, returncode=0, stdout=f"(cd) now at: {new_dir}\n", stderr="")
-        # Patch attribute for caller to pick up new cwd
-        cp.new_cwd = new_dir  # type: ignore[attr-defined]
-        return cp
+    from .executor import change_directory, run_streaming
+
+    if session is not None:
+        return session.run(cmd, timeout=timeout, max_output_bytes=max_output_bytes)
+
+    changed = change_directory(cmd, cwd)
+    if changed is not None:
+        return changed
 
     # Normal command
-    cp = subprocess.run(cmd, shell=True, cwd=str(cwd), capture_output=True, text=True)
-    return cp
+    return run_streaming(cmd, cwd, timeout=timeout, max_output_bytes=max_output_bytes)
+
+
+class _LocalHost:
+    """
+    Where a run's commands execute: this process, with its environment and
+    terminal. Runs served by `gerg serve` get a stand-in from gerg.daemon
+    that forwards these calls to the client's own _LocalHost.
+    """
+
+    def __init__(self, run_dir: Path, persistent_shell: bool = False) -> None:
+        self.session: Optional[ShellSession] = None
+        if persistent_shell:
+            from .shell import ShellSession
+
+            self.session = ShellSession(run_dir)
+            atexit.register(self.session.close)
+
+    def run_plan(self, commands: List[str], depends_on: Optional[List[List[int]]], cwd: Path, max_workers: int) -> int:
+        # Dependency hints only make sense without cd emulation or a shared shell
+        parallel = (
+            depends_on is not None
+            and self.session is None
+            and not any(c.strip().lower().startswith("cd ") for c in commands)
+        )
+        if parallel:
+            return _parallel_execute(commands, depends_on, cwd, max_workers)
+        return _persisting_execute(commands, cwd=cwd, session=self.session)
+
+    def run_step(
+        self, cmd: str, cwd: Path, timeout: Optional[float], max_output_bytes: Optional[int]
+    ) -> subprocess.CompletedProcess:
+        return _execute_one_capture(cmd, cwd, timeout=timeout, max_output_bytes=max_output_bytes, session=self.session)
+
+    def run_probes(
+        self, commands: List[str], cwd: Path, timeout: Optional[float], max_output_bytes: Optional[int]
+    ) -> List[subprocess.CompletedProcess]:
+        # Read-only, so they need neither the persistent shell nor an order
+        from .executor import run_captured
+
+        return run_captured(commands, cwd, timeout=timeout, max_output_bytes=max_output_bytes)
+
+    def close(self) -> None:
+        if self.session is not None:
+            self.session.close()
+
+
+# State that outlives a single run. A one-shot `gerg` builds each piece at
+# most once anyway; a `gerg serve` daemon reuses them across the runs it
+# serves.
+_SHARED: Dict[Any, Any] = {}
+_SHARED_LOCK = threading.Lock()
+# RAG indexes refresh in place, so runs sharing one take turns with it.
+_RAG_LOCK = threading.Lock()
+# A think run's RAG budget in characters: the goal's hits and, each step, the
+# latest observation's share the 20000 that plain concatenation gets.
+RAG_GOAL_CHARS = 16000
+RAG_RELATED_CHARS = 4000
+
+
+def _shared(key: Any, build):
+    with _SHARED_LOCK:
+        if key not in _SHARED:
+            _SHARED[key] = build()
+        return _SHARED[key]
+
+
+def _history_log(history_dir: str) -> HistoryLog:
+    from .history import HistoryLog
+
+    def build() -> HistoryLog:
+        log = HistoryLog(history_dir)
+        atexit.register(log.close)
+        return log
+
+    return _shared(("history", history_dir), build)
+
+
+def _load_policy(paths: List[str]) -> None:
+    """Install the policy engine for `paths`, recompiling only when a file changed."""
+    from .safety import PolicyEngine, set_policy
+
+    stamp = tuple((p, os.stat(os.path.expanduser(p)).st_mtime_ns) for p in paths)
+    set_policy(_shared(("policy", stamp), lambda: PolicyEngine.from_files(paths)))
+
+
+def _open_rag_index(args, settings, base_url: str):
+    """The persistent RAG index for --rag-dir, refreshed against the tree."""
+    from .agent import request_embeddings
+    from .rag import EmbeddingIndex, RagIndex
+
+    if args.rag_engine == "embed":
+        def build():
+            return EmbeddingIndex.open(
+                args.rag_dir,
+                settings.history_dir,
+                settings.embed_model,
+                lambda texts: request_embeddings(base_url, settings.embed_model, texts, keep_alive=settings.keep_alive),
+            )
+    else:
+        def build():
+            return RagIndex.open(args.rag_dir, settings.history_dir)
+
+    key = ("rag", args.rag_engine, args.rag_dir, settings.history_dir, settings.embed_model, base_url)
+    with _SHARED_LOCK:
+        index = _SHARED.get(key)
+    if index is not None:
+        with _RAG_LOCK:
+            index.refresh()
+        return index
+    index = build()
+    if index is not None:
+        with _SHARED_LOCK:
+            _SHARED[key] = index
+    return index
+
+
+def _open_plan_cache(settings, args) -> Optional[PlanCache]:
+    if args.no_cache:
+        return None
+    from .cache import PlanCache
+
+    return PlanCache(
+        Path(settings.history_dir).expanduser() / "plan_cache",
+        max_entries=settings.plan_cache_max_entries,
+        ttl=settings.plan_cache_ttl,
+    )
+
+
+def _few_shot(settings, args, goal: str) -> Tuple[Optional[str], int]:
+    """
+    Similar successful runs from the history database, rendered for the
+    prompt within few_shot_max_chars. Returns (text or None, count used).
+    """
+    if args.no_examples or settings.few_shot_examples <= 0:
+        return None, 0
+    import sqlite3
+    from .examples import Example, format_examples
+    from .history import HistoryStore
+
+    try:
+        store = HistoryStore.open(settings.history_dir)
+        try:
+            rows = store.similar_goals(goal, k=settings.few_shot_examples)
+        finally:
+            store.close()
+    except (OSError, sqlite3.Error) as e:
+        if args.verbose:
+            print(f"{ANSI_DIM}No examples from history ({e}){ANSI_RESET}", file=sys.stderr)
+        return None, 0
+    examples = [Example(r["goal"], r["commands"], round(r["score"], 3)) for r in rows]
+    text = format_examples(examples, settings.few_shot_max_chars)
+    used = text.count("Goal: ") if text else 0
+    if args.verbose and used:
+        print(f"{ANSI_DIM}Using {used} similar past run(s) as examples{ANSI_RESET}")
+    return text, used
+
+
+def _environment(settings, args) -> Optional[str]:
+    """The environment fingerprint for the prompts (None when disabled)."""
+    if not settings.environment_fingerprint:
+        return None
+    from .environment import fingerprint
+
+    with timing.span("environment"):
+        text = fingerprint(settings.history_dir)
+    if args.verbose:
+        print(f"{ANSI_DIM}{text}{ANSI_RESET}")
+    return text
+
+
+def _run_batch(
+    args, settings, model: str, base_url: str, run_dir: Path, history_log: HistoryLog, environment: Optional[str]
+) -> int:
+    """
+    `--batch FILE`: plan many goals concurrently (print-only, never executes)
+    and write one JSON result per goal to stdout.
+    """
+    from .agent import AGENT_SYSTEM_PROMPT, DEFAULT_TEMPERATURE, request_plan, system_prompt
+    from .batch import read_goals, run_batch
+    from .cache import plan_cache_key
+    from .safety import is_risky
+
+    cache = _open_plan_cache(settings, args)
+    hedge = max(1, args.hedge or settings.hedge_samples)
+
+    def plan_one(item: BatchGoal):
+        cwd = Path(item.cwd).expanduser().resolve() if item.cwd else run_dir
+        key = plan_cache_key(item.goal, model, system_prompt(AGENT_SYSTEM_PROMPT, environment), DEFAULT_TEMPERATURE, cwd)
+        plan = cache.get(key) if cache is not None and not args.refresh else None
+        if plan is not None:
+            return plan, True
+        plan = request_plan(
+            base_url=base_url,
+            model=model,
+            user_goal=item.goal,
+            temperature=DEFAULT_TEMPERATURE,
+            keep_alive=settings.keep_alive,
+            hedge=hedge,
+            environment=environment,
+        )
+        if cache is not None and not any(is_risky(c) for c in plan.commands):
+            try:
+                cache.put(key, plan)
+            except OSError:
+                pass
+        return plan, False
+
+    def record(result) -> None:
+        if result["error"]:
+            status = "error"
+        elif result["validation_error"]:
+            status = "invalid_plan"
+        else:
+            status = "printed" if result["safe"] else "blocked_unsafe"
+        cwd = Path(result["cwd"]).expanduser().resolve() if result["cwd"] else run_dir
+        history_log.write(cwd, {
+            "mode": "batch",
+            "goal": result["goal"],
+            "model": model,
+            "plan": result["plan"],
+            "status": status,
+            "cached": result["cached"],
+        })
+
+    try:
+        if args.batch == "-":
+            goals = list(read_goals(sys.stdin))
+        else:
+            with open(Path(args.batch).expanduser(), "r", encoding="utf-8") as f:
+                goals = list(read_goals(f))
+    except (OSError, ValueError) as e:
+        print(f"Cannot read batch goals: {e}", file=sys.stderr)
+        return 2
+
+    summary = run_batch(goals, plan_one, sys.stdout, concurrency=args.concurrency, on_result=record)
+    return 0 if not summary["errors"] else 1
+
+
+# Options that consume the following argv token (see _prescan_model).
+_VALUE_OPTIONS = {"-m", "--model", "--cwd", "--max-steps", "--rag-dir", "--rag-engine", "--step-timeout",
+                  "--batch", "--concurrency", "--hedge"}
+
+
+def _prescan_model(argv: List[str]) -> Optional[str]:
+    """Cheaply pick `-m/--model` out of argv before argparse has run."""
+    i = 0
+    while i < len(argv):
+        arg = argv[i]
+        if not arg.startswith("-"):
+            break  # goal words start here; argparse treats the rest as REMAINDER
+        if arg in ("-m", "--model"):
+            return argv[i + 1] if i + 1 < len(argv) else None
+        if arg.startswith("--model="):
+            return arg.split("=", 1)[1]
+        if arg.startswith("-m") and len(arg) > 2 and not arg.startswith("--"):
+            return arg[2:]
+        i += 2 if arg in _VALUE_OPTIONS else 1
+    return None
+
+
+def _start_warmup(argv: List[str]) -> None:
+    """
+    Fire a background model load as the very first thing main() does, so the
+    model loads while we parse arguments, read settings and gather RAG context.
+    """
+    if not argv or "-h" in argv or "--help" in argv:
+        return
+
+    def _run() -> None:
+        try:
+            settings = load_settings()
+        except Exception:
+            return
+        model = _prescan_model(argv) or (settings.models or [settings.model])[0]
+        from .agent import warm_up
+
+        warm_up(settings.ollama_base_url, model, keep_alive=settings.keep_alive)
+
+    threading.Thread(target=_run, name="gerg-warmup-settings", daemon=True).start()
+
+
+_HISTORY_COMMANDS = ("search", "last", "stats", "import")
+
+
+def _print_runs(runs: List[Dict[str, Any]], as_json: bool) -> None:
+    import json
+    import time
+
+    for run in runs:
+        if as_json:
+            print(json.dumps(run, ensure_ascii=False))
+            continue
+        when = time.strftime("%Y-%m-%d %H:%M", time.localtime(run["ts"]))
+        print(f"{ANSI_BOLD}{when}{ANSI_RESET} {run['status'] or '-':<16} {run['goal']}")
+        print(f"{ANSI_DIM}  #{run['id']} {run['mode']} {run['model'] or '-'} in {run['cwd'] or '-'}{ANSI_RESET}")
+        for cmd in run["commands"]:
+            print(f"    $ {cmd}")
+
+
+def _history_main(argv: List[str]) -> int:
+    """`gerg history search|last|stats|import`: query the run history database."""
+    parser = argparse.ArgumentParser(prog="gerg history", description="Search and summarize past gerg runs")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_search = sub.add_parser("search", help="Full-text search over goals and commands")
+    p_search.add_argument("query", nargs="+")
+    p_last = sub.add_parser("last", help="Most recent runs")
+    for p in (p_search, p_last):
+        p.add_argument("-n", "--limit", type=int, default=10, help="How many runs to show (default: 10)")
+        p.add_argument("--status", default=None, help="Only runs with this status (e.g. success, failed)")
+        p.add_argument("--json", action="store_true", help="One JSON object per run")
+    p_last.add_argument("--model", default=None, help="Only runs with this model")
+    p_last.add_argument("--here", action="store_true", help="Only runs started in the current directory")
+    p_stats = sub.add_parser("stats", help="Counts by status, mode and model")
+    p_stats.add_argument("--json", action="store_true")
+    p_import = sub.add_parser("import", help="Import .gerg_history.jsonl files (re-importing only adds new lines)")
+    p_import.add_argument("files", nargs="*", default=[".gerg_history.jsonl"])
+    args = parser.parse_args(argv)
+    import sqlite3
+    from .history import HistoryStore
+
+    settings = load_settings()
+    try:
+        store = HistoryStore.open(settings.history_dir)
+    except (OSError, sqlite3.Error) as e:
+        print(f"Cannot open history database: {e}", file=sys.stderr)
+        return 1
+    try:
+        if args.command == "search":
+            _print_runs(store.search(" ".join(args.query), limit=args.limit, status=args.status), args.json)
+        elif args.command == "last":
+            cwd = str(Path.cwd()) if args.here else None
+            _print_runs(store.last(args.limit, status=args.status, model=args.model, cwd=cwd), args.json)
+        elif args.command == "stats":
+            stats = store.stats()
+            if args.json:
+                import json
+
+                print(json.dumps(stats))
+            else:
+                print(f"{ANSI_BOLD}{stats['runs']} runs{ANSI_RESET} ({stats['last_24h']} in the last 24h)")
+                for title in ("by_status", "by_mode", "by_model"):
+                    counts = ", ".join(f"{k}: {v}" for k, v in stats[title].items())
+                    print(f"  {title[3:]:<7} {counts or '-'}")
+                for title, t in stats["think"].items():
+                    print(
+                        f"  think {title.replace('_', ' ')}: {t['runs']} runs, "
+                        f"{t['avg_steps_to_done'] if t['avg_steps_to_done'] is not None else '-'} steps to done, "
+                        f"{t['avg_failed_steps'] if t['avg_failed_steps'] is not None else '-'} failed steps, "
+                        f"{t['success_rate']:.0%} success"
+                    )
+                cascade = stats["cascade"]
+                if cascade:
+                    print(f"  cascade {cascade['escalated_runs']} of {cascade['runs']} runs escalated")
+                    for name, t in cascade["tiers"].items():
+                        rate = f"{t['escalation_rate']:.0%}" if t["escalation_rate"] is not None else "-"
+                        avg = f"{t['avg_ms']:.0f} ms" if t["avg_ms"] is not None else "-"
+                        print(f"    {name:<28} {t['attempts']} attempts, {avg} avg, {rate} escalated")
+        else:
+            status = 0
+            for name in args.files:
+                try:
+                    added = store.import_jsonl(Path(name))
+                except (OSError, sqlite3.Error) as e:
+                    print(f"{name}: {e}", file=sys.stderr)
+                    status = 1
+                    continue
+                print(f"{name}: imported {added} run(s)")
+            return status
+    finally:
+        store.close()
+    return 0
+
+
+def _serve_main(argv: List[str]) -> int:
+    """`gerg serve`: keep settings, connections, indexes and the model warm for later runs."""
+    parser = argparse.ArgumentParser(
+        prog="gerg serve",
+        description="Run a resident gerg daemon; later gerg runs are forwarded to it over a unix socket",
+    )
+    parser.add_argument("--socket", default=None, help="Socket path (default: daemon_socket setting, history_dir/gerg.sock)")
+    args = parser.parse_args(argv)
+    from .daemon import serve
+
+    return serve(load_settings(), _run, path=args.socket)
+
+
+def _leading_options(argv: List[str]) -> List[str]:
+    """The option tokens of argv before the goal words (see _prescan_model)."""
+    options = []
+    i = 0
+    while i < len(argv) and argv[i].startswith("-"):
+        options.append(argv[i].split("=", 1)[0])
+        i += 2 if argv[i] in _VALUE_OPTIONS else 1
+    return options
 
 
 def main(argv: List[str] | None = None) -> int:
     argv = argv if argv is not None else sys.argv[1:]
+    if argv and argv[0] == "history" and (len(argv) == 1 or argv[1] in _HISTORY_COMMANDS or argv[1].startswith("-")):
+        return _history_main(argv[1:])
+    if argv and argv[0] == "serve" and (len(argv) == 1 or argv[1].startswith("-")):
+        return _serve_main(argv[1:])
 
+    # Hand the run to a `gerg serve` daemon when one is listening. Batch runs
+    # stay here: they read local files and write JSONL to our stdout.
+    options = _leading_options(argv)
+    if argv and "--no-daemon" not in options and "--batch" not in options:
+        from .daemon import run_client
+
+        code = run_client(argv, load_settings(), _LocalHost)
+        if code is not None:
+            return code
+    _start_warmup(argv)
+    return _run(argv)
+
+
+def _run(argv: List[str], host_factory=_LocalHost, cwd: Optional[Path] = None) -> int:
+    """
+    One gerg run. Commands execute through `host_factory(run_dir,
+    persistent_shell)`, and relative paths resolve against `cwd` (default:
+    the current directory), which is how a daemon serves a client.
+    """
     parser = argparse.ArgumentParser(
         prog="gerg",
         description="CLI agent powered by your local Ollama model",
@@ -123,32 +708,162 @@ def main(argv: List[str] | None = None) -> int:
     parser.add_argument("--cwd", default=None, help="Run as if started from this directory")
     parser.add_argument("--allow-unsafe", action="store_true", help="Allow commands that match the denylist (be careful)")
     parser.add_argument("--verbose", action="store_true", help="Show extra info about settings and request")
+    parser.add_argument("--no-stream", action="store_true", help="Wait for the full model reply instead of rendering it as it streams")
+    parser.add_argument("--no-cache", action="store_true", help="Neither read nor store cached plans for this run")
+    parser.add_argument("--refresh", action="store_true", help="Ignore any cached plan, ask the model and update the cache")
+    parser.add_argument("--no-examples", action="store_true", help="Do not show the model similar successful runs from history")
 
     # Thinking / RAG mode
     parser.add_argument("--think", action="store_true", help="Enable reason-act-observe loop (multi-step)")
     parser.add_argument("--max-steps", type=int, default=8, help="Max steps for --think mode (default: 8)")
     parser.add_argument("--rag-dir", type=str, default=None, help="Optional directory of text files to provide as RAG context")
+    parser.add_argument("--persistent-shell", action="store_true", help="Run all commands of this run in one long-lived shell so cd/export/source carry over")
+    parser.add_argument("--step-timeout", type=float, default=None, help="Kill a --think command after this many seconds (default: command_timeout setting, 300)")
+    parser.add_argument("--rag-engine", choices=["bm25", "embed"], default="bm25", help="Retrieval for --rag-dir: keyword BM25 (default) or Ollama embeddings")
+
+    # Batch mode
+    parser.add_argument("--batch", metavar="FILE", default=None, help="Plan every goal in FILE (JSONL or one goal per line, '-' for stdin) and print JSONL results; never executes")
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent model requests for --batch (default: 4)")
+    parser.add_argument("--hedge", type=int, default=None, metavar="N", help="Race N samples per model request and keep the first valid, safe reply (default: hedge_samples setting, 1)")
+    parser.add_argument("--no-daemon", action="store_true", help="Run in this process even if `gerg serve` is running")
+    parser.add_argument("--timings", action="store_true", help="Print where the run spent its time (settings, RAG, model, execution, ...)")
+    parser.add_argument("--trace", metavar="FILE", default=None, help="Write the run's timing spans as a Chrome trace (chrome://tracing, Perfetto)")
 
     args = parser.parse_args(argv)
 
-    if not args.goal:
+    if not args.goal and not args.batch:
         parser.error('Please provide a goal, e.g. gerg "list all files in my Downloads"')
 
     goal = " ".join(args.goal).strip()
 
-    settings = load_settings()
-    model = args.model or settings.model
+    timings = timing.Timings()
+    token = timings.activate()
+    try:
+        return _run_goal(args, goal, host_factory, cwd or Path.cwd())
+    finally:
+        timing.Timings.deactivate(token)
+        if args.timings:
+            print(f"{ANSI_DIM}{timings.format()}{ANSI_RESET}", file=sys.stderr)
+        if args.trace:
+            _write_trace(timings, (cwd or Path.cwd()) / Path(args.trace).expanduser())
+
+
+def _write_trace(timings: timing.Timings, path: Path) -> None:
+    import json
+
+    try:
+        path.write_text(json.dumps(timings.chrome_trace()), encoding="utf-8")
+    except OSError as e:
+        print(f"Could not write trace {path}: {e}", file=sys.stderr)
+
+
+def _print_escalation(before: str, after: str, reason: str) -> None:
+    print(f"\n{ANSI_DIM}↻ {reason} from {before}; asking {after}{ANSI_RESET}", flush=True)
+
+
+def _log_run(history_log: HistoryLog, router: Router, run_dir: Path, record: Dict[str, Any]) -> None:
+    """Record a run in history along with where its time went so far."""
+    if len(router.models) > 1:
+        record = dict(record, model=router.model, routing=router.record())
+    timings = timing.current()
+    if timings is not None:
+        record = dict(record, timings=timings.summary())
+    history_log.write(run_dir, record)
+
+
+def _run_goal(args, goal: str, host_factory, base_dir: Path) -> int:
+    with timing.span("imports"):
+        from .agent import (
+            AGENT_SYSTEM_PROMPT,
+            DEFAULT_TEMPERATURE,
+            THINK_SYSTEM_PROMPT,
+            request_plan,
+            request_next_action,
+            system_prompt,
+        )
+        from .cache import plan_cache_key
+        from .safety import is_risky
+
+    from .routing import Router, start_tier
+
+    with timing.span("settings"):
+        settings = load_settings()
     base_url = settings.ollama_base_url
+    hedge = max(1, args.hedge or settings.hedge_samples)
+    # -m pins one model; otherwise the configured cascade (or just `model`)
+    tiers = [args.model] if args.model else (settings.models or [settings.model])
+    router = Router(
+        tiers,
+        start_tier(len(tiers), goal, think=args.think, rag=bool(args.rag_dir)),
+        on_escalate=_print_escalation,
+    )
+    model = router.model
+    if settings.policy_files:
+        try:
+            with timing.span("policy"):
+                _load_policy(settings.policy_files)
+        except (OSError, ValueError) as e:
+            print(f"Could not load policy files: {e}", file=sys.stderr)
+            return 2
 
-    run_dir = Path(args.cwd).expanduser().resolve() if args.cwd else Path.cwd()
+    run_dir = (base_dir / Path(args.cwd).expanduser()).resolve() if args.cwd else base_dir
+    if args.rag_dir:
+        args.rag_dir = str(base_dir / Path(args.rag_dir).expanduser())
+    history_log = _history_log(settings.history_dir)
 
     if args.verbose:
         print(f"Using model={model} base_url={base_url} cwd={run_dir}")
+        if len(tiers) > 1:
+            print(f"{ANSI_DIM}Model cascade: {' -> '.join(tiers)} (starting at tier {router.start + 1}){ANSI_RESET}")
+
+    environment = _environment(settings, args)
+    if args.batch:
+        return _run_batch(args, settings, model, base_url, run_dir, history_log, environment)
+
+    with timing.span("host"):
+        host = host_factory(run_dir, args.persistent_shell)
 
     # ---- THINK MODE ----
     if args.think:
-        rag = _read_rag_context(args.rag_dir)
-        conversation: List[Dict[str, str]] = [{"role": "user", "content": goal}]
+        from .conversation import ConversationManager, estimate_tokens, step_record
+
+        # Prefer a persistent index; fall back to plain concatenation if it
+        # cannot be built (e.g. unreadable tree, embed model not pulled).
+        with timing.span("rag"):
+            try:
+                rag_index = _open_rag_index(args, settings, base_url) if args.rag_dir else None
+            except Exception as e:
+                if args.verbose:
+                    print(f"RAG index unavailable ({e}); using plain file context", file=sys.stderr)
+                rag_index = None
+            # RAG for the goal is fetched once and sits right after the system
+            # prompt, so the prompt prefix (system + RAG + goal) never changes and
+            # Ollama's prompt cache stays valid. Hits for the latest observation
+            # ride along with that observation instead.
+            if rag_index is not None:
+                with _RAG_LOCK:
+                    rag = rag_index.context(goal, max_chars=RAG_GOAL_CHARS)
+            else:
+                rag = _read_rag_context(args.rag_dir)
+        with timing.span("examples"):
+            examples, few_shot = _few_shot(settings, args, goal)
+        conversation = ConversationManager(
+            goal,
+            budget=settings.think_token_budget,
+            fixed_tokens=(
+                estimate_tokens(system_prompt(THINK_SYSTEM_PROMPT, environment))
+                + estimate_tokens(rag or "")
+                + estimate_tokens(examples or "")
+            ),
+        )
+        try:
+            from .compress import apply_results, load_compressor
+
+            compressor = load_compressor(settings.observation_compressor)
+        except (ImportError, AttributeError, ValueError) as e:
+            print(f"gerg: observation_compressor: {e}; observations stay uncompressed", file=sys.stderr)
+            compressor = None
+        last_observation = ""
         cur_cwd = run_dir
         history = {
             "mode": "think",
@@ -156,99 +871,192 @@ def main(argv: List[str] | None = None) -> int:
             "model": model,
             "status": "started",
             "steps": [],
+            "few_shot": few_shot,
+            "failed_steps": 0,
         }
 
         # Per-run safety and confirmation:
         confirmed = args.yes  # if -y, skip per-step prompts
+        failing = 0  # failed steps in a row (see cascade_escalate_after)
 
         for step in range(1, max(1, args.max_steps) + 1):
-            nxt = request_next_action(
-                base_url=base_url,
-                model=model,
-                user_goal=goal,
-                conversation=conversation,
-                rag_context=rag,
-            )
+            related = None
+            if rag_index is not None and last_observation:
+                with timing.span("rag", step=step), _RAG_LOCK:
+                    related = rag_index.context(
+                        last_observation[-2000:], max_chars=RAG_RELATED_CHARS, k=3, skip=rag
+                    )
+            messages = conversation.messages(extra=related)
+            prompt_tokens = conversation.estimate(messages)
+            stats: Dict[str, Any] = {}
+            printers: List[_StepStreamPrinter] = []
+
+            def ask(tier_model: str):
+                printers.append(_StepStreamPrinter(step))
+                return request_next_action(
+                    base_url=base_url,
+                    model=tier_model,
+                    user_goal=goal,
+                    conversation=messages,
+                    rag_context=rag,
+                    on_partial=None if args.no_stream else printers[-1],
+                    keep_alive=settings.keep_alive,
+                    stats=stats,
+                    hedge=hedge,
+                    examples=examples,
+                    environment=environment,
+                )
+
+            nxt = router.call(ask, lambda action: args.allow_unsafe or not is_risky(action.command))
+            printer = printers[-1]
+            if args.verbose:
+                evaluated = stats.get("prompt_eval_count", "n/a")
+                print(
+                    f"{ANSI_DIM}prompt tokens: ~{prompt_tokens} estimated, {evaluated} evaluated"
+                    f" ({conversation.folded_steps} step(s) summarized){ANSI_RESET}"
+                )
 
             # Safety block
-            risky = is_risky(nxt.command)
+            with timing.span("safety", step=step):
+                risky = is_risky(nxt.command)
             if risky and not args.allow_unsafe:
                 print("\nRefusing potentially unsafe command:")
                 print(f"  - {nxt.command}")
                 print("Re-run with --allow-unsafe if you are absolutely sure.")
                 history["status"] = "blocked_unsafe"
-                write_history_line(run_dir, history)
+                _log_run(history_log, router, run_dir, history)
                 return 2
 
-            print(f"\n{ANSI_BOLD}Step {step}:{ANSI_RESET} {nxt.explanation}")
-            print(f"{ANSI_DIM}Command:{ANSI_RESET} {nxt.command}")
+            printer.finish(nxt)
+            step_timeout = (args.step_timeout if args.step_timeout is not None else settings.command_timeout) or None
+
+            # Read-only probes run first, all at once and without asking
+            results = []
+            if nxt.probes and settings.max_probes > 0:
+                with timing.span("probes", step=step, count=len(nxt.probes)):
+                    results = _run_probes(
+                        host, nxt.probes, settings.max_probes, cur_cwd, step_timeout, settings.max_output_bytes or None
+                    )
+            run_command = bool(nxt.command) or not results
+            code, out, err = 0, "", ""
 
             # Confirm per step unless already confirmed
-            if (nxt.require_confirmation or not confirmed) and not args.yes:
-                ans = input("Proceed? [y/N] ").strip().lower()
+            if run_command and (nxt.require_confirmation or not confirmed) and not args.yes:
+                with timing.span("confirm", step=step):
+                    ans = input("Proceed? [y/N] ").strip().lower()
                 if ans not in {"y", "yes"}:
                     print("Aborted.")
                     history["status"] = "aborted"
-                    write_history_line(run_dir, history)
+                    _log_run(history_log, router, run_dir, history)
                     return 0
                 confirmed = True  # confirm once and continue silently
 
-            cp = _execute_one_capture(nxt.command, cur_cwd)
-            out = (cp.stdout or "")
-            err = (cp.stderr or "")
-            code = cp.returncode
-
-            # Update cwd if a cd succeeded
-            if hasattr(cp, "new_cwd") and cp.returncode == 0:  # type: ignore[attr-defined]
-                cur_cwd = getattr(cp, "new_cwd")  # type: ignore[attr-defined]
-
-            # Show output to user (trim long)
-            show_out = out if len(out) < 1200 else out[:1200] + "\n...[truncated]..."
-            show_err = err if len(err) < 800 else err[:800] + "\n...[truncated]..."
-            if show_out.strip():
-                print(f"{ANSI_DIM}stdout:{ANSI_RESET}\n{show_out}", end="" if show_out.endswith("\n") else "\n")
-            if show_err.strip():
-                print(f"{ANSI_DIM}stderr:{ANSI_RESET}\n{show_err}", end="" if show_err.endswith("\n") else "\n")
-            print(f"{ANSI_DIM}exit code:{ANSI_RESET} {code}")
-
-            # Append to convo as observation
-            conversation.append({"role": "assistant", "content": f"Executed: {nxt.command}\nexit_code={code}"})
-            observation = f"OBSERVATION:\nCWD: {cur_cwd}\nEXIT_CODE: {code}\nSTDOUT:\n{out[-4000:]}\nSTDERR:\n{err[-2000:]}"
-            conversation.append({"role": "user", "content": observation})
+            if run_command:
+                with timing.span("execute", step=step):
+                    cp = host.run_step(
+                        nxt.command,
+                        cur_cwd,
+                        timeout=step_timeout,
+                        max_output_bytes=settings.max_output_bytes or None,
+                    )
+                out = (cp.stdout or "")
+                err = (cp.stderr or "")
+                code = cp.returncode
+
+                # Update cwd if a cd succeeded
+                if hasattr(cp, "new_cwd"):  # type: ignore[attr-defined]
+                    cur_cwd = getattr(cp, "new_cwd")  # type: ignore[attr-defined]
+
+                # Show output to user (trim long) unless it was already streamed live
+                if not getattr(cp, "streamed", False):
+                    show_out = out if len(out) < 1200 else out[:1200] + "\n...[truncated]..."
+                    show_err = err if len(err) < 800 else err[:800] + "\n...[truncated]..."
+                    if show_out.strip():
+                        print(f"{ANSI_DIM}stdout:{ANSI_RESET}\n{show_out}", end="" if show_out.endswith("\n") else "\n")
+                    if show_err.strip():
+                        print(f"{ANSI_DIM}stderr:{ANSI_RESET}\n{show_err}", end="" if show_err.endswith("\n") else "\n")
+                print(f"{ANSI_DIM}exit code:{ANSI_RESET} {code}")
+                results.append((nxt.command, code, out, err))
+
+            # Append to convo as one observation for the probes and the command
+            with timing.span("compress", step=step) as span_args:
+                raw_chars = sum(len(o) + len(e) for _, _, o, e in results)
+                observed, saved = apply_results(compressor, results)
+                span_args["chars_saved"] = saved
+            if args.verbose and saved and raw_chars:
+                print(
+                    f"{ANSI_DIM}observation: {raw_chars} -> {raw_chars - saved} chars"
+                    f" ({saved / raw_chars:.0%} saved){ANSI_RESET}"
+                )
+            last_observation = conversation.add_results(cur_cwd, observed)
 
             # Log step
-            history["steps"].append({
-                "step": step,
-                "explanation": nxt.explanation,
-                "command": nxt.command,
-                "cwd": str(cur_cwd),
-                "exit_code": code,
-                "stdout_tail": out[-1000:],
-                "stderr_tail": err[-800:],
-            })
+            record = step_record(step, nxt, cur_cwd, results, run_command, stats, saved)
+            record["prompt_tokens_est"] = prompt_tokens
+            history["steps"].append(record)
 
+            history["failed_steps"] += code != 0
+            failing = failing + 1 if code != 0 else 0
+            if 0 < settings.cascade_escalate_after <= failing and router.escalate(f"{failing} failed steps"):
+                failing = 0
             if nxt.done:
+                history["steps_to_done"] = step
                 print(f"\n{ANSI_BOLD}Done.{ANSI_RESET}")
                 history["status"] = "success" if code == 0 else "done_with_errors"
-                write_history_line(run_dir, history)
+                _log_run(history_log, router, run_dir, history)
                 return 0 if code == 0 else code
 
         print(f"\nReached max steps ({args.max_steps}) without done=true.")
         history["status"] = "max_steps_reached"
-        write_history_line(run_dir, history)
+        _log_run(history_log, router, run_dir, history)
         return 0
 
     # ---- STANDARD (single-plan) MODE ----
-    plan = request_plan(base_url=base_url, model=model, user_goal=goal)
+    cache = _open_plan_cache(settings, args)
+    cache_key = plan_cache_key(
+        goal, "+".join(tiers), system_prompt(AGENT_SYSTEM_PROMPT, environment), DEFAULT_TEMPERATURE, run_dir
+    )
+
+    printer = _PlanStreamPrinter()
+    with timing.span("cache"):
+        plan = cache.get(cache_key) if cache is not None and not args.refresh else None
+    cached = plan is not None
+    few_shot = 0
+    if cached:
+        if args.verbose:
+            print(f"{ANSI_DIM}Using cached plan (--refresh to re-plan){ANSI_RESET}")
+    else:
+        with timing.span("examples"):
+            examples, few_shot = _few_shot(settings, args, goal)
+        printers = [printer]
+
+        def ask(tier_model: str):
+            if router.attempts:  # escalated: stream the new reply from scratch
+                printers.append(_PlanStreamPrinter())
+            return request_plan(
+                base_url=base_url,
+                model=tier_model,
+                user_goal=goal,
+                temperature=DEFAULT_TEMPERATURE,
+                on_partial=None if args.no_stream else printers[-1],
+                keep_alive=settings.keep_alive,
+                hedge=hedge,
+                examples=examples,
+                environment=environment,
+            )
+
+        plan = router.call(ask, lambda p: args.allow_unsafe or not any(is_risky(c) for c in p.commands))
+        printer = printers[-1]
 
     # Safety checks before printing/confirming
-    risky_cmds = [c for c in plan.commands if is_risky(c)]
+    with timing.span("safety"):
+        risky_cmds = [c for c in plan.commands if is_risky(c)]
     if risky_cmds and not args.allow_unsafe:
         print("\nRefusing potentially unsafe commands:")
         for c in risky_cmds:
             print(f"  - {c}")
         print("Re-run with --allow-unsafe if you are absolutely sure.")
-        write_history_line(run_dir, {
+        _log_run(history_log, router, run_dir, {
             "goal": goal,
             "model": model,
             "plan": {
@@ -257,55 +1065,73 @@ def main(argv: List[str] | None = None) -> int:
                 "require_confirmation": plan.require_confirmation,
             },
             "status": "blocked_unsafe",
+            "cached": cached,
+            "few_shot": few_shot,
         })
         return 2
 
-    print()
-    _print_plan(plan)
+    printer.finish(plan)
 
     # Reject plans that contain only cd/no-op
     nontrivial = [c for c in plan.commands if c.strip() and not c.strip().lower().startswith("cd ")]
     if not nontrivial:
         print("The plan contains only directory changes or no actionable commands.")
         print('Tip: try rephrasing, e.g., gerg --print "list all PDFs in ~/Downloads"')
-        write_history_line(run_dir, {
+        _log_run(history_log, router, run_dir, {
             "goal": goal,
             "model": model,
             "plan": plan.__dict__,
             "status": "no_actionable_commands",
+            "cached": cached,
+            "few_shot": few_shot,
         })
         return 0
 
+    if cache is not None and not cached:
+        try:
+            with timing.span("cache"):
+                cache.put(cache_key, plan)
+        except OSError:
+            pass  # caching is best-effort
+
     if args.print_only:
-        write_history_line(run_dir, {
+        _log_run(history_log, router, run_dir, {
             "goal": goal,
             "model": model,
             "plan": plan.__dict__,
             "status": "printed",
+            "cached": cached,
+            "few_shot": few_shot,
         })
         return 0
 
     need_confirm = plan.require_confirmation and not args.yes
     if need_confirm:
-        ans = input("\nProceed to run these commands? [y/N] ").strip().lower()
+        with timing.span("confirm"):
+            ans = input("\nProceed to run these commands? [y/N] ").strip().lower()
         if ans not in {"y", "yes"}:
             print("Aborted.")
-            write_history_line(run_dir, {
+            _log_run(history_log, router, run_dir, {
                 "goal": goal,
                 "model": model,
                 "plan": plan.__dict__,
                 "status": "aborted",
+                "cached": cached,
+                "few_shot": few_shot,
             })
             return 0
 
-    rc = _persisting_execute(plan.commands, cwd=run_dir)
+    with timing.span("execute"):
+        rc = host.run_plan(plan.commands, plan.depends_on, run_dir, settings.parallel_workers)
 
-    write_history_line(run_dir, {
+    _log_run(history_log, router, run_dir, {
         "goal": goal,
         "model": model,
         "plan": plan.__dict__,
         "status": "success" if rc == 0 else "failed",
         "return_code": rc,
+        "cached": cached,
+        "few_shot": few_shot,
     })
     return rc
 
@@ -0,0 +1,165 @@
+"""
+Observation compression for --think: shrink command output before it goes
+into the prompt, keeping what the model needs to decide its next step.
+"""
+from __future__ import annotations
+import importlib
+import os
+import re
+from collections import Counter
+from typing import Callable, List, Optional, Tuple
+
+# (stdout, stderr) -> (stdout, stderr)
+Compressor = Callable[[str, str], Tuple[str, str]]
+
+# Runs of at least this many similar lines are collapsed.
+MIN_RUN = 3
+# Runs of at least this many rows with about the same number of columns count
+# as a table and keep only TABLE_HEAD + TABLE_TAIL rows.
+TABLE_MIN_ROWS = 20
+TABLE_HEAD = 5
+TABLE_TAIL = 3
+# stderr longer than this many lines keeps its first ERROR_HEAD and last
+# ERROR_TAIL lines (where a traceback names the actual error).
+ERROR_MAX_LINES = 40
+ERROR_HEAD = 10
+ERROR_TAIL = 25
+
+_ANSI = re.compile(r"\x1b(?:\[[0-?]*[ -/]*[@-~]|\][^\x07\x1b]*(?:\x07|\x1b\\)|[@-Z\\-_])")
+_BACKSPACE = re.compile(r"[^\x08\n]\x08")
+_NUMBER = re.compile(r"0x[0-9a-fA-F]+|\d+(?:[.:]\d+)*")
+
+
+def strip_noise(text: str) -> str:
+    """
+    Remove ANSI escapes and backspace overstrikes, keep only the final
+    state of lines redrawn with carriage returns (progress bars), and drop
+    trailing whitespace.
+    """
+    text = _BACKSPACE.sub("", _ANSI.sub("", text))
+    lines = []
+    for line in text.split("\n"):
+        if "\r" in line:
+            line = next((part for part in reversed(line.split("\r")) if part.strip()), "")
+        lines.append(line.rstrip())
+    return "\n".join(lines)
+
+
+def _shape(line: str) -> str:
+    """The line with numbers masked, so counters and timestamps compare equal."""
+    return _NUMBER.sub("#", line)
+
+
+def collapse_repeats(lines: List[str]) -> List[str]:
+    """Collapse runs of identical lines, and of lines differing only in numbers."""
+    out: List[str] = []
+    i = 0
+    while i < len(lines):
+        j = i + 1
+        shape = _shape(lines[i])
+        while j < len(lines) and _shape(lines[j]) == shape:
+            j += 1
+        run = j - i
+        if run < MIN_RUN or not lines[i].strip():
+            out.extend(lines[i:j])
+        elif all(line == lines[i] for line in lines[i:j]):
+            out.append(f"{lines[i]}  [repeated {run}x]")
+        else:
+            out.extend([lines[i], f"[... {run - 2} similar lines ...]", lines[j - 1]])
+        i = j
+    return out
+
+
+def _counts(rows: List[List[str]]) -> str:
+    """Counts that describe a table: by file type for `ls -l`-style rows,
+    by extension for path lists, by first column when it has few values."""
+    if all(len(r[0]) == 10 and r[0][0] in "-dlcbps" for r in rows):
+        kinds = Counter({"-": "files", "d": "dirs", "l": "links"}.get(r[0][0], "other") for r in rows)
+    elif all(len(r) == 1 for r in rows):
+        kinds = Counter(os.path.splitext(r[0])[1] or "(no extension)" for r in rows)
+    else:
+        kinds = Counter(r[0] for r in rows)
+        if len(kinds) > 5:
+            return ""
+    return "; " + ", ".join(f"{n} {k}" for k, n in kinds.most_common(6))
+
+
+def _same_table(width: int, other: int) -> bool:
+    # Wide rows may differ by a couple of columns (names with spaces,
+    # "-> target" of symlinks in ls -l)
+    return width == other or (width >= 3 and other >= 3 and abs(width - other) <= 2)
+
+
+def summarize_tables(lines: List[str]) -> List[str]:
+    """Shorten long runs of rows with (about) the same column count to
+    their head, their tail and a line with the row count."""
+    out: List[str] = []
+    i = 0
+    while i < len(lines):
+        width = len(lines[i].split())
+        j = i + 1
+        while width and j < len(lines) and _same_table(width, len(lines[j].split())):
+            j += 1
+        if j - i < TABLE_MIN_ROWS:
+            out.extend(lines[i:j])
+        else:
+            rows = lines[i:j]
+            omitted = len(rows) - TABLE_HEAD - TABLE_TAIL
+            out.extend(rows[:TABLE_HEAD])
+            out.append(f"[... {omitted} more rows; {len(rows)} rows in total{_counts([r.split() for r in rows])} ...]")
+            out.extend(rows[-TABLE_TAIL:])
+        i = j
+    return out
+
+
+def keep_error_ends(lines: List[str]) -> List[str]:
+    if len(lines) <= ERROR_MAX_LINES:
+        return lines
+    omitted = len(lines) - ERROR_HEAD - ERROR_TAIL
+    return lines[:ERROR_HEAD] + [f"[... {omitted} lines ...]"] + lines[-ERROR_TAIL:]
+
+
+def compress(stdout: str, stderr: str) -> Tuple[str, str]:
+    """The default compressor: strip_noise, collapse_repeats and
+    summarize_tables on both streams, then keep_error_ends on stderr."""
+    out = summarize_tables(collapse_repeats(strip_noise(stdout).split("\n")))
+    err = keep_error_ends(summarize_tables(collapse_repeats(strip_noise(stderr).split("\n"))))
+    return "\n".join(out), "\n".join(err)
+
+
+def load_compressor(spec: str) -> Optional[Compressor]:
+    """
+    The compressor named by the observation_compressor setting: "default",
+    "off" (None), or "package.module:function" for a callable with
+    compress()'s signature.
+    """
+    if spec in ("", "off", "none"):
+        return None
+    if spec == "default":
+        return compress
+    module, sep, name = spec.partition(":")
+    if not sep or not name:
+        raise ValueError(f"observation_compressor must be 'default', 'off' or 'module:function', not {spec!r}")
+    return getattr(importlib.import_module(module), name)
+
+
+def apply(compressor: Optional[Compressor], stdout: str, stderr: str) -> Tuple[str, str, int]:
+    """Run `compressor` (if any) and return the result and the characters saved."""
+    if compressor is None:
+        return stdout, stderr, 0
+    out, err = compressor(stdout, stderr)
+    return out, err, len(stdout) + len(stderr) - len(out) - len(err)
+
+
+def apply_results(
+    compressor: Optional[Compressor], results: List[Tuple[str, Optional[int], str, str]]
+) -> Tuple[List[Tuple[str, Optional[int], str, str]], int]:
+    """apply() to the conversation.Result tuples that ran; returns them and
+    the characters saved."""
+    compressed, saved = [], 0
+    for command, code, out, err in results:
+        if code is not None:
+            out, err, n = apply(compressor, out, err)
+            saved += n
+        compressed.append((command, code, out, err))
+    return compressed, saved
@@ -2,18 +2,53 @@ from __future__ import annotations
 import os
 from dataclasses import dataclass
 from pathlib import Path
-
-try:
-    import tomllib  # Python 3.11+
-except ModuleNotFoundError:
-    import tomli as tomllib  # Backport for <3.11
+from typing import List
 
 
 DEFAULTS = {
     "model": "qwen2.5-coder:1.5b",
+    # One Ollama host, or several (a TOML list or comma-separated): requests
+    # go to the least busy one and fail over to the others
     "ollama_base_url": "http://127.0.0.1:11434",
     "confirm_by_default": True,
     "history_dir": str(Path.home() / ".local" / "share" / "gerg"),
+    # How long Ollama keeps the model loaded after a request (duration string)
+    "keep_alive": "30m",
+    # Plan cache under history_dir (see gerg.cache)
+    "plan_cache_max_entries": 256,
+    "plan_cache_ttl": 7 * 24 * 3600,
+    # Model used by --rag-engine embed
+    "embed_model": "nomic-embed-text",
+    # Prompt token budget for --think requests (older steps get summarized)
+    "think_token_budget": 4000,
+    # How --think shrinks command output before the model sees it: "default"
+    # (see gerg.compress), "off", or "package.module:function"
+    "observation_compressor": "default",
+    # Describe this machine (OS, userland, installed tools) in the planning
+    # prompts; cached under history_dir (see gerg.environment)
+    "environment_fingerprint": True,
+    # Most read-only probes a --think step may run at once (0 disables)
+    "max_probes": 6,
+    # Per-command limits for --think steps (0 disables)
+    "command_timeout": 300,
+    "max_output_bytes": 20 * 1024 * 1024,
+    # Max concurrent commands for plans with depends_on hints
+    "parallel_workers": 4,
+    # Concurrent samples per model request; the first valid, safe reply wins
+    "hedge_samples": 1,
+    # Extra deny-rule files (TOML [[rule]] tables or one regex per line)
+    "policy_files": [],
+    # Similar successful past runs shown to the model (0 disables) and the
+    # most characters they may take up in the prompt
+    "few_shot_examples": 3,
+    "few_shot_max_chars": 1200,
+    # Unix socket of `gerg serve` (empty: history_dir/gerg.sock)
+    "daemon_socket": "",
+    # Model cascade, smallest first (empty: always `model`). Runs start on
+    # a tier picked from the goal and move up on invalid or unsafe replies,
+    # or after this many failed --think steps in a row.
+    "models": [],
+    "cascade_escalate_after": 2,
 }
 
 # Only include an explicit file path if GERG_CONFIG is set and points to a file
@@ -34,6 +69,24 @@ class Settings:
     ollama_base_url: str
     confirm_by_default: bool
     history_dir: str
+    keep_alive: str
+    plan_cache_max_entries: int
+    plan_cache_ttl: int
+    embed_model: str
+    think_token_budget: int
+    observation_compressor: str
+    environment_fingerprint: bool
+    max_probes: int
+    command_timeout: float
+    max_output_bytes: int
+    parallel_workers: int
+    hedge_samples: int
+    policy_files: List[str]
+    few_shot_examples: int
+    few_shot_max_chars: int
+    daemon_socket: str
+    models: List[str]
+    cascade_escalate_after: int
 
 
 def load_settings() -> Settings:
@@ -42,12 +95,20 @@ def load_settings() -> Settings:
     for path in CONFIG_PATHS:
         try:
             if path.is_file():
+                try:
+                    import tomllib  # Python 3.11+
+                except ModuleNotFoundError:
+                    import tomli as tomllib  # Backport for <3.11
+
                 with open(path, "rb") as f:
                     data.update(tomllib.load(f))
         except Exception:
             # Ignore malformed configs; keep defaults/env overrides
             pass
 
+    if isinstance(data["ollama_base_url"], list):
+        data["ollama_base_url"] = ",".join(data["ollama_base_url"])
+
     # Environment overrides
     model = os.environ.get("GERG_MODEL")
     if model:
@@ -61,9 +122,30 @@ def load_settings() -> Settings:
     if confirm is not None:
         data["confirm_by_default"] = confirm.lower() in {"1", "true", "yes"}
 
+    env_fp = os.environ.get("GERG_ENVIRONMENT_FINGERPRINT")
+    if env_fp is not None:
+        data["environment_fingerprint"] = env_fp.lower() in {"1", "true", "yes"}
+
+    keep_alive = os.environ.get("GERG_KEEP_ALIVE")
+    if keep_alive:
+        data["keep_alive"] = keep_alive
+
+    policy = os.environ.get("GERG_POLICY_FILES")
+    if policy:
+        data["policy_files"] = [p for p in policy.split(os.pathsep) if p]
+
+    models = os.environ.get("GERG_MODELS")
+    if models:
+        data["models"] = [m.strip() for m in models.split(",") if m.strip()]
+
+    sock = os.environ.get("GERG_SOCKET")
+    if sock:
+        data["daemon_socket"] = sock
+
     hist = os.environ.get("GERG_HISTORY_DIR")
     if hist:
         data["history_dir"] = hist
 
-    Path(data["history_dir"]).expanduser().mkdir(parents=True, exist_ok=True)
+    # history_dir is created by whatever writes there first (history, caches,
+    # RAG indexes), not on every start.
     return Settings(**data)
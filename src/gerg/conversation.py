@@ -0,0 +1,214 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+CHARS_PER_TOKEN = 4
+# Per-message overhead of the chat template (role markers etc.)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+# (command, exit code or None if it was not run, stdout, stderr)
+Result = Tuple[str, Optional[int], str, str]
+
+
+def probe_results(probes: Sequence[str], refusals: Sequence[Optional[str]], completed: Iterable[Any]) -> List[Result]:
+    """
+    Result tuples for a step's probes, in order: `completed` holds the
+    CompletedProcess of each probe that ran (those without a refusal, see
+    safety.probe_refusals), the others carry their refusal as stderr.
+    """
+    ran = iter(completed)
+    results: List[Result] = []
+    for probe, refusal in zip(probes, refusals):
+        if refusal is not None:
+            results.append((probe, None, "", refusal))
+        else:
+            cp = next(ran)
+            results.append((probe, cp.returncode, cp.stdout or "", cp.stderr or ""))
+    return results
+
+
+def step_record(
+    step: int,
+    action: Any,
+    cwd: Path,
+    results: Sequence[Result],
+    ran_command: bool,
+    stats: Dict[str, Any],
+    chars_saved: int,
+) -> Dict[str, Any]:
+    """
+    History record of one think step. `action` is the NextAction, `results`
+    its probes' results followed by its command's when `ran_command`.
+    """
+    _, code, out, err = results[-1] if ran_command else ("", None, "", "")
+    record: Dict[str, Any] = {
+        "step": step,
+        "explanation": action.explanation,
+        "command": action.command,
+        "cwd": str(cwd),
+        "exit_code": code,
+        "stdout_tail": out[-1000:],
+        "stderr_tail": err[-800:],
+        "prompt_eval_count": stats.get("prompt_eval_count"),
+        "chars_saved": chars_saved,
+    }
+    if action.probes:
+        record["probes"] = [{"command": c, "exit_code": rc} for c, rc, _, _ in results[: len(action.probes)]]
+    return record
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 chars per token for English and shell output)."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def estimate_message_tokens(messages: List[Dict[str, str]]) -> int:
+    return sum(estimate_tokens(m["content"]) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+
+def _squeeze(text: str, max_chars: int) -> str:
+    """Keep the head and tail of `text` within `max_chars`."""
+    if len(text) <= max_chars:
+        return text
+    marker = "\n...[trimmed]...\n"
+    keep = max(0, max_chars - len(marker))
+    head = keep // 3
+    return text[:head] + marker + text[len(text) - (keep - head):]
+
+
+def _first_lines(text: str, limit: int = 160) -> str:
+    text = " | ".join(line.strip() for line in text.strip().splitlines() if line.strip())
+    return text if len(text) <= limit else text[: limit - 3] + "..."
+
+
+@dataclass
+class _Step:
+    assistant: str
+    observation: str
+    summary: str
+
+
+class ConversationManager:
+    """
+    Think-mode message history kept under a prompt token budget.
+
+    `messages()` always starts with the goal, so together with the system
+    prompt and RAG context the caller puts in front of it, the request
+    prefix stays byte-identical between steps and Ollama can reuse its
+    prompt cache. When the estimate exceeds `budget`, the oldest steps are
+    folded into one-line summaries. Folding only ever moves forward, so a
+    summary never changes once it has been sent. The latest step is always
+    kept in full, trimmed to fit if it has to be.
+    """
+
+    def __init__(self, goal: str, budget: int = 4000, fixed_tokens: int = 0) -> None:
+        self.goal = goal
+        self.budget = budget
+        self.fixed_tokens = fixed_tokens  # system prompt + RAG context
+        self._steps: List[_Step] = []
+        self._folded = 0
+
+    @property
+    def folded_steps(self) -> int:
+        return self._folded
+
+    def add_step(
+        self, command: str, exit_code: int, cwd: Path, stdout: str, stderr: str
+    ) -> str:
+        """Record an executed command and return the full observation text."""
+        observation = (
+            f"OBSERVATION:\nCWD: {cwd}\nEXIT_CODE: {exit_code}\n"
+            f"STDOUT:\n{_squeeze(stdout, 4000)}\nSTDERR:\n{_squeeze(stderr, 2000)}"
+        )
+        summary = f"OBSERVATION (summarized): CWD: {cwd}; EXIT_CODE: {exit_code}"
+        if stdout.strip():
+            summary += f"; stdout {len(stdout.splitlines())} lines, ends: {_first_lines(stdout[-400:])}"
+        if stderr.strip():
+            summary += f"; stderr: {_first_lines(stderr[-400:])}"
+        self._steps.append(
+            _Step(
+                assistant=f"Executed: {command}\nexit_code={exit_code}",
+                observation=observation,
+                summary=summary,
+            )
+        )
+        return observation
+
+    def add_results(self, cwd: Path, results: Sequence[Result]) -> str:
+        """
+        Record a step that ran several commands (probes, then maybe the
+        step's command) as one observation, and return its text. A result
+        with exit code None was not run; its stderr says why. The output
+        allowance of a single command is shared between them.
+        """
+        if len(results) == 1 and results[0][1] is not None:
+            command, exit_code, stdout, stderr = results[0]
+            return self.add_step(command, exit_code, cwd, stdout, stderr)
+        share = max(1, len(results))
+        parts = [f"OBSERVATION:\nCWD: {cwd}"]
+        summaries = [f"OBSERVATION (summarized): CWD: {cwd}"]
+        for i, (command, exit_code, stdout, stderr) in enumerate(results, 1):
+            if exit_code is None:
+                parts.append(f"[{i}] $ {command}\nNOT RUN: {stderr}")
+                summaries.append(f"[{i}] not run")
+                continue
+            parts.append(
+                f"[{i}] $ {command}\nEXIT_CODE: {exit_code}\n"
+                f"STDOUT:\n{_squeeze(stdout, max(500, 4000 // share))}\n"
+                f"STDERR:\n{_squeeze(stderr, max(300, 2000 // share))}"
+            )
+            summary = f"[{i}] exit {exit_code}"
+            if stdout.strip():
+                summary += f", stdout {len(stdout.splitlines())} lines, ends: {_first_lines(stdout[-200:], 80)}"
+            if stderr.strip():
+                summary += f", stderr: {_first_lines(stderr[-200:], 80)}"
+            summaries.append(summary)
+        ran = "\n".join(
+            f"[{i}] {command} (exit_code={'not run' if exit_code is None else exit_code})"
+            for i, (command, exit_code, _, _) in enumerate(results, 1)
+        )
+        observation = "\n".join(parts)
+        self._steps.append(_Step(assistant=f"Executed:\n{ran}", observation=observation, summary="; ".join(summaries)))
+        return observation
+
+    def _build(self, extra: Optional[str], last_observation: Optional[str] = None) -> List[Dict[str, str]]:
+        messages = [{"role": "user", "content": self.goal}]
+        for i, step in enumerate(self._steps):
+            messages.append({"role": "assistant", "content": step.assistant})
+            if i < self._folded:
+                content = step.summary
+            elif i == len(self._steps) - 1:
+                content = last_observation if last_observation is not None else step.observation
+                if extra:
+                    content += f"\nRELATED CONTEXT (read-only):\n{extra}"
+            else:
+                content = step.observation
+            messages.append({"role": "user", "content": content})
+        return messages
+
+    def estimate(self, messages: List[Dict[str, str]]) -> int:
+        return self.fixed_tokens + estimate_message_tokens(messages)
+
+    def messages(self, extra: Optional[str] = None) -> List[Dict[str, str]]:
+        """
+        Messages for the next request. `extra` (e.g. RAG hits for the latest
+        observation) is attached to the latest observation only, so it never
+        disturbs the cached prefix, and is dropped when it does not fit.
+        """
+        messages = self._build(None)
+        while self._folded < len(self._steps) - 1 and self.estimate(messages) > self.budget:
+            self._folded += 1
+            messages = self._build(None)
+
+        if extra:
+            with_extra = self._build(extra)
+            if self.estimate(with_extra) <= self.budget:
+                return with_extra
+        over = self.estimate(messages) - self.budget
+        if over > 0 and self._steps:
+            last = self._steps[-1].observation
+            room = max(500, len(last) - over * CHARS_PER_TOKEN)
+            messages = self._build(None, _squeeze(last, room))
+        return messages
@@ -0,0 +1,389 @@
+from __future__ import annotations
+import io
+import json
+import os
+import socket
+import sys
+import threading
+import traceback
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional
+
+if TYPE_CHECKING:
+    import subprocess
+
+# Wire format: one JSON object per line in both directions.
+#   client -> daemon  {"type": "run", "version", "argv", "cwd", "env"}
+#   daemon -> client  {"type": "out", "stream", "data"}   terminal output
+#                     {"type": "input"}                   read a line of stdin
+#                     {"type": "call", "method", "params"} run commands (host)
+#                     {"type": "exit", "code"} | {"type": "refused", "reason"}
+#   client -> daemon  {"type": "line", "data", "eof"} | {"type": "return", "value"}
+#                     | {"type": "error", "message"}
+PROTOCOL_VERSION = 2
+SOCKET_NAME = "gerg.sock"
+# How often the daemon re-sends keep_alive so Ollama never unloads the model.
+PIN_INTERVAL = 60.0
+
+
+def socket_path(settings) -> Path:
+    return Path(settings.daemon_socket or Path(settings.history_dir).expanduser() / SOCKET_NAME).expanduser()
+
+
+def gerg_env() -> Dict[str, str]:
+    """The GERG_* environment, which a client and daemon must agree on."""
+    return {k: v for k, v in os.environ.items() if k.startswith("GERG_")}
+
+
+class _Channel:
+    """Newline-delimited JSON messages over a connected unix socket."""
+
+    def __init__(self, sock: socket.socket) -> None:
+        self.sock = sock
+        self._rfile = sock.makefile("rb")
+        self._lock = threading.Lock()
+        self.broken = False
+
+    def send(self, **msg: Any) -> None:
+        data = json.dumps(msg, ensure_ascii=False).encode("utf-8") + b"\n"
+        try:
+            with self._lock:
+                self.sock.sendall(data)
+        except OSError:
+            self.broken = True
+            raise
+
+    def recv(self) -> Dict[str, Any]:
+        try:
+            line = self._rfile.readline()
+        except OSError:
+            self.broken = True
+            raise
+        if not line:
+            self.broken = True
+            raise ConnectionError("gerg daemon connection closed")
+        return json.loads(line)
+
+    def close(self) -> None:
+        self._rfile.close()
+        self.sock.close()
+
+
+# ---------------------------------------------------------------- client side
+
+
+def _encode_completed(cp: subprocess.CompletedProcess) -> Dict[str, Any]:
+    new_cwd = getattr(cp, "new_cwd", None)
+    return {
+        "returncode": cp.returncode,
+        "stdout": cp.stdout or "",
+        "stderr": cp.stderr or "",
+        "new_cwd": str(new_cwd) if new_cwd is not None else None,
+        "streamed": getattr(cp, "streamed", False),
+        "timed_out": getattr(cp, "timed_out", False),
+        "output_limited": getattr(cp, "output_limited", False),
+    }
+
+
+def _decode_completed(cmd: str, value: Dict[str, Any]) -> subprocess.CompletedProcess:
+    import subprocess
+
+    cp = subprocess.CompletedProcess(cmd, value["returncode"], value["stdout"], value["stderr"])
+    if value.get("new_cwd") is not None:
+        cp.new_cwd = Path(value["new_cwd"])  # type: ignore[attr-defined]
+    for attr in ("streamed", "timed_out", "output_limited"):
+        setattr(cp, attr, bool(value.get(attr)))
+    return cp
+
+
+def run_client(argv: List[str], settings, host_factory: Callable[..., Any], path: Optional[Path] = None) -> Optional[int]:
+    """
+    Forward a run to a `gerg serve` daemon: relay its output and prompts,
+    and execute commands here through `host_factory(run_dir,
+    persistent_shell)` when it asks. Returns the run's exit code, or None
+    when no daemon is listening or it declines the run (the caller then
+    runs in-process).
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(str(path or socket_path(settings)))
+    except OSError:
+        sock.close()
+        return None
+
+    chan = _Channel(sock)
+    host = None
+    started = False
+    try:
+        chan.send(type="run", version=PROTOCOL_VERSION, argv=argv, cwd=os.getcwd(), env=gerg_env())
+        while True:
+            msg = chan.recv()
+            kind = msg.get("type")
+            if kind == "refused":
+                return None
+            started = True
+            if kind == "out":
+                stream = sys.stderr if msg.get("stream") == "stderr" else sys.stdout
+                stream.write(msg["data"])
+                stream.flush()
+            elif kind == "input":
+                line = sys.stdin.readline()
+                chan.send(type="line", data=line.rstrip("\n"), eof=not line)
+            elif kind == "call":
+                method, params = msg["method"], msg.get("params", {})
+                try:
+                    if method == "open":
+                        host = host_factory(Path(params["run_dir"]), params["persistent_shell"])
+                        value = None
+                    elif method == "run_plan":
+                        value = host.run_plan(
+                            params["commands"], params["depends_on"], Path(params["cwd"]), params["max_workers"]
+                        )
+                    elif method == "run_step":
+                        value = _encode_completed(
+                            host.run_step(params["cmd"], Path(params["cwd"]), params["timeout"], params["max_output_bytes"])
+                        )
+                    elif method == "run_probes":
+                        value = [
+                            _encode_completed(cp)
+                            for cp in host.run_probes(
+                                params["commands"], Path(params["cwd"]), params["timeout"], params["max_output_bytes"]
+                            )
+                        ]
+                    else:
+                        raise ValueError(f"unknown method {method!r}")
+                except Exception as e:
+                    chan.send(type="error", message=f"{type(e).__name__}: {e}")
+                else:
+                    chan.send(type="return", value=value)
+            elif kind == "exit":
+                return int(msg.get("code", 1))
+    except (OSError, ValueError) as e:
+        if not started:
+            return None  # a stale socket or a daemon from another version
+        print(f"Lost connection to the gerg daemon: {e}", file=sys.stderr)
+        return 1
+    finally:
+        if host is not None:
+            host.close()
+        chan.close()
+
+
+# ---------------------------------------------------------------- daemon side
+
+_local = threading.local()
+
+
+class _OutputRouter(io.TextIOBase):
+    """sys.stdout/sys.stderr stand-in sending a serving thread's output to its client."""
+
+    def __init__(self, name: str, fallback) -> None:
+        self.name = name
+        self.fallback = fallback
+
+    def write(self, text: str) -> int:
+        chan = getattr(_local, "channel", None)
+        if chan is None:
+            return self.fallback.write(text)
+        if text:
+            chan.send(type="out", stream=self.name, data=text)
+        return len(text)
+
+    def flush(self) -> None:
+        if getattr(_local, "channel", None) is None:
+            self.fallback.flush()
+
+
+class _InputRouter(io.TextIOBase):
+    """sys.stdin stand-in that reads a serving thread's input from its client."""
+
+    def __init__(self, fallback) -> None:
+        self.fallback = fallback
+
+    def readline(self, size: int = -1) -> str:
+        chan = getattr(_local, "channel", None)
+        if chan is None:
+            return self.fallback.readline(size)
+        chan.send(type="input")
+        reply = chan.recv()
+        return "" if reply.get("eof") else reply.get("data", "") + "\n"
+
+
+class RemoteHost:
+    """Runs a served run's commands on its client (see cli._LocalHost)."""
+
+    def __init__(self, chan: _Channel, run_dir: Path, persistent_shell: bool = False) -> None:
+        self._chan = chan
+        self._call("open", run_dir=str(run_dir), persistent_shell=persistent_shell)
+
+    def _call(self, method: str, **params: Any) -> Any:
+        self._chan.send(type="call", method=method, params=params)
+        reply = self._chan.recv()
+        if reply.get("type") == "error":
+            raise OSError(f"client could not {method}: {reply.get('message')}")
+        return reply.get("value")
+
+    def run_plan(self, commands: List[str], depends_on: Optional[List[List[int]]], cwd: Path, max_workers: int) -> int:
+        return int(self._call("run_plan", commands=commands, depends_on=depends_on, cwd=str(cwd), max_workers=max_workers))
+
+    def run_step(
+        self, cmd: str, cwd: Path, timeout: Optional[float], max_output_bytes: Optional[int]
+    ) -> subprocess.CompletedProcess:
+        value = self._call("run_step", cmd=cmd, cwd=str(cwd), timeout=timeout, max_output_bytes=max_output_bytes)
+        return _decode_completed(cmd, value)
+
+    def run_probes(
+        self, commands: List[str], cwd: Path, timeout: Optional[float], max_output_bytes: Optional[int]
+    ) -> List[subprocess.CompletedProcess]:
+        values = self._call(
+            "run_probes", commands=commands, cwd=str(cwd), timeout=timeout, max_output_bytes=max_output_bytes
+        )
+        return [_decode_completed(cmd, value) for cmd, value in zip(commands, values)]
+
+    def close(self) -> None:
+        pass  # the client closes its host when the run ends
+
+
+RunFn = Callable[[List[str], Callable[..., Any], Path], int]
+
+
+class Daemon:
+    """
+    Serves gerg runs on a unix socket, one thread per client. `run(argv,
+    host_factory, cwd)` is the in-process run (cli._run); while it runs, the
+    thread's stdout, stderr and stdin are the client's.
+    """
+
+    def __init__(self, path: Path, run: RunFn) -> None:
+        self.path = Path(path)
+        self.run = run
+        self.env = gerg_env()
+        self._sock: Optional[socket.socket] = None
+        self._stopped = threading.Event()
+
+    def bind(self) -> None:
+        """Listen on the socket, replacing a stale one; OSError if a daemon is already there."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(str(self.path))
+        except OSError:
+            try:
+                self.path.unlink()
+            except FileNotFoundError:
+                pass
+        else:
+            raise OSError(f"a gerg daemon is already listening on {self.path}")
+        finally:
+            probe.close()
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0o177)  # only our user may connect
+        try:
+            sock.bind(str(self.path))
+        finally:
+            os.umask(old_umask)
+        sock.listen(16)
+        self._sock = sock
+
+    def serve_forever(self) -> None:
+        if self._sock is None:
+            self.bind()
+        saved = sys.stdout, sys.stderr, sys.stdin
+        sys.stdout = _OutputRouter("stdout", saved[0])
+        sys.stderr = _OutputRouter("stderr", saved[1])
+        sys.stdin = _InputRouter(saved[2])
+        try:
+            while not self._stopped.is_set():
+                try:
+                    conn, _ = self._sock.accept()
+                except OSError:
+                    break
+                threading.Thread(target=self._handle, args=(conn,), name="gerg-serve", daemon=True).start()
+        finally:
+            sys.stdout, sys.stderr, sys.stdin = saved
+
+    def shutdown(self) -> None:
+        self._stopped.set()
+        if self._sock is not None:
+            try:
+                self._sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._sock.close()
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+
+    def _handle(self, conn: socket.socket) -> None:
+        chan = _Channel(conn)
+        try:
+            msg = chan.recv()
+            if msg.get("type") != "run" or msg.get("version") != PROTOCOL_VERSION:
+                chan.send(type="refused", reason="protocol version mismatch")
+                return
+            if msg.get("env") != self.env:
+                chan.send(type="refused", reason="GERG_* environment differs from the daemon's")
+                return
+            _local.channel = chan
+            try:
+                code = self.run(
+                    msg["argv"],
+                    lambda run_dir, persistent_shell: RemoteHost(chan, run_dir, persistent_shell),
+                    Path(msg["cwd"]),
+                )
+            except SystemExit as e:  # argparse errors, --help
+                if isinstance(e.code, str):
+                    print(e.code, file=sys.stderr)
+                code = e.code if isinstance(e.code, int) else int(e.code is not None)
+            except Exception:
+                if chan.broken:
+                    return  # the client went away (e.g. Ctrl-C)
+                traceback.print_exc()
+                code = 1
+            finally:
+                _local.channel = None
+            chan.send(type="exit", code=code)
+        except (OSError, ValueError):
+            pass
+        finally:
+            chan.close()
+
+
+def _pin_model(settings, stop: threading.Event) -> None:
+    from .agent import warm_up
+
+    model = (settings.models or [settings.model])[0]  # the cascade starts small
+    while True:
+        warm_up(settings.ollama_base_url, model, keep_alive=settings.keep_alive).join()
+        if stop.wait(PIN_INTERVAL):
+            return
+
+
+def serve(settings, run: RunFn, path: Optional[str] = None) -> int:
+    """`gerg serve`: preload everything a run needs, pin the model and serve until interrupted."""
+    import signal
+
+    # Pay for the imports and the built-in policy once, up front.
+    from . import agent, cache, conversation, history, rag  # noqa: F401
+    from .safety import get_policy
+
+    get_policy()
+    daemon = Daemon(Path(path).expanduser() if path else socket_path(settings), run)
+    try:
+        daemon.bind()
+    except OSError as e:
+        print(f"Cannot serve: {e}", file=sys.stderr)
+        return 1
+    stop = threading.Event()
+    threading.Thread(target=_pin_model, args=(settings, stop), name="gerg-pin", daemon=True).start()
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    print(f"gerg daemon listening on {daemon.path} (model {settings.model}); Ctrl-C to stop", flush=True)
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        daemon.shutdown()
+    return 0
@@ -0,0 +1,177 @@
+"""
+Environment fingerprint for the planning prompts: OS, shell, which common
+tools are installed, whether sed/grep/... are GNU, BSD or BusyBox, and a few
+tool versions. Building it runs a handful of `--version` commands, so it is
+cached under history_dir and rebuilt only when PATH or a directory on it
+changes (installing or removing a program touches its directory).
+"""
+from __future__ import annotations
+import json
+import os
+import re
+import shutil
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+# Bump when the fingerprint's contents or format change.
+FORMAT_VERSION = 1
+CACHE_FILE = "environment.json"
+# Seconds any one `--version` command may take.
+PROBE_TIMEOUT = 2.0
+
+# Programs worth telling the model about when present.
+KEY_TOOLS = (
+    "git", "python3", "pip3", "uv", "node", "npm", "go", "cargo", "java", "make", "gcc", "clang",
+    "docker", "podman", "kubectl", "curl", "wget", "ssh", "rsync", "jq", "rg", "fd", "fzf", "tree",
+    "gawk", "bc", "zip", "unzip", "7z", "xz", "zstd", "file", "lsof", "ss", "ip", "ffmpeg", "convert",
+    "pdftotext", "sqlite3", "psql", "tmux", "sudo", "systemctl", "gh",
+    "apt", "dnf", "yum", "pacman", "apk", "zypper", "brew", "port",
+)
+# Programs models tend to assume, named explicitly when missing.
+ASSUMED_TOOLS = ("git", "python3", "curl", "wget", "jq", "rg", "fd", "tree", "file", "unzip", "sudo", "gawk")
+# Tools whose GNU and BSD/BusyBox versions take different flags.
+FLAVOR_TOOLS = ("sed", "grep", "find", "tar", "ls", "date", "stat")
+VERSION_TOOLS = ("python3", "git", "bash", "node", "docker")
+
+_VERSION = re.compile(r"\d+(?:\.\d+)+")
+
+
+def _os_name() -> str:
+    u = os.uname()
+    if u.sysname == "Linux":
+        try:
+            with open("/etc/os-release", "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.startswith("PRETTY_NAME="):
+                        return f"{line.split('=', 1)[1].strip().strip(chr(34))} (Linux {u.release})"
+        except OSError:
+            pass
+    return f"{u.sysname} {u.release}"
+
+
+def _run(argv: List[str]) -> str:
+    """stdout + stderr of a short command; empty if it cannot run."""
+    import subprocess
+
+    try:
+        cp = subprocess.run(argv, capture_output=True, text=True, errors="replace", timeout=PROBE_TIMEOUT,
+                            stdin=subprocess.DEVNULL)
+    except (OSError, subprocess.SubprocessError):
+        return ""
+    return cp.stdout + cp.stderr
+
+
+def _flavor(path: str, output: str) -> str:
+    if "BusyBox" in output or os.path.basename(os.path.realpath(path)) == "busybox":
+        return "BusyBox"
+    if "GNU" in output and "not GNU" not in output:
+        return "GNU"
+    return "BSD"
+
+
+def _key(path_var: str) -> List[Any]:
+    """What the cached fingerprint is valid for: PATH and the mtimes of its directories."""
+    mtimes = []
+    for d in path_var.split(os.pathsep):
+        try:
+            mtimes.append(os.stat(d or ".").st_mtime_ns)
+        except OSError:
+            mtimes.append(None)
+    return [FORMAT_VERSION, path_var, os.environ.get("SHELL", ""), mtimes]
+
+
+def build(path_var: Optional[str] = None) -> Dict[str, Any]:
+    """Probe the machine (the slow part; see fingerprint() for the cached form)."""
+    path_var = os.environ.get("PATH", os.defpath) if path_var is None else path_var
+    which = {t: shutil.which(t, path=path_var) for t in set(KEY_TOOLS + FLAVOR_TOOLS + VERSION_TOOLS)}
+    jobs: Dict[Tuple[str, str], List[str]] = {}
+    for t in FLAVOR_TOOLS:
+        if which[t]:
+            jobs[("flavor", t)] = [which[t], "--version"]
+    for t in VERSION_TOOLS:
+        if which[t]:
+            jobs[("version", t)] = [which[t], "--version"]
+    if os.uname().sysname == "Darwin":
+        jobs[("version", "macOS")] = ["sw_vers", "-productVersion"]
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=max(1, len(jobs))) as pool:
+        outputs = dict(zip(jobs, pool.map(_run, jobs.values())))
+
+    flavors = {t: _flavor(which[t], out) for (kind, t), out in outputs.items() if kind == "flavor"}
+    versions = {}
+    for (kind, t), out in outputs.items():
+        m = _VERSION.search(out) if kind == "version" else None
+        if m:
+            versions[t] = m.group(0)
+    os_name = _os_name()
+    if "macOS" in versions:
+        os_name = f"macOS {versions.pop('macOS')} ({os_name})"
+    return {
+        "os": os_name,
+        "arch": os.uname().machine,
+        "shell": os.path.basename(os.environ.get("SHELL", "")) or "unknown",
+        "flavors": flavors,
+        "versions": versions,
+        "tools": sorted(t for t in KEY_TOOLS if which[t]),
+        "missing": [t for t in ASSUMED_TOOLS if not which[t]],
+    }
+
+
+def format_fingerprint(fp: Dict[str, Any]) -> str:
+    """The compact text that goes into the system prompt."""
+    versions = fp["versions"]
+    shell = f"{fp['shell']} {versions[fp['shell']]}" if fp["shell"] in versions else fp["shell"]
+    lines = [f"HOST ENVIRONMENT: {fp['os']}, {fp['arch']}; user shell {shell}, commands run with /bin/sh."]
+    by_flavor: Dict[str, List[str]] = {}
+    for tool, flavor in fp["flavors"].items():
+        by_flavor.setdefault(flavor, []).append(tool)
+    if by_flavor:
+        lines.append("Userland: " + "; ".join(f"{f} {', '.join(sorted(t))}" for f, t in sorted(by_flavor.items()))
+                     + " (use flags these versions support).")
+    if fp["tools"]:
+        tools = (f"{t} {versions[t]}" if t in versions else t for t in fp["tools"])
+        lines.append("Installed: " + ", ".join(tools) + ".")
+    if fp["missing"]:
+        lines.append("NOT installed (do not use): " + ", ".join(fp["missing"]) + ".")
+    return "\n".join(lines)
+
+
+_memo: Dict[str, Any] = {}
+
+
+def fingerprint(cache_dir: Optional[str] = None) -> str:
+    """
+    The formatted fingerprint of this process's environment. Reuses the
+    last one built (in memory, then cache_dir/environment.json) while PATH,
+    $SHELL and the mtimes of PATH's directories are unchanged.
+    """
+    path_var = os.environ.get("PATH", os.defpath)
+    key = _key(path_var)
+    if _memo.get("key") == key:
+        return _memo["text"]
+    path = Path(cache_dir).expanduser() / CACHE_FILE if cache_dir else None
+    fp = None
+    if path is not None:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            if entry.get("key") == key:
+                fp = entry["fingerprint"]
+        except (OSError, ValueError, KeyError, AttributeError):
+            pass
+    if fp is None:
+        fp = build(path_var)
+        if path is not None:
+            try:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                tmp = path.with_suffix(f".{os.getpid()}.tmp")
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump({"key": key, "fingerprint": fp}, f, ensure_ascii=False)
+                os.replace(tmp, path)
+            except OSError:
+                pass
+    text = format_fingerprint(fp)
+    _memo.update(key=key, text=text)
+    return text
@@ -0,0 +1,38 @@
+from __future__ import annotations
+import re
+from dataclasses import dataclass
+from typing import List, Optional, Set
+
+
+@dataclass
+class Example:
+    goal: str
+    commands: List[str]
+    score: float = 0.0
+
+
+def trigrams(text: str) -> Set[str]:
+    """Character trigrams of the lowercased, whitespace-normalized text."""
+    text = " " + re.sub(r"\s+", " ", text.lower()).strip() + " "
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def goal_key(goal: str) -> str:
+    """What makes two goals the same example: lowercased, whitespace-normalized."""
+    return " ".join(goal.lower().split())
+
+
+def format_examples(examples: List[Example], max_chars: int) -> Optional[str]:
+    """
+    Render examples as compact goal/commands blocks, best first, skipping
+    any that would take the total past `max_chars`. Returns None if none fits.
+    """
+    parts: List[str] = []
+    total = 0
+    for ex in examples:
+        block = f"Goal: {ex.goal}\n" + "".join(f"$ {c}\n" for c in ex.commands)
+        if total + len(block) > max_chars:
+            continue  # a shorter, lower-ranked example may still fit
+        parts.append(block)
+        total += len(block)
+    return "\n".join(parts) if parts else None
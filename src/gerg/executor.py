@@ -0,0 +1,321 @@
+from __future__ import annotations
+import codecs
+import os
+import selectors
+import signal
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Deque, Dict, List, Optional, Sequence, TextIO
+
+# Exit code reported when gerg kills a command (same as coreutils `timeout`).
+KILLED_EXIT_CODE = 124
+
+
+class OutputBuffer:
+    """
+    Bounded capture of a text stream: the first `head` chars and a ring of
+    the last `tail` chars. Memory use is fixed no matter how much is written.
+    """
+
+    def __init__(self, head: int = 1000, tail: int = 3000) -> None:
+        self.head_limit = head
+        self.tail_limit = tail
+        self.total = 0
+        self._head: list = []
+        self._head_len = 0
+        self._tail: Deque[str] = deque()
+        self._tail_len = 0
+
+    def write(self, text: str) -> None:
+        if not text:
+            return
+        self.total += len(text)
+        if self._head_len < self.head_limit:
+            take = text[: self.head_limit - self._head_len]
+            self._head.append(take)
+            self._head_len += len(take)
+            text = text[len(take):]
+            if not text:
+                return
+        self._tail.append(text)
+        self._tail_len += len(text)
+        while self._tail and self._tail_len - len(self._tail[0]) >= self.tail_limit:
+            self._tail_len -= len(self._tail.popleft())
+
+    @property
+    def omitted(self) -> int:
+        return max(0, self.total - self.head_limit - self.tail_limit)
+
+    def getvalue(self) -> str:
+        head = "".join(self._head)
+        tail = "".join(self._tail)
+        if len(tail) > self.tail_limit:
+            tail = tail[-self.tail_limit:]
+        if not self.omitted:
+            return head + tail
+        return f"{head}\n...[{self.omitted} chars omitted]...\n{tail}"
+
+
+def kill_process_group(proc: subprocess.Popen, grace: float = 2.0) -> None:
+    """SIGTERM the command's whole process group, then SIGKILL if it lingers."""
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+        try:
+            os.killpg(proc.pid, sig)
+        except (ProcessLookupError, PermissionError):
+            return
+        try:
+            proc.wait(timeout=grace)
+            return
+        except subprocess.TimeoutExpired:
+            continue
+
+
+def kill_note(timed_out: bool, timeout: Optional[float], max_output_bytes: Optional[int]) -> str:
+    """The line appended to stderr when gerg kills a command."""
+    reason = f"timed out after {timeout:g}s" if timed_out else f"exceeded the {max_output_bytes} byte output limit"
+    return f"\n[gerg] command killed: {reason}\n"
+
+
+def change_directory(cmd: str, cwd: Path) -> Optional[subprocess.CompletedProcess]:
+    """
+    Emulate `cd DIR` relative to `cwd`: a CompletedProcess whose `new_cwd`
+    attribute is where later commands should run (failing if DIR is not a
+    directory), or None if `cmd` is not a cd.
+    """
+    if not cmd.lower().startswith("cd "):
+        return None
+    new_dir = Path(cmd[3:].strip()).expanduser()
+    if not new_dir.is_absolute():
+        new_dir = (cwd / new_dir).resolve()
+    if not new_dir.is_dir():
+        return subprocess.CompletedProcess(args=cmd, returncode=1, stdout="", stderr=f"Directory not found: {new_dir}\n")
+    # Report the move in stdout so the model can observe it
+    cp = subprocess.CompletedProcess(args=cmd, returncode=0, stdout=f"(cd) now at: {new_dir}\n", stderr="")
+    cp.new_cwd = new_dir  # type: ignore[attr-defined]
+    return cp
+
+
+def run_streaming(
+    cmd: str,
+    cwd: Path,
+    timeout: Optional[float] = None,
+    max_output_bytes: Optional[int] = None,
+    echo: bool = True,
+    stdout_sink: Optional[TextIO] = None,
+    stderr_sink: Optional[TextIO] = None,
+    head_chars: int = 1000,
+    tail_chars: int = 3000,
+) -> subprocess.CompletedProcess:
+    """
+    Run `cmd` through the shell, echoing stdout/stderr live (when `echo`)
+    while keeping only head/tail OutputBuffers for the caller.
+
+    The command runs in its own process group with stdin closed. It is
+    killed once it runs longer than `timeout` seconds or writes more than
+    `max_output_bytes` in total; the returned CompletedProcess then has
+    returncode KILLED_EXIT_CODE and a note explaining why at the end of
+    stderr. Extra attributes: `timed_out`, `output_limited`, `streamed`.
+    """
+    stdout_sink = stdout_sink or sys.stdout
+    stderr_sink = stderr_sink or sys.stderr
+    start = time.monotonic()
+    proc = subprocess.Popen(
+        cmd,
+        shell=True,
+        cwd=str(cwd),
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        start_new_session=True,
+    )
+    streams = {
+        proc.stdout: (OutputBuffer(head_chars, tail_chars), stdout_sink),
+        proc.stderr: (OutputBuffer(head_chars // 2, tail_chars // 2), stderr_sink),
+    }
+    decoders = {f: codecs.getincrementaldecoder("utf-8")(errors="replace") for f in streams}
+
+    sel = selectors.DefaultSelector()
+    for f in streams:
+        sel.register(f, selectors.EVENT_READ)
+
+    total = 0
+    timed_out = output_limited = False
+    exited_at: Optional[float] = None
+    try:
+        while sel.get_map():
+            now = time.monotonic()
+            if timeout is not None and now - start > timeout:
+                timed_out = True
+                break
+            # Background jobs may keep the pipes open after the shell exits;
+            # give them a moment, then stop waiting for EOF.
+            if exited_at is None and proc.poll() is not None:
+                exited_at = now
+            if exited_at is not None and now - exited_at > 1.0:
+                break
+            for key, _ in sel.select(timeout=0.1):
+                data = os.read(key.fd, 65536)
+                if not data:
+                    sel.unregister(key.fileobj)
+                    continue
+                total += len(data)
+                text = decoders[key.fileobj].decode(data)
+                buf, sink = streams[key.fileobj]
+                buf.write(text)
+                if echo:
+                    sink.write(text)
+                    sink.flush()
+                if max_output_bytes is not None and total > max_output_bytes:
+                    output_limited = True
+                    break
+            if output_limited:
+                break
+    finally:
+        sel.close()
+
+    if timed_out or output_limited:
+        kill_process_group(proc)
+    else:
+        proc.wait()
+    for f in streams:
+        f.close()
+
+    out_buf, err_buf = streams[proc.stdout][0], streams[proc.stderr][0]
+    returncode = proc.returncode
+    if timed_out or output_limited:
+        note = kill_note(timed_out, timeout, max_output_bytes)
+        err_buf.write(note)
+        if echo:
+            stderr_sink.write(note)
+            stderr_sink.flush()
+        returncode = KILLED_EXIT_CODE
+
+    cp = subprocess.CompletedProcess(
+        args=cmd, returncode=returncode, stdout=out_buf.getvalue(), stderr=err_buf.getvalue()
+    )
+    cp.timed_out = timed_out  # type: ignore[attr-defined]
+    cp.output_limited = output_limited  # type: ignore[attr-defined]
+    cp.streamed = echo  # type: ignore[attr-defined]
+    return cp
+
+
+def run_captured(
+    commands: Sequence[str],
+    cwd: Path,
+    timeout: Optional[float] = None,
+    max_output_bytes: Optional[int] = None,
+    max_workers: int = 8,
+) -> List[subprocess.CompletedProcess]:
+    """
+    Run independent `commands` concurrently with run_streaming, capturing
+    their output without echoing it. Returns one CompletedProcess per
+    command, in order.
+    """
+    def run(cmd: str) -> subprocess.CompletedProcess:
+        return run_streaming(cmd, cwd, timeout=timeout, max_output_bytes=max_output_bytes, echo=False)
+
+    if len(commands) <= 1:
+        return [run(cmd) for cmd in commands]
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(commands)))) as pool:
+        return list(pool.map(run, commands))
+
+
+class LabelledSink:
+    """
+    Text sink that prefixes every complete line with a label before writing
+    it to `target` under a shared lock, so output of concurrent commands
+    interleaves line by line instead of mid-line.
+    """
+
+    def __init__(self, label: str, target: TextIO, lock: threading.Lock) -> None:
+        self.label = label
+        self.target = target
+        self.lock = lock
+        self._partial = ""
+
+    def write(self, text: str) -> None:
+        lines = (self._partial + text).split("\n")
+        self._partial = lines.pop()
+        if lines:
+            with self.lock:
+                for line in lines:
+                    self.target.write(f"{self.label} {line}\n")
+
+    def flush(self) -> None:
+        with self.lock:
+            self.target.flush()
+
+    def close(self) -> None:
+        if self._partial:
+            self.write("\n")
+        self.flush()
+
+
+def run_dependency_graph(
+    commands: Sequence[str],
+    depends_on: Sequence[Sequence[int]],
+    cwd: Path,
+    max_workers: int = 4,
+    stdout_sink: Optional[TextIO] = None,
+    stderr_sink: Optional[TextIO] = None,
+) -> List[Optional[int]]:
+    """
+    Run `commands` concurrently as far as `depends_on` allows (per command,
+    1-based indices of commands it needs), using at most `max_workers`
+    processes. Output lines are labelled "[n]". When a command fails, every
+    command that depends on it, directly or transitively, is skipped;
+    independent commands keep running.
+
+    Returns one exit code per command, None for skipped ones.
+    """
+    stdout_sink = stdout_sink or sys.stdout
+    stderr_sink = stderr_sink or sys.stderr
+    lock = threading.Lock()
+    n = len(commands)
+    results: List[Optional[int]] = [None] * n
+    state = ["pending"] * n  # pending | running | ok | failed | skipped
+
+    def run(i: int) -> int:
+        label = f"[{i + 1}]"
+        out = LabelledSink(label, stdout_sink, lock)
+        err = LabelledSink(label, stderr_sink, lock)
+        cp = run_streaming(
+            commands[i], cwd, stdout_sink=out, stderr_sink=err, head_chars=0, tail_chars=0
+        )
+        out.close()
+        err.close()
+        return cp.returncode
+
+    running: Dict[Future, int] = {}
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        while True:
+            for i in range(n):
+                if state[i] != "pending":
+                    continue
+                deps = [d - 1 for d in depends_on[i]]
+                if any(state[d] in ("failed", "skipped") for d in deps):
+                    state[i] = "skipped"
+                    with lock:
+                        stderr_sink.write(f"[{i + 1}] skipped: a command it depends on failed\n")
+                elif all(state[d] == "ok" for d in deps):
+                    state[i] = "running"
+                    with lock:
+                        stdout_sink.write(f"[{i + 1}] \u25b6 {commands[i]}\n")
+                        stdout_sink.flush()
+                    running[pool.submit(run, i)] = i
+            if not running:
+                break
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for fut in done:
+                i = running.pop(fut)
+                results[i] = fut.result()
+                state[i] = "ok" if results[i] == 0 else "failed"
+                if results[i] != 0:
+                    with lock:
+                        stderr_sink.write(f"[{i + 1}] failed with return code {results[i]}\n")
+    return results
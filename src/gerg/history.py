@@ -0,0 +1,422 @@
+from __future__ import annotations
+import json
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from .examples import goal_key, trigrams
+
+HISTORY_DB = "history.sqlite3"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    goal TEXT NOT NULL DEFAULT '',
+    model TEXT,
+    status TEXT,
+    mode TEXT NOT NULL DEFAULT 'plan',
+    cwd TEXT,
+    commands TEXT NOT NULL DEFAULT '',
+    return_code INTEGER,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_ts ON runs(ts);
+CREATE INDEX IF NOT EXISTS runs_goal ON runs(goal);
+CREATE INDEX IF NOT EXISTS runs_model ON runs(model, ts);
+CREATE INDEX IF NOT EXISTS runs_status ON runs(status, ts);
+CREATE INDEX IF NOT EXISTS runs_cwd ON runs(cwd, ts);
+CREATE INDEX IF NOT EXISTS runs_mode ON runs(mode);
+CREATE TABLE IF NOT EXISTS imports (
+    path TEXT PRIMARY KEY,
+    offset INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS examples (
+    id INTEGER PRIMARY KEY,
+    goal_key TEXT NOT NULL UNIQUE,
+    run_id INTEGER NOT NULL,
+    ts REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS example_grams (
+    gram TEXT NOT NULL,
+    example INTEGER NOT NULL,
+    PRIMARY KEY (gram, example)
+) WITHOUT ROWID;
+"""
+# PRAGMA user_version once `examples` covers every run recorded before it existed
+_EXAMPLES_VERSION = 1
+
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS runs_fts USING fts5(
+    goal, commands, content='runs', content_rowid='id'
+);
+CREATE TRIGGER IF NOT EXISTS runs_ai AFTER INSERT ON runs BEGIN
+    INSERT INTO runs_fts(rowid, goal, commands) VALUES (new.id, new.goal, new.commands);
+END;
+CREATE TRIGGER IF NOT EXISTS runs_ad AFTER DELETE ON runs BEGIN
+    INSERT INTO runs_fts(runs_fts, rowid, goal, commands)
+    VALUES ('delete', old.id, old.goal, old.commands);
+END;
+"""
+
+_COLUMNS = ("id", "ts", "goal", "model", "status", "mode", "cwd", "commands", "return_code")
+_SELECT = ", ".join(f"runs.{c}" for c in _COLUMNS)
+
+
+def commands_of(record: Dict[str, Any]) -> List[str]:
+    """Commands of a history record: the plan's, or each think step's."""
+    plan = record.get("plan")
+    if isinstance(plan, dict) and isinstance(plan.get("commands"), list):
+        return [str(c) for c in plan["commands"]]
+    steps = record.get("steps")
+    if isinstance(steps, list):
+        return [str(s.get("command", "")) for s in steps if isinstance(s, dict)]
+    return []
+
+
+def _row(record: Dict[str, Any]) -> tuple:
+    rc = record.get("return_code")
+    return (
+        float(record.get("ts") or time.time()),
+        str(record.get("goal") or ""),
+        record.get("model"),
+        record.get("status"),
+        str(record.get("mode") or "plan"),
+        record.get("cwd"),
+        "\n".join(commands_of(record)),
+        rc if isinstance(rc, int) and not isinstance(rc, bool) else None,
+        json.dumps(record, ensure_ascii=False),
+    )
+
+
+def _fts_query(text: str) -> str:
+    """Turn free text into an FTS5 query: every word must match, the last as a prefix."""
+    words = [w.replace('"', '""') for w in text.split()]
+    if not words:
+        return '""'
+    return " ".join(f'"{w}"' for w in words[:-1]) + (" " if len(words) > 1 else "") + f'"{words[-1]}"*'
+
+
+class HistoryStore:
+    """
+    All runs in one SQLite database (`history_dir/history.sqlite3`, WAL
+    mode) with indexes on time, goal, model, status, mode and cwd, and an FTS5
+    index over goals and commands (plain LIKE search if the SQLite build has
+    no FTS5). The full record is kept as JSON next to the indexed columns.
+
+    Goals of successful runs also go into a character-trigram index
+    (`examples`, one row per distinct goal pointing at its newest run, and
+    `example_grams`, its postings), kept up to date by add(), which
+    similar_goals() queries for few-shot examples.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(self.path), timeout=10, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        with self._db:
+            self._db.executescript(_SCHEMA)
+            try:
+                self._db.executescript(_FTS_SCHEMA)
+                self.has_fts = True
+            except sqlite3.OperationalError:
+                self.has_fts = False
+            if self._db.execute("PRAGMA user_version").fetchone()[0] < _EXAMPLES_VERSION:
+                rows = self._db.execute(
+                    "SELECT id, ts, goal FROM runs WHERE status = 'success' AND commands != ''"
+                )
+                self._index_examples([tuple(r) for r in rows])
+                self._db.execute(f"PRAGMA user_version = {_EXAMPLES_VERSION}")
+
+    @classmethod
+    def open(cls, history_dir: str) -> "HistoryStore":
+        return cls(Path(history_dir).expanduser() / HISTORY_DB)
+
+    def close(self) -> None:
+        self._db.close()
+
+    def add(self, records: Iterable[Dict[str, Any]]) -> int:
+        """Insert records in one transaction; returns how many."""
+        rows = [_row(r) for r in records]
+        successes = []
+        with self._db:
+            for row in rows:
+                cur = self._db.execute(
+                    "INSERT INTO runs (ts, goal, model, status, mode, cwd, commands, return_code, record)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    row,
+                )
+                if row[3] == "success" and row[6]:
+                    successes.append((cur.lastrowid, row[0], row[1]))
+            self._index_examples(successes)
+        return len(rows)
+
+    def _index_examples(self, runs: Sequence[Tuple[int, float, str]]) -> None:
+        """Add (run id, ts, goal) of successful runs to the trigram index; the newest run per goal wins."""
+        db = self._db
+        for run_id, ts, goal in runs:
+            key = goal_key(goal)
+            if not key:
+                continue
+            row = db.execute("SELECT id, ts FROM examples WHERE goal_key = ?", (key,)).fetchone()
+            if row is None:
+                grams = trigrams(key)
+                cur = db.execute(
+                    "INSERT INTO examples (goal_key, run_id, ts, size) VALUES (?, ?, ?, ?)",
+                    (key, run_id, ts, len(grams)),
+                )
+                db.executemany(
+                    "INSERT OR IGNORE INTO example_grams (gram, example) VALUES (?, ?)",
+                    ((g, cur.lastrowid) for g in grams),
+                )
+            elif ts >= row["ts"]:
+                db.execute("UPDATE examples SET run_id = ?, ts = ? WHERE id = ?", (run_id, ts, row["id"]))
+
+    @staticmethod
+    def _as_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        out = dict(row)
+        out["commands"] = out["commands"].split("\n") if out["commands"] else []
+        return out
+
+    def last(
+        self,
+        n: int = 10,
+        status: Optional[str] = None,
+        model: Optional[str] = None,
+        cwd: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """The `n` most recent runs, newest first, optionally filtered."""
+        where, params = [], []  # type: List[str], List[Any]
+        for column, value in (("status", status), ("model", model), ("cwd", cwd)):
+            if value is not None:
+                where.append(f"{column} = ?")
+                params.append(value)
+        sql = f"SELECT {_SELECT} FROM runs"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY ts DESC, id DESC LIMIT ?"
+        return [self._as_dict(r) for r in self._db.execute(sql, params + [n])]
+
+    def search(self, text: str, limit: int = 20, status: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Runs whose goal or commands contain every word of `text`, best match first."""
+        params: List[Any]
+        if self.has_fts:
+            sql = (
+                f"SELECT {_SELECT} FROM runs_fts"
+                " JOIN runs ON runs.id = runs_fts.rowid WHERE runs_fts MATCH ?"
+            )
+            params = [_fts_query(text)]
+        else:
+            sql = f"SELECT {_SELECT} FROM runs WHERE 1"
+            params = []
+            for word in text.split():
+                sql += " AND (goal LIKE ? OR commands LIKE ?)"
+                params += [f"%{word}%"] * 2
+        if status is not None:
+            sql += " AND status = ?"
+            params.append(status)
+        sql += " ORDER BY rank, ts DESC LIMIT ?" if self.has_fts else " ORDER BY ts DESC LIMIT ?"
+        return [self._as_dict(r) for r in self._db.execute(sql, params + [limit])]
+
+    def similar_goals(self, goal: str, k: int = 3, min_score: float = 0.25) -> List[Dict[str, Any]]:
+        """
+        Goal, commands and score of up to `k` successful runs whose goals are
+        most similar to `goal` by Jaccard overlap of trigram sets, which
+        tolerates typos and word order ("pdfs in Downloads" ~ "list downloads
+        pdf"). Scores are at least `min_score`; ties go to the newer run.
+        """
+        grams = sorted(trigrams(goal))
+        if not grams:
+            return []
+        rows = self._db.execute(
+            "SELECT runs.goal, runs.commands, hits.score FROM ("
+            "  SELECT e.run_id, e.ts, CAST(shared.n AS REAL) / (? + e.size - shared.n) AS score FROM ("
+            "    SELECT example, COUNT(*) AS n FROM example_grams"
+            f"    WHERE gram IN ({', '.join('?' * len(grams))}) GROUP BY example"
+            "  ) AS shared JOIN examples AS e ON e.id = shared.example"
+            ") AS hits JOIN runs ON runs.id = hits.run_id"
+            " WHERE hits.score >= ? ORDER BY hits.score DESC, hits.ts DESC LIMIT ?",
+            (len(grams), *grams, min_score, k),
+        )
+        return [self._as_dict(r) for r in rows]
+
+    def record(self, run_id: int) -> Optional[Dict[str, Any]]:
+        row = self._db.execute("SELECT record FROM runs WHERE id = ?", (run_id,)).fetchone()
+        return json.loads(row["record"]) if row else None
+
+    def stats(self) -> Dict[str, Any]:
+        db = self._db
+        # Separate queries so MIN/MAX are answered from the ts index
+        total = db.execute("SELECT COUNT(*) FROM runs").fetchone()[0]
+        first = db.execute("SELECT MIN(ts) FROM runs").fetchone()[0]
+        last = db.execute("SELECT MAX(ts) FROM runs").fetchone()[0]
+
+        def grouped(column: str, limit: int = 10) -> Dict[str, int]:
+            rows = db.execute(
+                f"SELECT {column}, COUNT(*) AS n FROM runs GROUP BY {column} ORDER BY n DESC LIMIT ?",
+                (limit,),
+            )
+            return {str(r[0]): r[1] for r in rows}
+
+        # Think-mode effort, split by whether past runs were shown as examples
+        think: Dict[str, Any] = {}
+        try:
+            rows = db.execute(
+                "SELECT COALESCE(json_extract(record, '$.few_shot'), 0) > 0 AS with_examples,"
+                " COUNT(*), AVG(json_extract(record, '$.steps_to_done')),"
+                " AVG(json_extract(record, '$.failed_steps')), AVG(status = 'success')"
+                " FROM runs WHERE mode = 'think' GROUP BY with_examples"
+            )
+            for with_examples, runs, steps, failed, ok in rows:
+                think["with_examples" if with_examples else "without_examples"] = {
+                    "runs": runs,
+                    "avg_steps_to_done": round(steps, 2) if steps is not None else None,
+                    "avg_failed_steps": round(failed, 2) if failed is not None else None,
+                    "success_rate": round(ok, 3),
+                }
+        except sqlite3.OperationalError:
+            pass  # SQLite without JSON functions
+
+        # Model cascade: latency per tier and how often each tier hands off
+        cascade: Dict[str, Any] = {}
+        try:
+            routed = "FROM runs, json_each(runs.record, '$.routing.{}') AS x WHERE instr(runs.record, '\"routing\"')"
+            runs, escalated = db.execute(
+                "SELECT COUNT(*), SUM(json_array_length(record, '$.routing.escalations') > 0)"
+                " FROM runs WHERE instr(record, '\"routing\"')"
+            ).fetchone()
+            tiers: Dict[str, Dict[str, Any]] = {}
+            for model, attempts, avg_ms in db.execute(
+                "SELECT json_extract(x.value, '$.model'), COUNT(*), AVG(json_extract(x.value, '$.ms')) "
+                + routed.format("attempts") + " GROUP BY 1"
+            ):
+                tiers[model] = {"attempts": attempts, "avg_ms": round(avg_ms or 0, 1), "escalations": 0}
+            for model, n in db.execute(
+                "SELECT json_extract(x.value, '$.from'), COUNT(*) " + routed.format("escalations") + " GROUP BY 1"
+            ):
+                tiers.setdefault(model, {"attempts": 0, "avg_ms": None, "escalations": 0})["escalations"] = n
+            for t in tiers.values():
+                t["escalation_rate"] = round(t["escalations"] / t["attempts"], 3) if t["attempts"] else None
+            if runs:
+                cascade = {"runs": runs, "escalated_runs": escalated or 0, "tiers": tiers}
+        except sqlite3.OperationalError:
+            pass
+
+        return {
+            "runs": total,
+            "first_ts": first,
+            "last_ts": last,
+            "last_24h": db.execute("SELECT COUNT(*) FROM runs WHERE ts >= ?", (time.time() - 86400,)).fetchone()[0],
+            "by_status": grouped("status"),
+            "by_mode": grouped("mode"),
+            "by_model": grouped("model"),
+            "think": think,
+            "cascade": cascade,
+        }
+
+    def import_jsonl(self, path: Path) -> int:
+        """
+        Import a legacy `.gerg_history.jsonl`. Only lines added since the
+        last import of the same file are read; records without a timestamp
+        get the file's mtime and without a cwd the file's directory.
+        Unparseable lines are skipped. Returns the number of runs added.
+        """
+        path = Path(path).expanduser().resolve()
+        row = self._db.execute("SELECT offset FROM imports WHERE path = ?", (str(path),)).fetchone()
+        offset = row["offset"] if row else 0
+        if offset > path.stat().st_size:
+            offset = 0  # the file was truncated or replaced
+        mtime = path.stat().st_mtime
+        records = []
+        with open(path, "rb") as f:
+            f.seek(offset)
+            for raw in f:
+                if not raw.endswith(b"\n"):
+                    break  # a line still being written; pick it up next time
+                offset += len(raw)
+                try:
+                    record = json.loads(raw)
+                except ValueError:
+                    continue
+                if isinstance(record, dict):
+                    record.setdefault("ts", mtime)
+                    record.setdefault("cwd", str(path.parent))
+                    records.append(record)
+        added = self.add(records)
+        with self._db:
+            self._db.execute(
+                "INSERT INTO imports (path, offset) VALUES (?, ?)"
+                " ON CONFLICT(path) DO UPDATE SET offset = excluded.offset",
+                (str(path), offset),
+            )
+        return added
+
+
+class HistoryLog:
+    """
+    Fire-and-forget history writer. write() only stamps the record and puts
+    it on a queue; a daemon thread opens the store on first use and inserts
+    whatever has queued up in one transaction. close() (registered with
+    atexit by the CLI) drains the queue before exit. Failures are reported
+    once on stderr and never interrupt a run.
+    """
+
+    def __init__(self, history_dir: str) -> None:
+        self.history_dir = history_dir
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._warned = False
+
+    def write(self, run_dir: Path, record: Dict[str, Any]) -> None:
+        record = dict(record)
+        record.setdefault("ts", time.time())
+        record.setdefault("cwd", str(run_dir))
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="gerg-history", daemon=True)
+                self._thread.start()
+        self._queue.put(record)
+
+    def _run(self) -> None:
+        store: Optional[HistoryStore] = None
+        while True:
+            item = self._queue.get()
+            batch = [item]
+            while not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            records = [r for r in batch if r is not None]
+            try:
+                if records:
+                    store = store or HistoryStore.open(self.history_dir)
+                    store.add(records)
+            except (OSError, sqlite3.Error) as e:
+                if not self._warned:
+                    self._warned = True
+                    print(f"[gerg] could not write history: {e}", file=sys.stderr)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if None in batch:
+                if store is not None:
+                    store.close()
+                return
+
+    def flush(self) -> None:
+        """Block until everything written so far is stored."""
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self, timeout: float = 5.0) -> None:
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None and thread.is_alive():
+            self._queue.put(None)
+            thread.join(timeout)
@@ -0,0 +1,525 @@
+from __future__ import annotations
+import hashlib
+import heapq
+import json
+import math
+import mmap
+import operator
+import os
+import re
+from array import array
+from collections import Counter
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+# Takes a batch of texts, returns one embedding per text (see agent.request_embeddings).
+EmbedFn = Callable[[List[str]], List[List[float]]]
+Query = Union[str, Sequence[str]]
+
+# File types considered text documentation for RAG.
+RAG_EXTENSIONS = {".md", ".txt", ".log", ".json", ".cfg", ".ini", ".toml", ".yml", ".yaml"}
+
+CHUNK_CHARS = 1200
+INDEX_VERSION = 1
+
+# Files up to this size are ingested whole. Larger ones only through a head
+# window and a tail window (the most recent entries of a log), read with
+# seeks, so memory stays bounded however big the files get.
+WHOLE_FILE_BYTES = 2 * 1024 * 1024
+HEAD_BYTES = 256 * 1024
+TAIL_BYTES = 768 * 1024
+# Bytes sniffed to tell text from binary: a NUL byte, or too many control
+# characters, marks a file as binary and it is skipped without decoding.
+SNIFF_BYTES = 8192
+BINARY_CONTROL_RATIO = 0.1
+_TEXT_CONTROLS = frozenset(b"\t\n\r\f\b\x1b")
+
+_TOKEN_RE = re.compile(r"[a-z0-9_]{2,}")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+def chunk_text(text: str, size: int = CHUNK_CHARS) -> List[str]:
+    """
+    Split `text` into chunks of at most `size` chars, preferring paragraph
+    and then line boundaries so chunks stay readable.
+    """
+    chunks: List[str] = []
+    cur = ""
+    for para in re.split(r"\n\s*\n", text):
+        para = para.strip("\n")
+        if not para.strip():
+            continue
+        while len(para) > size:
+            cut = para.rfind("\n", 0, size)
+            if cut <= 0:
+                cut = size
+            if cur:
+                chunks.append(cur)
+                cur = ""
+            chunks.append(para[:cut])
+            para = para[cut:].lstrip("\n")
+        if cur and len(cur) + 2 + len(para) > size:
+            chunks.append(cur)
+            cur = ""
+        cur = f"{cur}\n\n{para}" if cur else para
+    if cur:
+        chunks.append(cur)
+    return chunks
+
+
+def looks_binary(sample: bytes) -> bool:
+    if b"\0" in sample:
+        return True
+    controls = sum(1 for b in sample if b < 32 and b not in _TEXT_CONTROLS)
+    return controls > len(sample) * BINARY_CONTROL_RATIO
+
+
+def read_windows(
+    path: Path, head_bytes: int = HEAD_BYTES, tail_bytes: int = TAIL_BYTES, whole_bytes: int = WHOLE_FILE_BYTES
+) -> Optional[List[str]]:
+    """
+    The text of `path` as one segment, or for files over `whole_bytes` as
+    two: its first `head_bytes` and last `tail_bytes`, cut at line breaks.
+    Only those windows are read. Returns None for binary or unreadable
+    files.
+    """
+    try:
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            head = f.read(min(size, whole_bytes if size <= whole_bytes else head_bytes))
+            if looks_binary(head[:SNIFF_BYTES]):
+                return None
+            if size <= whole_bytes:
+                return [head.decode("utf-8", errors="ignore")]
+            segments = [head[: head.rfind(b"\n") + 1 or len(head)].decode("utf-8", errors="ignore")]
+            if tail_bytes > 0:
+                f.seek(max(len(head), size - tail_bytes))
+                tail = f.read(tail_bytes)
+                segments.append(tail[tail.find(b"\n") + 1:].decode("utf-8", errors="ignore"))
+            return segments
+    except OSError:
+        return None
+
+
+_SKIPPED = "\n[... skipped to the end of the file ...]\n"
+
+
+def read_text_window(path: Path, max_chars: Optional[int] = None) -> Optional[str]:
+    """
+    read_windows() joined with a note of what was skipped. With `max_chars`,
+    only about that much is read: from the start, or split between head and
+    tail for .log files.
+    """
+    if max_chars is None:
+        segments = read_windows(path)
+    elif path.suffix.lower() == ".log":
+        room = max(0, max_chars - len(_SKIPPED))
+        segments = read_windows(path, room // 4, room - room // 4, max_chars)
+    else:
+        segments = read_windows(path, max_chars, 0, max_chars)
+    if segments is None:
+        return None
+    return _SKIPPED.join(segments)
+
+
+def iter_rag_files(base: Path) -> Iterator[Path]:
+    """Yield RAG candidate files below `base` in a stable (sorted) order."""
+    for root, dirs, files in os.walk(base):
+        dirs.sort()
+        for name in sorted(files):
+            if Path(name).suffix.lower() in RAG_EXTENSIONS:
+                yield Path(root) / name
+
+
+def _resolve_base(rag_dir: Optional[str]) -> Optional[Path]:
+    if not rag_dir:
+        return None
+    base = Path(rag_dir).expanduser().resolve()
+    return base if base.is_dir() else None
+
+
+def _index_stem(base: Path, history_dir: str) -> Path:
+    """Where the indexes for `base` live: history_dir/rag/<hash of base path>."""
+    digest = hashlib.sha1(str(base).encode("utf-8")).hexdigest()[:16]
+    return Path(history_dir).expanduser() / "rag" / digest
+
+
+def _format_context(
+    hits: Sequence[Tuple[float, str, str]], max_chars: int, skip: Optional[str] = None
+) -> Optional[str]:
+    pieces: List[str] = []
+    total = 0
+    for _, rel, text in hits:
+        if skip and text in skip:
+            continue
+        piece = f"\n# File: {rel}\n{text}\n"
+        if total + len(piece) > max_chars:
+            piece = piece[: max_chars - total]
+        pieces.append(piece)
+        total += len(piece)
+        if total >= max_chars:
+            break
+    return "".join(pieces) if pieces else None
+
+
+class RagIndex:
+    """
+    Persistent BM25 index over the text files below one directory.
+
+    The index lives in a JSON file (see `open`) that records each file's
+    mtime and size, so `refresh` only re-reads files that changed since the
+    last run. `context` returns the best matching chunks for a query packed
+    into a character budget.
+    """
+
+    k1 = 1.5
+    b = 0.75
+
+    def __init__(self, base: Path, index_path: Path) -> None:
+        self.base = base
+        self.index_path = index_path
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self._postings: Optional[Dict[str, List[Tuple[int, int]]]] = None
+        self._chunks: List[Tuple[str, int, str, int]] = []  # (file, n, text, length)
+        self._load()
+
+    @classmethod
+    def open(cls, rag_dir: Optional[str], history_dir: str) -> Optional["RagIndex"]:
+        """Open (and refresh) the index for `rag_dir`, stored under history_dir/rag."""
+        base = _resolve_base(rag_dir)
+        if base is None:
+            return None
+        index = cls(base, _index_stem(base, history_dir).with_suffix(".json"))
+        index.refresh()
+        return index
+
+    def _load(self) -> None:
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("version") == INDEX_VERSION and data.get("base") == str(self.base):
+            self.files = data.get("files", {})
+
+    def _save(self) -> None:
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.index_path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(
+                {"version": INDEX_VERSION, "base": str(self.base), "files": self.files},
+                f,
+                ensure_ascii=False,
+            )
+        os.replace(tmp, self.index_path)
+
+    def refresh(self) -> bool:
+        """Re-ingest new or changed files and drop deleted ones. Returns True if anything changed."""
+        seen = set()
+        changed = False
+        for path in iter_rag_files(self.base):
+            rel = str(path.relative_to(self.base))
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            seen.add(rel)
+            entry = self.files.get(rel)
+            if entry and entry["mtime"] == st.st_mtime_ns and entry["size"] == st.st_size:
+                continue
+            segments = read_windows(path)
+            if segments is None:
+                continue
+            self.files[rel] = {
+                "mtime": st.st_mtime_ns,
+                "size": st.st_size,
+                "chunks": [
+                    {"text": c, "tf": dict(Counter(tokenize(c)))} for text in segments for c in chunk_text(text)
+                ],
+            }
+            changed = True
+        for rel in [r for r in self.files if r not in seen]:
+            del self.files[rel]
+            changed = True
+        if changed:
+            self._postings = None
+            try:
+                self._save()
+            except OSError:
+                pass  # an unwritable history dir only costs us the re-scan next run
+        return changed
+
+    def _build_postings(self) -> Dict[str, List[Tuple[int, int]]]:
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        self._chunks = []
+        for rel in sorted(self.files):
+            for n, chunk in enumerate(self.files[rel]["chunks"]):
+                cid = len(self._chunks)
+                tf = chunk["tf"]
+                self._chunks.append((rel, n, chunk["text"], sum(tf.values())))
+                for term, count in tf.items():
+                    postings.setdefault(term, []).append((cid, count))
+        self._postings = postings
+        return postings
+
+    def search(self, query: str, k: int = 8) -> List[Tuple[float, str, str]]:
+        """Return up to `k` (score, file, chunk_text) tuples ranked by BM25."""
+        postings = self._postings if self._postings is not None else self._build_postings()
+        n_chunks = len(self._chunks)
+        if not n_chunks:
+            return []
+        avgdl = sum(c[3] for c in self._chunks) / n_chunks or 1.0
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            plist = postings.get(term)
+            if not plist:
+                continue
+            idf = math.log(1 + (n_chunks - len(plist) + 0.5) / (len(plist) + 0.5))
+            for cid, tf in plist:
+                dl = self._chunks[cid][3]
+                denom = tf + self.k1 * (1 - self.b + self.b * dl / avgdl)
+                scores[cid] = scores.get(cid, 0.0) + idf * tf * (self.k1 + 1) / denom
+        best = sorted(scores.items(), key=lambda kv: (-kv[1], kv[0]))[:k]
+        return [(score, self._chunks[cid][0], self._chunks[cid][2]) for cid, score in best]
+
+    def context(
+        self, query: Query, max_chars: int = 20000, k: int = 8, skip: Optional[str] = None
+    ) -> Optional[str]:
+        """
+        Top-k chunks for `query` formatted like _read_rag_context, within
+        `max_chars`. Chunks already contained in `skip` are left out. When no
+        chunk shares a term with the query, the leading chunks of the files
+        (in path order) fill the budget instead, as _read_rag_context would.
+        """
+        if not isinstance(query, str):
+            query = "\n".join(query)
+        hits = self.search(query, k=k)
+        if not hits:
+            hits = [(0.0, rel, text) for rel, _, text, _ in self._chunks]
+        return _format_context(hits, max_chars, skip)
+
+
+def _normalized(vec: Sequence[float]) -> array:
+    norm = math.sqrt(sum(x * x for x in vec)) or 1.0
+    return array("f", (x / norm for x in vec))
+
+
+def _text_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+class EmbeddingIndex:
+    """
+    Semantic RAG engine backed by Ollama embeddings.
+
+    Chunk vectors are L2-normalised and stored as one float32 row per chunk in
+    `vectors.f32`, which is memory-mapped read-only: opening the index costs
+    nothing, pages are shared between processes through the page cache, and
+    the matrix never has to fit in RAM. `manifest.json` maps files to their
+    chunks and rows. `refresh` only embeds chunks whose text is new, in
+    multi-input batches of `batch_size`.
+    """
+
+    batch_size = 32
+
+    def __init__(self, base: Path, root: Path, model: str, embed: EmbedFn) -> None:
+        self.base = base
+        self.root = root
+        self.model = model
+        self.embed = embed
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.dim = 0
+        self._rows: List[Tuple[str, str]] = []  # (file, chunk text) per matrix row
+        self._mm: Optional[mmap.mmap] = None
+        self._load()
+
+    @classmethod
+    def open(
+        cls, rag_dir: Optional[str], history_dir: str, model: str, embed: EmbedFn
+    ) -> Optional["EmbeddingIndex"]:
+        base = _resolve_base(rag_dir)
+        if base is None:
+            return None
+        index = cls(base, _index_stem(base, history_dir).with_suffix(".embed"), model, embed)
+        index.refresh()
+        return index
+
+    @property
+    def _manifest_path(self) -> Path:
+        return self.root / "manifest.json"
+
+    @property
+    def _vectors_path(self) -> Path:
+        return self.root / "vectors.f32"
+
+    def _load(self) -> None:
+        try:
+            with open(self._manifest_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if (
+            data.get("version") != INDEX_VERSION
+            or data.get("base") != str(self.base)
+            or data.get("model") != self.model
+        ):
+            return
+        self.files = data.get("files", {})
+        self.dim = int(data.get("dim", 0))
+        self._index_rows()
+        self._map()
+        if self._rows and self._mm is None:
+            # Manifest and matrix disagree: start over rather than serve garbage
+            self.files, self._rows, self.dim = {}, [], 0
+
+    def _index_rows(self) -> None:
+        rows: List[Tuple[int, str, str]] = []
+        for rel, entry in self.files.items():
+            for chunk in entry["chunks"]:
+                rows.append((chunk["row"], rel, chunk["text"]))
+        rows.sort()
+        self._rows = [(rel, text) for _, rel, text in rows]
+
+    def _map(self) -> None:
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        expected = len(self._rows) * self.dim * 4
+        try:
+            with open(self._vectors_path, "rb") as f:
+                if expected and os.fstat(f.fileno()).st_size == expected:
+                    self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except OSError:
+            pass
+
+    def close(self) -> None:
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+
+    def refresh(self) -> bool:
+        """Bring the index up to date with the tree. Returns True if anything changed."""
+        new_files: Dict[str, Dict[str, Any]] = {}
+        changed = False
+        for path in iter_rag_files(self.base):
+            rel = str(path.relative_to(self.base))
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            entry = self.files.get(rel)
+            if entry and entry["mtime"] == st.st_mtime_ns and entry["size"] == st.st_size:
+                new_files[rel] = entry
+                continue
+            segments = read_windows(path)
+            if segments is None:
+                continue
+            new_files[rel] = {
+                "mtime": st.st_mtime_ns,
+                "size": st.st_size,
+                "chunks": [{"text": c} for text in segments for c in chunk_text(text)],
+            }
+            changed = True
+        if not changed and set(new_files) == set(self.files):
+            return False
+
+        # Vectors we already have, keyed by chunk text
+        known: Dict[str, int] = {}
+        for entry in self.files.values():
+            for chunk in entry["chunks"]:
+                known[_text_hash(chunk["text"])] = chunk["row"]
+
+        order = [(rel, chunk) for rel in sorted(new_files) for chunk in new_files[rel]["chunks"]]
+        texts = {_text_hash(c["text"]): c["text"] for _, c in order}
+        todo = [h for h in texts if h not in known]
+        fresh: Dict[str, array] = {}
+        for i in range(0, len(todo), self.batch_size):
+            batch = todo[i : i + self.batch_size]
+            for h, vec in zip(batch, self.embed([texts[h] for h in batch])):
+                fresh[h] = _normalized(vec)
+                if not self.dim:
+                    self.dim = len(vec)
+                elif len(vec) != self.dim:
+                    raise ValueError("Embedding dimension changed; was the embed model switched?")
+
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = self._vectors_path.with_suffix(f".{os.getpid()}.tmp")
+        row_bytes = self.dim * 4
+        with open(tmp, "wb") as out:
+            for row, (_, chunk) in enumerate(order):
+                h = _text_hash(chunk["text"])
+                if h in fresh:
+                    out.write(fresh[h].tobytes())
+                else:
+                    old = known[h]
+                    out.write(self._mm[old * row_bytes : (old + 1) * row_bytes])  # type: ignore[index]
+                chunk["row"] = row
+        self.close()
+        os.replace(tmp, self._vectors_path)
+
+        self.files = new_files
+        tmp = self._manifest_path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "version": INDEX_VERSION,
+                    "base": str(self.base),
+                    "model": self.model,
+                    "dim": self.dim,
+                    "files": self.files,
+                },
+                f,
+                ensure_ascii=False,
+            )
+        os.replace(tmp, self._manifest_path)
+        self._index_rows()
+        self._map()
+        return True
+
+    def search(self, queries: Query, k: int = 8) -> List[Tuple[float, str, str]]:
+        """
+        Cosine top-k over all chunks. Several queries are embedded in one
+        request and scored together; a chunk's score is its best match.
+        """
+        if isinstance(queries, str):
+            queries = [queries]
+        queries = [q for q in queries if q.strip()]
+        if not queries or self._mm is None or not self._rows:
+            return []
+        qvecs = [_normalized(v) for v in self.embed(list(queries))]
+        n = len(self._rows)
+        k = min(k, n)
+
+        np = _numpy()
+        if np is not None:
+            matrix = np.frombuffer(self._mm, dtype=np.float32).reshape(n, self.dim)
+            scores = (matrix @ np.asarray(qvecs, dtype=np.float32).T).max(axis=1)
+            top = np.argpartition(-scores, k - 1)[:k]
+            best = sorted(((float(scores[i]), int(i)) for i in top), key=lambda t: (-t[0], t[1]))
+        else:
+            view = memoryview(self._mm).cast("f")
+            dim = self.dim
+
+            def score(row: int) -> float:
+                vec = view[row * dim : (row + 1) * dim]
+                return max(sum(map(operator.mul, vec, q)) for q in qvecs)
+
+            best = heapq.nlargest(k, ((score(r), r) for r in range(n)), key=lambda t: (t[0], -t[1]))
+            view.release()
+        return [(s, self._rows[i][0], self._rows[i][1]) for s, i in best]
+
+    def context(
+        self, query: Query, max_chars: int = 20000, k: int = 8, skip: Optional[str] = None
+    ) -> Optional[str]:
+        return _format_context(self.search(query, k=k), max_chars, skip)
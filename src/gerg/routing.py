@@ -0,0 +1,99 @@
+from __future__ import annotations
+import time
+from typing import Any, Callable, Dict, List, Optional, TypeVar
+
+from . import timing
+
+T = TypeVar("T")
+
+# Goals longer than this many words count as a sign of a harder task.
+LONG_GOAL_WORDS = 12
+
+
+def start_tier(tiers: int, goal: str, think: bool = False, rag: bool = False) -> int:
+    """
+    Cheap guess at how hard a goal is: one point each for a long goal,
+    --think and RAG context. A single point still starts on the smallest
+    model; every further point skips a tier.
+    """
+    score = (len(goal.split()) > LONG_GOAL_WORDS) + think + rag
+    return max(0, min(tiers - 1, score - 1))
+
+
+class Router:
+    """
+    The model cascade of one run (smallest model first). call() asks the
+    current tier and moves up when the reply stays invalid after repair or
+    is not accepted (e.g. hits is_risky); escalate() moves up for other
+    reasons, such as think steps that keep failing. Escalation sticks for
+    the rest of the run. Every attempt is recorded for record().
+    """
+
+    def __init__(
+        self,
+        models: List[str],
+        start: int = 0,
+        on_escalate: Optional[Callable[[str, str, str], None]] = None,
+    ) -> None:
+        if not models:
+            raise ValueError("a model cascade needs at least one model")
+        self.models = list(models)
+        self.start = self.tier = max(0, min(start, len(self.models) - 1))
+        self.on_escalate = on_escalate
+        self.attempts: List[Dict[str, Any]] = []
+        self.escalations: List[Dict[str, str]] = []
+
+    @property
+    def model(self) -> str:
+        return self.models[self.tier]
+
+    def escalate(self, reason: str) -> bool:
+        """Move to the next tier; False if already on the last one."""
+        if self.tier + 1 >= len(self.models):
+            return False
+        before = self.model
+        self.tier += 1
+        self.escalations.append({"from": before, "to": self.model, "reason": reason})
+        if self.on_escalate is not None:
+            self.on_escalate(before, self.model, reason)
+        return True
+
+    def call(self, request: Callable[[str], T], accept: Callable[[T], bool] = lambda _: True) -> T:
+        """
+        `request(model)` on the current tier, escalating until a reply is
+        accepted. On the last tier an unaccepted reply is returned (the
+        caller's own checks decide) and an invalid one re-raises.
+        """
+        while True:
+            model = self.model
+            start = time.perf_counter()
+            with timing.span("tier", model=model, tier=self.tier):
+                try:
+                    result = request(model)
+                except ValueError:  # invalid even after the repair turn
+                    self._attempt(model, start, "invalid")
+                    if self.escalate("invalid reply"):
+                        continue
+                    raise
+            ok = accept(result)
+            self._attempt(model, start, "ok" if ok else "rejected")
+            if ok or not self.escalate("rejected reply"):
+                return result
+
+    def _attempt(self, model: str, start: float, outcome: str) -> None:
+        self.attempts.append({
+            "model": model,
+            "tier": self.models.index(model),
+            "ms": round((time.perf_counter() - start) * 1000, 1),
+            "outcome": outcome,
+        })
+
+    def record(self) -> Dict[str, Any]:
+        """Summary for the history record."""
+        return {
+            "models": self.models,
+            "start_tier": self.start,
+            "final_model": self.model,
+            "attempts": self.attempts,
+            "escalations": self.escalations,
+        }
@@ -1,24 +1,304 @@
 from __future__ import annotations
+import os
 import re
+import shlex
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# A shell word, stopping at the operators that end a simple command.
+_WORD = r"[^\s;|&]+"
 
 # Conservative denylist of dangerous shell patterns (exact/regex).
-# Intentionally narrow and readable; expand as needed.
+# Intentionally narrow and readable; expand as needed, or add org rules via
+# policy files (see load_policy_file).
 DENY_PATTERNS = [
-    r"\brm\s+-rf\s*/\b",                 # nuke root
-    r"\brm\s+-rf\s+~/?\b",               # nuke home
+    # rm with a recursive flag anywhere and an absolute or home-relative
+    # operand (/, /usr, ~, ~/Documents, $HOME/...)
+    rf"\brm(?=(?:\s+{_WORD})*?\s+(?:-[a-z]*r|--recursive\b))(?:\s+{_WORD})*?\s+(?:/|~|\$\{{?HOME\b)",
     r"\bmkfs(\.|/|\b)",                  # make filesystem
     r"\bdd\s+if=",                       # raw disk writes
-    r"\b: \(\)\{ :\|:& \};:\b",          # classic fork bomb
+    r":\(\)\s*\{\s*:\s*\|\s*:\s*&\s*\}\s*;\s*:",  # classic fork bomb
     r"\bshutdown\b",
     r"\breboot\b",
     r"\bhalt\b",
     r"\bchown\s+-R\s+root\b",
     r"\bchmod\s+0{3,}\b",
-    r"\bwget\s+.*\|\s*sh\b",             # curl | sh / wget | sh
-    r"\bcurl\s+.*\|\s*sh\b",
+    r"\bwget\s+.*\|\s*(?:sudo\s+)?(?:ba|da|z)?sh\b",  # curl | sh / wget | sh
+    r"\bcurl\s+.*\|\s*(?:sudo\s+)?(?:ba|da|z)?sh\b",
 ]
 
-_COMPILED = [re.compile(p, re.IGNORECASE) for p in DENY_PATTERNS]
+
+@dataclass(frozen=True)
+class Rule:
+    pattern: str
+    description: str = ""
+    source: str = "builtin"
+
+
+BUILTIN_RULES = [Rule(p) for p in DENY_PATTERNS]
+
+# Commands that run another command: name -> options that take a value.
+# Their own options (and, for timeout, the duration) are skipped so rules see
+# the wrapped command.
+_WRAPPERS: Dict[str, frozenset] = {
+    "sudo": frozenset("-u -g -C -D -h -p -r -t -U --user --group --chdir --host --prompt".split()),
+    "doas": frozenset("-u -C".split()),
+    "env": frozenset("-u -C -S --unset --chdir".split()),
+    "xargs": frozenset("-a -d -E -e -I -i -L -l -n -P -s --arg-file --delimiter --max-args --max-procs".split()),
+    "nice": frozenset("-n --adjustment".split()),
+    "ionice": frozenset("-c -n -p".split()),
+    "timeout": frozenset("-k -s --kill-after --signal".split()),
+    "stdbuf": frozenset("-i -o -e".split()),
+    "nohup": frozenset(),
+    "time": frozenset(),
+    "command": frozenset(),
+    "builtin": frozenset(),
+    "exec": frozenset("-a".split()),
+}
+_SHELLS = {"sh", "bash", "dash", "zsh", "ksh"}
+_SEPARATORS = {";", "|", "||", "&&", "&", "|&", "(", ")", ";;"}
+_ASSIGNMENT = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*=")
+
+
+def _strip_wrappers(words: List[str]) -> List[str]:
+    i = 0
+    while i < len(words):
+        if _ASSIGNMENT.match(words[i]):
+            i += 1
+            continue
+        name = os.path.basename(words[i])
+        takes_value = _WRAPPERS.get(name)
+        if takes_value is None:
+            break
+        i += 1
+        while i < len(words) and words[i].startswith("-") and words[i] != "--":
+            i += 2 if words[i] in takes_value else 1
+        if i < len(words) and words[i] == "--":
+            i += 1
+        while name == "env" and i < len(words) and _ASSIGNMENT.match(words[i]):
+            i += 1
+        if name == "timeout" and i < len(words):
+            i += 1  # the duration
+    rest = words[i:]
+    if rest:
+        rest = [os.path.basename(rest[0]) or rest[0]] + rest[1:]
+    return rest
+
+
+def command_views(cmd: str, depth: int = 0) -> List[str]:
+    """
+    Normalized views of `cmd` for rule matching: one per simple command of
+    its pipelines and lists, with quoting removed, `sudo`/`env`/`xargs`/...
+    wrappers stripped and the program reduced to its basename. `sh -c` and
+    `eval` arguments are expanded too. Unparseable input yields no views
+    (the raw string is still matched).
+    """
+    try:
+        lex = shlex.shlex(cmd, posix=True, punctuation_chars=";|&()")
+        lex.whitespace_split = True
+        tokens = list(lex)
+    except ValueError:
+        return []
+
+    segments: List[List[str]] = [[]]
+    for tok in tokens:
+        if tok in _SEPARATORS:
+            segments.append([])
+        else:
+            segments[-1].append(tok)
+
+    views: List[str] = []
+    for seg in segments:
+        words = _strip_wrappers(seg)
+        if not words:
+            continue
+        views.append(" ".join(words))
+        if depth < 3:
+            if words[0] in _SHELLS and "-c" in words[1:-1]:
+                views.extend(command_views(words[words.index("-c") + 1], depth + 1))
+            elif words[0] == "eval":
+                views.extend(command_views(" ".join(words[1:]), depth + 1))
+    return views
+
+
+_KEYWORD = re.compile(r"\\b([A-Za-z0-9_]+)")
+
+
+def _keyword(pattern: str) -> Optional[str]:
+    """
+    The literal word every match of `pattern` must start with, when the
+    pattern begins with \\b followed by word characters and has no
+    top-level alternation; None otherwise.
+    """
+    m = _KEYWORD.match(pattern)
+    if not m:
+        return None
+    word = m.group(1)
+    if pattern[m.end():m.end() + 1] in ("?", "*", "{"):
+        word = word[:-1]  # the last character is optional
+    depth = 0
+    escaped = in_class = False
+    for ch in pattern:
+        if escaped:
+            escaped = False
+        elif ch == "\\":
+            escaped = True
+        elif in_class:
+            in_class = ch != "]"
+        elif ch == "[":
+            in_class = True
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif ch == "|" and depth == 0:
+            return None
+    return word.lower() or None
+
+
+# Rules that cannot share an alternation: backreferences and conditionals
+# (group numbers shift), named groups (names may repeat across rules) and
+# global inline flags such as (?i) (only allowed at the very start).
+_STANDALONE = re.compile(r"\\[1-9]|\(\?P[<=]|\(\?\(|\(\?[aiLmsux]+\)")
+
+# A compiled pattern and the index of its rule (None for a combined
+# alternation, whose matching group names the rule).
+_Matcher = Tuple["re.Pattern[str]", Optional[int]]
+
+
+class PolicyEngine:
+    """
+    Denylist matcher whose cost does not grow with the number of rules.
+
+    Rules that start with a literal word (`\\brm...`, `\\bshutdown\\b`) are
+    grouped by that word and each group is compiled into one alternation;
+    the rest form one more combined pattern that always runs. Rules with
+    backreferences, named groups or global inline flags keep a pattern of
+    their own next to their group's alternation. A command is
+    checked by looking up the words it contains, so only the groups it can
+    possibly match are searched. Every pattern is matched case-insensitively
+    against the raw string and each of its command_views(). Verdicts are
+    memoized per engine.
+    """
+
+    def __init__(self, rules: Iterable[Rule], cache_size: int = 4096) -> None:
+        self.rules: List[Rule] = list(rules)
+        groups: Dict[Optional[str], List[int]] = {}
+        for i, rule in enumerate(self.rules):
+            try:
+                re.compile(rule.pattern)
+            except re.error as e:
+                raise ValueError(f"{rule.source}: invalid rule pattern {rule.pattern!r}: {e}") from e
+            groups.setdefault(_keyword(rule.pattern), []).append(i)
+
+        self._always = self._compile(groups.pop(None, []))
+        self._by_keyword = {kw: self._compile(idx) for kw, idx in groups.items()}
+        self._lengths = sorted({len(kw) for kw in self._by_keyword})
+        self.match = lru_cache(maxsize=cache_size)(self._match)
+
+    def _compile(self, indices: List[int]) -> List[_Matcher]:
+        """
+        One alternation for the rules that can share it, plus one pattern of
+        their own for those that cannot (see _STANDALONE), or when the
+        alternation does not compile.
+        """
+        shared = [i for i in indices if not _STANDALONE.search(self.rules[i].pattern)]
+        alone = [i for i in indices if i not in shared]
+        matchers: List[_Matcher] = []
+        if shared:
+            try:
+                matchers.append((re.compile(
+                    "|".join(f"(?P<r{i}>{self.rules[i].pattern})" for i in shared), re.IGNORECASE
+                ), None))
+            except re.error:
+                alone = indices
+        for i in alone:
+            try:
+                matchers.append((re.compile(self.rules[i].pattern, re.IGNORECASE), i))
+            except re.error as e:
+                rule = self.rules[i]
+                raise ValueError(f"{rule.source}: invalid rule pattern {rule.pattern!r}: {e}") from e
+        return matchers
+
+    @classmethod
+    def from_files(cls, paths: Sequence[os.PathLike], include_builtin: bool = True) -> "PolicyEngine":
+        rules = list(BUILTIN_RULES) if include_builtin else []
+        for path in paths:
+            rules.extend(load_policy_file(path))
+        return cls(rules)
+
+    def _candidates(self, view: str) -> List[_Matcher]:
+        found: Dict[str, List[_Matcher]] = {}
+        for word in set(re.findall(r"\w+", view.lower())):
+            for n in self._lengths:
+                if n > len(word):
+                    break
+                matchers = self._by_keyword.get(word[:n])
+                if matchers is not None:
+                    found[word[:n]] = matchers
+        return [m for matchers in found.values() for m in matchers]
+
+    def _match(self, cmd: str) -> Optional[Rule]:
+        """Return the first rule `cmd` violates, or None (uncached; use match())."""
+        for view in dict.fromkeys([cmd] + command_views(cmd)):
+            for rx, index in self._candidates(view) + self._always:
+                m = rx.search(view)
+                if m:
+                    return self.rules[index if index is not None else int(m.lastgroup[1:])]  # type: ignore[index]
+        return None
+
+    def is_risky(self, cmd: str) -> bool:
+        return self.match(cmd) is not None
+
+
+def load_policy_file(path: os.PathLike) -> List[Rule]:
+    """
+    Read deny rules from a policy file. `.toml` files hold `[[rule]]` tables
+    with `pattern` and optional `description`; anything else is one regex
+    per line, with blank lines and `#` comments ignored.
+    """
+    path = Path(path).expanduser()
+    source = str(path)
+    if path.suffix == ".toml":
+        try:
+            import tomllib  # Python 3.11+
+        except ModuleNotFoundError:
+            import tomli as tomllib  # Backport for <3.11
+
+        with open(path, "rb") as f:
+            data = tomllib.load(f)
+        rules = []
+        for n, entry in enumerate(data.get("rule", []), 1):
+            if not isinstance(entry, dict) or not isinstance(entry.get("pattern"), str):
+                raise ValueError(f"{source}: rule {n} needs a string 'pattern'")
+            rules.append(Rule(entry["pattern"], str(entry.get("description", "")), f"{source}:rule {n}"))
+        return rules
+    rules = []
+    with open(path, encoding="utf-8") as f:
+        for n, line in enumerate(f, 1):
+            line = line.strip()
+            if line and not line.startswith("#"):
+                rules.append(Rule(line, "", f"{source}:{n}"))
+    return rules
+
+
+_policy: Optional[PolicyEngine] = None
+
+
+def set_policy(engine: PolicyEngine) -> None:
+    """Replace the engine behind is_risky() (e.g. with org policy files loaded)."""
+    global _policy
+    _policy = engine
+
+
+def get_policy() -> PolicyEngine:
+    """The engine behind is_risky(); the built-in rules are compiled on first use."""
+    global _policy
+    if _policy is None:
+        _policy = PolicyEngine(BUILTIN_RULES)
+    return _policy
 
 
 def is_risky(cmd: str) -> bool:
@@ -26,5 +306,85 @@ def is_risky(cmd: str) -> bool:
     Returns True if the command string matches a denylisted pattern.
     Use this as a hard block unless the user passes --allow-unsafe.
     """
-    return any(rx.search(cmd) for rx in _COMPILED)
+    return get_policy().match(cmd) is not None
+
+
+# Programs --think may run as probes without asking: they only read, as long
+# as none of the listed options is given. Anything not listed is not a probe.
+# git is deliberately absent: a checkout's .git/config and .gitattributes can
+# make even `git status` run programs (core.fsmonitor, clean filters, external
+# diff and textconv drivers), so it only runs as a confirmed command.
+READ_ONLY_PROGRAMS: Dict[str, frozenset] = {
+    **{name: frozenset() for name in (
+        "ls cat head wc stat file test [ pwd whoami id uname echo printf grep egrep fgrep "
+        "which type df du ps free uptime readlink realpath basename dirname diff cmp cut tr nl "
+        "column md5sum sha1sum sha256sum jq true false lsblk lscpu"
+    ).split()},
+    "date": frozenset("-s --set".split()),
+    "tail": frozenset("-f -F --follow".split()),  # would never finish
+    "rg": frozenset("--pre".split()),
+    "sort": frozenset("-o --output -T --temporary-directory --compress-program".split()),
+    "find": frozenset("-exec -execdir -ok -okdir -delete -fprint -fprint0 -fprintf -fls".split()),
+}
+
+
+def _forbidden_option(word: str, forbidden: frozenset) -> bool:
+    if word in forbidden or word.split("=", 1)[0] in forbidden:
+        return True
+    # A cluster of short options such as -ro
+    return word.startswith("-") and not word.startswith("--") and any(f"-{c}" in forbidden for c in word[1:])
+
+
+def is_read_only(cmd: str) -> bool:
+    """
+    Conservative check that `cmd` only reads: every simple command of its
+    pipelines and lists is a READ_ONLY_PROGRAMS entry without a forbidden
+    option, with no output redirection, command substitution, background
+    jobs, subshells, variable assignments or wrappers such as
+    sudo/env/xargs. Anything it
+    cannot parse is not read-only, nor is anything is_risky() flags, nor
+    anything spanning several lines (the shell runs each line as a command,
+    while shlex reads newlines as plain whitespace).
+    """
+    if not cmd.strip() or any(s in cmd for s in (">", "`", "$(", "<(", "\n", "\r")) or is_risky(cmd):
+        return False
+    try:
+        lex = shlex.shlex(cmd, posix=True, punctuation_chars=";|&()")
+        lex.whitespace_split = True
+        tokens = list(lex)
+    except ValueError:
+        return False
+    segments: List[List[str]] = [[]]
+    for tok in tokens:
+        if tok in ("&", "(", ")", "|&"):
+            return False
+        if tok in _SEPARATORS:
+            segments.append([])
+        else:
+            segments[-1].append(tok)
+    for words in segments:
+        if not words:
+            continue
+        program = words[0]
+        forbidden = READ_ONLY_PROGRAMS.get(program)
+        if forbidden is None:
+            return False
+        if any(_forbidden_option(w, forbidden) for w in words[1:]):
+            return False
+    return True
 
+
+def probe_refusals(probes: Sequence[str], max_probes: int) -> List[Optional[str]]:
+    """
+    For each of a think step's probes: None if it may run without asking,
+    otherwise why not, for the model to read in place of its output.
+    """
+    refusals: List[Optional[str]] = []
+    for i, probe in enumerate(probes):
+        if i >= max_probes:
+            refusals.append(f"over the limit of {max_probes} probes per step")
+        elif not is_read_only(probe):
+            refusals.append("not read-only; give it as 'command' instead")
+        else:
+            refusals.append(None)
+    return refusals
@@ -0,0 +1,228 @@
+from __future__ import annotations
+import codecs
+import os
+import selectors
+import shlex
+import subprocess
+import sys
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, Optional, TextIO, Tuple
+
+from .executor import KILLED_EXIT_CODE, OutputBuffer, kill_process_group
+
+
+class _SentinelStream:
+    """
+    Splits one pipe of the shell into command output and the sentinel line
+    that ends it. Text is released as soon as it cannot be the start of the
+    sentinel, so output still streams live.
+    """
+
+    def __init__(self, marker: str, buf: OutputBuffer, sink: Optional[TextIO]) -> None:
+        self.marker = marker
+        self.buf = buf
+        self.sink = sink
+        self.pending = ""
+        self.trailer: Optional[str] = None  # rest of the sentinel line once seen
+
+    def _emit(self, text: str) -> None:
+        if not text:
+            return
+        self.buf.write(text)
+        if self.sink is not None:
+            self.sink.write(text)
+            self.sink.flush()
+
+    def feed(self, text: str) -> None:
+        self.pending += text
+        idx = self.pending.find(self.marker)
+        if idx >= 0:
+            self._emit(self.pending[:idx])
+            self.pending = self.pending[idx:]
+            end = self.pending.find("\n", 1)
+            if end >= 0:
+                self.trailer = self.pending[len(self.marker):end].strip()
+                self.pending = ""
+            return
+        keep = 0
+        for k in range(min(len(self.marker) - 1, len(self.pending)), 0, -1):
+            if self.pending.endswith(self.marker[:k]):
+                keep = k
+                break
+        self._emit(self.pending[: len(self.pending) - keep])
+        self.pending = self.pending[len(self.pending) - keep:]
+
+    def flush(self) -> None:
+        self._emit(self.pending)
+        self.pending = ""
+
+
+class ShellSession:
+    """
+    One long-lived `/bin/sh` per run. Commands are written to its stdin and
+    each is followed by a sentinel line carrying the exit code and `pwd`, so
+    `cd`, `export`, `source venv/bin/activate` etc. really carry over between
+    steps and no shell is forked per command.
+
+    Commands run via `command eval` with stdin from /dev/null, so a syntax
+    error does not kill the shell and commands cannot eat our control
+    stream. If the shell dies (`exit`, timeout, output limit) the next
+    command starts a fresh one in the last known directory.
+    """
+
+    def __init__(self, cwd: Path, shell: str = "/bin/sh") -> None:
+        self.cwd = Path(cwd)
+        self.shell = shell
+        self._token = f"__GERG_{uuid.uuid4().hex}__"
+        self._proc: Optional[subprocess.Popen] = None
+
+    @property
+    def alive(self) -> bool:
+        return self._proc is not None and self._proc.poll() is None
+
+    def _spawn(self) -> subprocess.Popen:
+        self._proc = subprocess.Popen(
+            [self.shell],
+            cwd=str(self.cwd),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            start_new_session=True,
+            bufsize=0,
+        )
+        return self._proc
+
+    def close(self) -> None:
+        proc, self._proc = self._proc, None
+        if proc is None:
+            return
+        try:
+            proc.stdin.close()  # type: ignore[union-attr]
+            proc.wait(timeout=1)
+        except Exception:
+            kill_process_group(proc)
+        for f in (proc.stdout, proc.stderr):
+            if f is not None:
+                f.close()
+
+    def __enter__(self) -> "ShellSession":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def run(
+        self,
+        cmd: str,
+        timeout: Optional[float] = None,
+        max_output_bytes: Optional[int] = None,
+        echo: bool = True,
+        stdout_sink: Optional[TextIO] = None,
+        stderr_sink: Optional[TextIO] = None,
+        head_chars: int = 1000,
+        tail_chars: int = 3000,
+    ) -> subprocess.CompletedProcess:
+        """
+        Run `cmd` in the session. Same contract as executor.run_streaming,
+        plus `new_cwd` (the shell's directory afterwards) on the result.
+        """
+        notes = []
+        if self._proc is not None and not self.alive:
+            self.close()
+            notes.append("[gerg] shell session restarted; earlier environment changes were lost\n")
+        proc = self._proc or self._spawn()
+
+        marker = "\n" + self._token
+        script = (
+            f"command eval {shlex.quote(cmd)} </dev/null\n"
+            f"__gerg_rc=$?\n"
+            f"printf '\\n%s %s %s\\n' '{self._token}' \"$__gerg_rc\" \"$(pwd)\"\n"
+            f"printf '\\n%s\\n' '{self._token}' >&2\n"
+        )
+        stdout_sink = stdout_sink or sys.stdout
+        stderr_sink = stderr_sink or sys.stderr
+        streams: Dict[object, Tuple[_SentinelStream, object]] = {
+            proc.stdout: (
+                _SentinelStream(marker, OutputBuffer(head_chars, tail_chars), stdout_sink if echo else None),
+                codecs.getincrementaldecoder("utf-8")(errors="replace"),
+            ),
+            proc.stderr: (
+                _SentinelStream(marker, OutputBuffer(head_chars // 2, tail_chars // 2), stderr_sink if echo else None),
+                codecs.getincrementaldecoder("utf-8")(errors="replace"),
+            ),
+        }
+        out_stream = streams[proc.stdout][0]
+        err_stream = streams[proc.stderr][0]
+
+        start = time.monotonic()
+        timed_out = output_limited = died = False
+        total = 0
+        try:
+            proc.stdin.write(script.encode("utf-8"))  # type: ignore[union-attr]
+            proc.stdin.flush()  # type: ignore[union-attr]
+        except BrokenPipeError:
+            died = True
+
+        sel = selectors.DefaultSelector()
+        for f in streams:
+            sel.register(f, selectors.EVENT_READ)
+        try:
+            while not died and (out_stream.trailer is None or err_stream.trailer is None):
+                if timeout is not None and time.monotonic() - start > timeout:
+                    timed_out = True
+                    break
+                for key, _ in sel.select(timeout=0.1):
+                    stream, decoder = streams[key.fileobj]
+                    data = os.read(key.fd, 65536)
+                    if not data:
+                        died = True  # the shell exited (e.g. `exit` in cmd)
+                        break
+                    total += len(data)
+                    stream.feed(decoder.decode(data))
+                    if stream.trailer is not None:
+                        sel.unregister(key.fileobj)
+                    if max_output_bytes is not None and total > max_output_bytes:
+                        output_limited = True
+                        break
+                if output_limited:
+                    break
+        finally:
+            sel.close()
+
+        returncode = KILLED_EXIT_CODE
+        if out_stream.trailer is not None and err_stream.trailer is not None:
+            rc, _, cwd = out_stream.trailer.partition(" ")
+            returncode = int(rc) if rc.lstrip("-").isdigit() else 1
+            if cwd:
+                self.cwd = Path(cwd)
+        elif timed_out or output_limited:
+            kill_process_group(proc)
+            reason = (
+                f"timed out after {timeout:g}s"
+                if timed_out
+                else f"exceeded the {max_output_bytes} byte output limit"
+            )
+            notes.append(f"\n[gerg] command killed: {reason}\n")
+        else:
+            returncode = proc.wait()
+        out_stream.flush()
+        err_stream.flush()
+        for note in notes:
+            err_stream.buf.write(note)
+            if echo:
+                stderr_sink.write(note)
+                stderr_sink.flush()
+
+        cp = subprocess.CompletedProcess(
+            args=cmd,
+            returncode=returncode,
+            stdout=out_stream.buf.getvalue(),
+            stderr=err_stream.buf.getvalue(),
+        )
+        cp.new_cwd = self.cwd  # type: ignore[attr-defined]
+        cp.timed_out = timed_out  # type: ignore[attr-defined]
+        cp.output_limited = output_limited  # type: ignore[attr-defined]
+        cp.streamed = echo  # type: ignore[attr-defined]
+        return cp
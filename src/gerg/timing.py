@@ -0,0 +1,195 @@
+from __future__ import annotations
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Ollama's per-request durations (ns) and where they show up as spans.
+_OLLAMA_PHASES = (("load_duration", "load"), ("prompt_eval_duration", "prompt_eval"), ("eval_duration", "eval"))
+
+
+@dataclass
+class Span:
+    path: str  # "model/parse": span names from the outermost in
+    start: float  # seconds since the run started
+    end: float
+    thread: int
+    args: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def ms(self) -> float:
+        return (self.end - self.start) * 1000
+
+
+class Timings:
+    """
+    Timing spans and model metrics of one run. While activated, span() and
+    model_metrics() calls anywhere in the same context (including threads
+    started with a copy of it) record here; with nothing active they cost a
+    ContextVar lookup.
+    """
+
+    def __init__(self) -> None:
+        self.t0 = time.perf_counter()
+        self.spans: List[Span] = []
+        self.model: Dict[str, float] = {}
+        self._first_tokens: List[float] = []
+        self._lock = threading.Lock()
+
+    def activate(self) -> Token:
+        return _active.set(self)
+
+    @staticmethod
+    def deactivate(token: Token) -> None:
+        _active.reset(token)
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.t0) * 1000
+
+    def breakdown(self) -> Dict[str, Dict[str, float]]:
+        """Total ms and count per span path, in order of first appearance
+        with every path listed under its parent."""
+        totals: Dict[str, Dict[str, float]] = {}
+        first: Dict[str, float] = {}
+        for s in self.spans:
+            entry = totals.setdefault(s.path, {"ms": 0.0, "count": 0})
+            entry["ms"] += s.ms
+            entry["count"] += 1
+            first[s.path] = min(first.get(s.path, s.start), s.start)
+
+        def order(path: str) -> Tuple[float, ...]:
+            parts = path.split("/")
+            return tuple(first.get("/".join(parts[:i]), 0.0) for i in range(1, len(parts) + 1))
+
+        return {path: totals[path] for path in sorted(totals, key=order)}
+
+    def summary(self) -> Dict[str, Any]:
+        """Compact form for history records: total, ms per phase, model metrics."""
+        model = dict(self.model)
+        if self._first_tokens:
+            model["first_token_ms"] = round(sum(self._first_tokens) / len(self._first_tokens), 1)
+        return {
+            "total_ms": round(self.elapsed_ms(), 1),
+            "phases": {path: round(v["ms"], 1) for path, v in self.breakdown().items()},
+            "model": {k: round(v, 1) if isinstance(v, float) else v for k, v in model.items()},
+        }
+
+    def chrome_trace(self) -> Dict[str, Any]:
+        """The spans in Chrome trace-event format (chrome://tracing, Perfetto, speedscope)."""
+        events = [
+            {
+                "name": s.path.rsplit("/", 1)[-1],
+                "cat": s.path.split("/", 1)[0],
+                "ph": "X",
+                "ts": round(s.start * 1e6, 1),
+                "dur": round((s.end - s.start) * 1e6, 1),
+                "pid": 1,
+                "tid": s.thread,
+                "args": s.args,
+            }
+            for s in sorted(self.spans, key=lambda s: (s.start, -s.end))
+        ]
+        return {"traceEvents": events, "displayTimeUnit": "ms", "otherData": {"model": self.model}}
+
+    def format(self) -> str:
+        """Human-readable breakdown for --timings."""
+        total = self.elapsed_ms()
+        lines = [f"Timings (total {total:.1f} ms):"]
+        top = 0.0
+        for path, v in self.breakdown().items():
+            depth = path.count("/")
+            if depth == 0:
+                top += v["ms"]
+            name = "  " * depth + path.rsplit("/", 1)[-1]
+            count = f" x{v['count']}" if v["count"] > 1 else ""
+            lines.append(f"  {name:<24} {v['ms']:9.1f} ms{count}")
+        lines.append(f"  {'other':<24} {max(0.0, total - top):9.1f} ms")
+        m = self.model
+        if m.get("requests"):
+            parts = [f"{int(m['requests'])} request(s)"]
+            if "prompt_eval_count" in m:
+                parts.append(f"{int(m['prompt_eval_count'])} prompt tokens")
+            if "eval_count" in m:
+                rate = m["eval_count"] / (m["eval_ms"] / 1000) if m.get("eval_ms") else None
+                parts.append(f"{int(m['eval_count'])} generated" + (f" ({rate:.0f} tok/s)" if rate else ""))
+            if self._first_tokens:
+                parts.append(f"first token after {sum(self._first_tokens) / len(self._first_tokens):.0f} ms")
+            lines.append("  model: " + ", ".join(parts))
+        return "\n".join(lines)
+
+    def _add(self, span: Span) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+
+_active: ContextVar[Optional[Timings]] = ContextVar("gerg_timings", default=None)
+_path: ContextVar[str] = ContextVar("gerg_span_path", default="")
+
+
+def current() -> Optional[Timings]:
+    return _active.get()
+
+
+@contextmanager
+def span(name: str, **args: Any) -> Iterator[Dict[str, Any]]:
+    """
+    Time the block as `name`, nested under the enclosing span. Yields the
+    span's args dict so the block can attach details (counts, sizes).
+    """
+    timings = _active.get()
+    if timings is None:
+        yield args
+        return
+    parent = _path.get()
+    path = f"{parent}/{name}" if parent else name
+    token = _path.set(path)
+    start = time.perf_counter()
+    try:
+        yield args
+    finally:
+        end = time.perf_counter()
+        _path.reset(token)
+        timings._add(Span(path, start - timings.t0, end - timings.t0, threading.get_ident(), args))
+
+
+def first_token(ms: float) -> None:
+    """Record how long a streamed request took to produce its first content."""
+    timings = _active.get()
+    if timings is not None:
+        with timings._lock:
+            timings._first_tokens.append(ms)
+
+
+def model_metrics(metrics: Dict[str, Any]) -> None:
+    """
+    Fold one request's Ollama metrics (see agent.METRIC_KEYS) into the
+    active run: token counts and durations are summed, and the load, prompt
+    eval and generation times become spans under the current one, laid out
+    back to back so they end now.
+    """
+    timings = _active.get()
+    if timings is None:
+        return
+    now = time.perf_counter() - timings.t0
+    parent = _path.get()
+    spans = []
+    end = now
+    for key, name in reversed(_OLLAMA_PHASES):
+        ns = metrics.get(key)
+        if isinstance(ns, (int, float)) and ns > 0:
+            start = end - ns / 1e9
+            spans.append(Span(f"{parent}/{name}" if parent else name, start, end, threading.get_ident(),
+                              {"reported_by": "ollama"}))
+            end = start
+    with timings._lock:
+        m = timings.model
+        m["requests"] = m.get("requests", 0) + 1
+        for key in ("prompt_eval_count", "eval_count"):
+            if isinstance(metrics.get(key), int):
+                m[key] = m.get(key, 0) + metrics[key]
+        for key, name in _OLLAMA_PHASES + (("total_duration", "total"),):
+            if isinstance(metrics.get(key), (int, float)):
+                m[f"{name}_ms"] = m.get(f"{name}_ms", 0.0) + metrics[key] / 1e6
+        timings.spans.extend(spans)
@@ -0,0 +1,303 @@
+from __future__ import annotations
+import http.client
+import json
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+# Idle keep-alive connections kept per Ollama host.
+MAX_IDLE_PER_HOST = 16
+
+# A base_url may list several Ollama hosts separated by commas; requests go
+# to the host with the fewest in flight and fail over to the others.
+# Consecutive failures that open a host's circuit, and how long it stays
+# open unless a health probe gets an answer first (seconds).
+FAILURE_THRESHOLD = 3
+CIRCUIT_COOLDOWN = 30.0
+# Seconds between background health probes of failing hosts, and their timeout.
+HEALTH_INTERVAL = 10.0
+PROBE_TIMEOUT = 2.0
+# Weight of the newest sample in a host's smoothed response latency.
+LATENCY_ALPHA = 0.3
+
+_Key = Tuple[str, str, int]
+
+
+class HTTPError(OSError):
+    """Ollama answered with an error status."""
+
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(f"Ollama returned HTTP {status}: {message}")
+        self.status = status
+
+
+class _Pool:
+    """
+    Idle keep-alive connections per (scheme, host, port). http.client
+    connections are not thread-safe, so each request checks one out and
+    returns it only once its response has been read to the end.
+    """
+
+    def __init__(self) -> None:
+        self._idle: Dict[_Key, List[http.client.HTTPConnection]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: _Key, timeout: float) -> Tuple[http.client.HTTPConnection, bool]:
+        """Return a connection and whether it was reused."""
+        with self._lock:
+            idle = self._idle.get(key)
+            conn = idle.pop() if idle else None
+        if conn is not None:
+            conn.timeout = timeout
+            if conn.sock is not None:
+                conn.sock.settimeout(timeout)
+            return conn, True
+        scheme, host, port = key
+        if scheme == "https":
+            return http.client.HTTPSConnection(host, port, timeout=timeout), False
+        return http.client.HTTPConnection(host, port, timeout=timeout), False
+
+    def put(self, key: _Key, conn: http.client.HTTPConnection) -> None:
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < MAX_IDLE_PER_HOST:
+                idle.append(conn)
+                return
+        conn.close()
+
+
+_POOL = _Pool()
+
+
+def _split(base_url: str, path: str) -> Tuple[_Key, str]:
+    parts = urlsplit(base_url)
+    scheme = parts.scheme or "http"
+    port = parts.port or (443 if scheme == "https" else 80)
+    return (scheme, parts.hostname or "127.0.0.1", port), parts.path.rstrip("/") + path
+
+
+def _error_message(resp: http.client.HTTPResponse) -> str:
+    return _error_text(resp.read(4096), resp.reason)
+
+
+def _error_text(data: bytes, reason: Optional[str]) -> str:
+    """The message of an error reply: Ollama's {"error": ...}, else the body or reason."""
+    body = data.decode("utf-8", "replace")
+    try:
+        return str(json.loads(body).get("error") or body)
+    except (ValueError, AttributeError):
+        return body.strip() or (reason or "")
+
+
+def _open(
+    base_url: str, method: str, path: str, body: Optional[bytes], timeout: float
+) -> Tuple[_Key, http.client.HTTPConnection, http.client.HTTPResponse]:
+    key, target = _split(base_url, path)
+    headers = {"Accept": "application/json"}
+    if body is not None:
+        headers["Content-Type"] = "application/json"
+    while True:
+        conn, reused = _POOL.get(key, timeout)
+        try:
+            conn.request(method, target, body=body, headers=headers)
+            resp = conn.getresponse()
+        except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+            conn.close()
+            if reused:
+                continue  # the server dropped an idle keep-alive connection; retry fresh
+            raise
+        except BaseException:
+            conn.close()
+            raise
+        if resp.status >= 400:
+            message = _error_message(resp)
+            conn.close()
+            raise HTTPError(resp.status, message)
+        return key, conn, resp
+
+
+def endpoints(base_url: str) -> List[str]:
+    """The Ollama hosts named by `base_url` (comma-separated)."""
+    return [u.strip() for u in base_url.split(",") if u.strip()] or [base_url]
+
+
+class _Endpoint:
+    def __init__(self, url: str) -> None:
+        self.url = url
+        self.outstanding = 0
+        self.failures = 0  # in a row
+        self.open_until = 0.0  # monotonic time the circuit closes again
+        self.latency: Optional[float] = None  # smoothed seconds to the response head
+
+
+def _host_failed(exc: Exception) -> bool:
+    """Whether `exc` says the host (rather than the request) is at fault."""
+    if isinstance(exc, HTTPError):
+        return exc.status >= 500
+    return isinstance(exc, (OSError, http.client.HTTPException))
+
+
+def _try_elsewhere(exc: Exception) -> bool:
+    # 404: the model may only be pulled on some hosts; 429: this one is busy
+    return _host_failed(exc) or (isinstance(exc, HTTPError) and exc.status in (404, 429))
+
+
+class _Balancer:
+    """
+    Least-outstanding-requests selection over the hosts of one base_url.
+    Ties go to the host with fewer recent failures, then the lower smoothed
+    latency (unknown counts as fastest, so every host gets tried). After
+    FAILURE_THRESHOLD failures in a row a host's circuit opens: it is only
+    used once every other host has failed the request too, until
+    CIRCUIT_COOLDOWN passes or a background health probe gets an answer.
+    """
+
+    def __init__(self, urls: List[str]) -> None:
+        self.endpoints = [_Endpoint(u) for u in urls]
+        self._lock = threading.Lock()
+        self._prober: Optional[threading.Thread] = None
+
+    def acquire(self, tried: List[_Endpoint]) -> _Endpoint:
+        """The best host not in `tried`, counted as in flight."""
+        now = time.monotonic()
+        with self._lock:
+            if self._prober is None:
+                self._prober = threading.Thread(target=self._probe_forever, name="gerg-health", daemon=True)
+                self._prober.start()
+            ep = min(
+                (e for e in self.endpoints if e not in tried),
+                key=lambda e: (e.open_until > now, e.outstanding, e.failures, e.latency or 0.0),
+            )
+            ep.outstanding += 1
+            return ep
+
+    def release(self, ep: _Endpoint) -> None:
+        with self._lock:
+            ep.outstanding -= 1
+
+    def succeeded(self, ep: _Endpoint, latency: Optional[float] = None) -> None:
+        with self._lock:
+            ep.failures = 0
+            ep.open_until = 0.0
+            if latency is not None:
+                ep.latency = latency if ep.latency is None else (
+                    LATENCY_ALPHA * latency + (1 - LATENCY_ALPHA) * ep.latency
+                )
+
+    def failed(self, ep: _Endpoint) -> None:
+        with self._lock:
+            ep.failures += 1
+            if ep.failures >= FAILURE_THRESHOLD:
+                ep.open_until = time.monotonic() + CIRCUIT_COOLDOWN
+
+    def probe(self, ep: _Endpoint) -> bool:
+        """GET /api/version from `ep`; any answer below 500 counts as healthy."""
+        try:
+            key, conn, resp = _open(ep.url, "GET", "/api/version", None, PROBE_TIMEOUT)
+            resp.read()
+            _POOL.put(key, conn)
+        except HTTPError as e:
+            if e.status >= 500:
+                self.failed(ep)
+                return False
+        except Exception:
+            self.failed(ep)
+            return False
+        self.succeeded(ep)
+        return True
+
+    def _probe_forever(self) -> None:
+        # Hosts that answer requests need no probing; failing ones get
+        # probed until they answer again.
+        while True:
+            time.sleep(HEALTH_INTERVAL)
+            for ep in self.endpoints:
+                if ep.failures:
+                    self.probe(ep)
+
+
+_BALANCERS: Dict[str, _Balancer] = {}
+_BALANCERS_LOCK = threading.Lock()
+
+
+def _balancer(base_url: str, urls: List[str]) -> _Balancer:
+    with _BALANCERS_LOCK:
+        balancer = _BALANCERS.get(base_url)
+        if balancer is None:
+            balancer = _BALANCERS[base_url] = _Balancer(urls)
+        return balancer
+
+
+def _send(
+    base_url: str, path: str, payload: Any, timeout: float
+) -> Tuple[_Key, http.client.HTTPConnection, http.client.HTTPResponse, Callable[[], None]]:
+    """
+    Open the request on one of the hosts of `base_url` and return its
+    response head and a callback to run once the reply has been consumed.
+    A host that cannot be reached, fails with a 5xx, or answers 404/429 is
+    skipped and the request retried on the next one; once the head has
+    arrived the request stays on its host.
+    """
+    body = json.dumps(payload).encode("utf-8")
+    urls = endpoints(base_url)
+    if len(urls) == 1:
+        return (*_open(urls[0], "POST", path, body, timeout), lambda: None)
+    balancer = _balancer(base_url, urls)
+    tried: List[_Endpoint] = []
+    for _ in urls:
+        ep = balancer.acquire(tried)
+        start = time.monotonic()
+        try:
+            key, conn, resp = _open(ep.url, "POST", path, body, timeout)
+        except Exception as e:
+            balancer.release(ep)
+            if not _try_elsewhere(e):
+                raise
+            if _host_failed(e):
+                balancer.failed(ep)
+            tried.append(ep)
+            error = e
+            continue
+        balancer.succeeded(ep, time.monotonic() - start)
+        return key, conn, resp, lambda: balancer.release(ep)
+    raise error
+
+
+def post_json(base_url: str, path: str, payload: Any, timeout: float = 120) -> Any:
+    """POST `payload` as JSON to base_url + path and return the decoded reply."""
+    key, conn, resp, done = _send(base_url, path, payload, timeout)
+    try:
+        data = resp.read()
+    except BaseException:
+        conn.close()
+        raise
+    finally:
+        done()
+    if resp.will_close:
+        conn.close()
+    else:
+        _POOL.put(key, conn)
+    return json.loads(data)
+
+
+@contextmanager
+def post_stream(base_url: str, path: str, payload: Any, timeout: float = 120) -> Iterator[Iterator[bytes]]:
+    """
+    POST `payload` and yield an iterator over the raw lines of the streamed
+    (NDJSON) reply. Leaving the block early closes the connection, which is
+    how a generation is abandoned; a fully read reply keeps it for reuse.
+    """
+    key, conn, resp, done = _send(base_url, path, payload, timeout)
+    try:
+        yield iter(resp.readline, b"")
+    except BaseException:
+        conn.close()
+        raise
+    finally:
+        done()
+    if resp.isclosed() and not resp.will_close:
+        _POOL.put(key, conn)
+    else:
+        conn.close()
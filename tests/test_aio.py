@@ -0,0 +1,103 @@
+from __future__ import annotations
+import asyncio
+import sys
+import time
+from pathlib import Path
+from gerg import aio, transport
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "benchmarks"))
+from mock_ollama import MockConfig, MockOllama  # noqa: E402
+
+
+def test_requests_stream_hedge_and_reuse_connections():
+    async def run(url):
+        seen, stats = [], {}
+        plan = await aio.request_plan(url, "m", "list files", on_partial=lambda path, value: seen.append(path),
+                                      stats=stats)
+        assert plan.commands == ["true", "test -d ."]
+        assert ("commands", 1) in seen and stats["eval_count"] > 0
+        assert (await aio.request_plan(url, "m", "list files")).explanation == "mock plan"
+        assert (await aio.request_plan(url, "m", "list files", hedge=3)).commands == plan.commands
+        action = await aio.request_next_action(url, "m", "x", [{"role": "user", "content": "x"}])
+        assert action.command == "echo step 1"
+        # A dead host is skipped, as with the blocking client
+        assert (await aio.request_plan(f"http://127.0.0.1:9,{url}", "m", "list files")).commands == plan.commands
+        idle = len(aio._idle(transport._split(url, "/")[0]))
+        aio.close_idle()
+        return idle
+
+    with MockOllama(MockConfig(latency=0.0, token_rate=0)) as server:
+        assert asyncio.run(run(server.url)) >= 1
+
+
+def test_cancelling_a_request_aborts_the_generation():
+    async def run(url):
+        task = asyncio.ensure_future(aio.request_plan(url, "m", "list files", on_partial=lambda p, v: None))
+        await asyncio.sleep(0.3)
+        start = time.monotonic()
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            return time.monotonic() - start
+        raise AssertionError("not cancelled")
+
+    with MockOllama(MockConfig(latency=0.0, token_rate=20)) as server:  # ~1.5 s per reply
+        assert asyncio.run(run(server.url)) < 0.1
+        deadline = time.monotonic() + 2
+        while not server.aborted and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert server.aborted == 1
+
+
+def test_think_uses_the_executor_and_confirmation_callbacks(tmp_path):
+    ran, asked, steps = [], [], []
+
+    async def execute(command, cwd):
+        ran.append((command, cwd))
+        return await aio.run_command(command, cwd)
+
+    async def confirm(action):
+        asked.append(action.command)
+        return True
+
+    async def session(url, **kwargs):
+        try:
+            return await aio.think(url, "m", "say hi", cwd=tmp_path, **kwargs)
+        finally:
+            aio.close_idle()
+
+    with MockOllama(MockConfig(latency=0.0, token_rate=0, think_steps=2)) as server:
+        result = asyncio.run(session(server.url, execute=execute, confirm=confirm, on_step=steps.append))
+        assert result.status == "success"
+        assert ran == [("echo step 1", tmp_path), ("echo step 2", tmp_path)]
+        assert asked == ["echo step 1"]  # asked once, as actions do not require confirmation
+        assert [s["stdout_tail"] for s in steps] == ["step 1\n", "step 2\n"] and result.steps == steps
+
+        refused = asyncio.run(session(server.url, confirm=lambda action: False))
+        assert refused.status == "aborted" and refused.steps == []
+        # Nothing runs unasked unless the caller opts in
+        ran.clear()
+        unasked = asyncio.run(session(server.url, execute=execute))
+        assert unasked.status == "aborted" and ran == []
+        assert asyncio.run(session(server.url, execute=execute, auto_confirm=True)).status == "success"
+        assert len(ran) == 2
+
+
+def test_run_command_kills_on_timeout_and_cancellation(tmp_path):
+    async def run():
+        cp = await aio.run_command("echo out; echo err >&2", tmp_path)
+        assert (cp.returncode, cp.stdout, cp.stderr) == (0, "out\n", "err\n")
+        cp = await aio.run_command("sleep 10", tmp_path, timeout=0.2)
+        assert cp.returncode == aio.KILLED_EXIT_CODE and cp.timed_out and "timed out" in cp.stderr
+        task = asyncio.ensure_future(aio.run_command(f"sleep 10; touch {tmp_path / 'late'}", tmp_path))
+        await asyncio.sleep(0.2)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    start = time.monotonic()
+    asyncio.run(run())
+    assert time.monotonic() - start < 5 and not (tmp_path / "late").exists()
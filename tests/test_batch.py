@@ -0,0 +1,39 @@
+from __future__ import annotations
+import io
+import json
+import time
+from gerg.agent import Plan
+from gerg.batch import read_goals, run_batch
+
+
+def test_read_goals_accepts_jsonl_strings_and_text():
+    lines = ['{"goal": "list pdfs", "id": 7, "cwd": "/tmp"}', "", "# comment", '"tail the log"', "df -h please"]
+    goals = list(read_goals(lines))
+    assert [g.goal for g in goals] == ["list pdfs", "tail the log", "df -h please"]
+    assert (goals[0].id, goals[0].cwd, goals[2].index) == (7, "/tmp", 2)
+
+
+def test_run_batch_is_concurrent_and_reports_each_goal():
+    def plan_fn(item):
+        time.sleep(0.2)
+        if item.goal == "bad":
+            raise ValueError("Plan.commands must be a list of strings")
+        if item.goal == "down":
+            raise ConnectionError("refused")
+        cmd = "shutdown -h now" if item.goal == "nuke" else f"echo {item.goal}"
+        return Plan(explanation=item.goal, commands=[cmd], require_confirmation=False), False
+
+    out, log = io.StringIO(), io.StringIO()
+    goals = list(read_goals(["a", "b", "bad", "down", "nuke", "c"]))
+    start = time.monotonic()
+    summary = run_batch(goals, plan_fn, out, concurrency=6, log=log)
+    assert time.monotonic() - start < 1.0
+
+    results = {r["goal"]: r for r in map(json.loads, out.getvalue().splitlines())}
+    assert len(results) == 6
+    assert results["a"]["plan"]["commands"] == ["echo a"] and results["a"]["safe"] is True
+    assert results["bad"]["validation_error"] and results["down"]["error"].startswith("ConnectionError")
+    assert results["nuke"]["risky_commands"] == ["shutdown -h now"] and results["nuke"]["safe"] is False
+    assert all(r["latency_ms"] >= 200 for r in results.values())
+    assert (summary["ok"], summary["unsafe"], summary["invalid"], summary["errors"]) == (3, 1, 1, 1)
+    assert "goals/s" in log.getvalue()
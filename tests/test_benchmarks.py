@@ -0,0 +1,25 @@
+from __future__ import annotations
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "benchmarks"))
+import run as bench  # noqa: E402
+
+
+def test_quick_suite_runs_every_mode_without_errors():
+    report = bench.run_all(quick=True, only=["e2e", "safety"])
+    results = report["results"]
+    for name in ("plan", "print", "print_no_stream", "print_cached", "think", "print_malformed"):
+        assert results[f"e2e.{name}"]["errors"] == 0, name
+        assert results[f"e2e.{name}"]["total"]["n"] == 3
+    assert results["e2e.think"]["execute"]["median"] > 0
+    assert results["e2e.print_cached"]["model"]["median"] == 0
+    assert results["micro.is_risky.cached_per_1k"]["median"] > 0
+
+
+def test_compare_flags_only_real_slowdowns():
+    baseline = {"a": {"median": 10.0}, "e2e.x": {"total": {"median": 100.0}}, "b": {"median": 0.1}}
+    current = {"a": {"median": 10.5}, "e2e.x": {"total": {"median": 150.0}}, "b": {"median": 0.5}}
+    assert bench.compare(current, baseline, tolerance=0.25, min_delta_ms=1.0) == [
+        "e2e.x.total: 100.00 ms -> 150.00 ms (+50%)"
+    ]
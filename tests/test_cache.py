@@ -0,0 +1,43 @@
+from __future__ import annotations
+import os
+import time
+from pathlib import Path
+from gerg.agent import Plan
+from gerg.cache import PlanCache, plan_cache_key
+
+
+def _plan(cmd: str) -> Plan:
+    return Plan(explanation="x", commands=[cmd], require_confirmation=False)
+
+
+def test_plan_cache_key_depends_on_every_input():
+    base = ("list pdfs", "m", "prompt", 0.2, Path("/tmp"))
+    keys = {
+        plan_cache_key(*base),
+        plan_cache_key("list pdf", *base[1:]),
+        plan_cache_key(base[0], "m2", *base[2:]),
+        plan_cache_key(*base[:2], "prompt2", *base[3:]),
+        plan_cache_key(*base[:3], 0.3, base[4]),
+        plan_cache_key(*base[:4], Path("/")),
+    }
+    assert len(keys) == 6
+
+
+def test_plan_cache_roundtrip_ttl_and_lru(tmp_path):
+    cache = PlanCache(tmp_path, max_entries=2, ttl=60)
+    cache.put("a", _plan("echo a"))
+    assert cache.get("a") == _plan("echo a")
+    assert cache.get("missing") is None
+
+    # LRU: touching "a" makes "b" the eviction victim when "c" arrives
+    past = time.time() - 30
+    cache.put("b", _plan("echo b"))
+    os.utime(tmp_path / "b.json", (past, past))
+    cache.put("c", _plan("echo c"))
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+
+    expired = PlanCache(tmp_path, ttl=0)
+    time.sleep(0.01)
+    assert expired.get("a") is None
+    assert not (tmp_path / "a.json").exists()
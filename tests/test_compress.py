@@ -0,0 +1,62 @@
+from __future__ import annotations
+import pytest
+from gerg import compress
+
+
+def test_noise_repeats_and_error_ends():
+    noisy = "".join(f"\rdownloading {i}%" for i in range(101)) + "\n\x1b[1;32mdone\x1b[0m  \n"
+    assert compress.strip_noise(noisy) == "downloading 100%\ndone\n"
+
+    lines = ["start"] + ["ok"] * 5 + [f"fetched item {i} in 0.{i}s" for i in range(10)] + ["end"]
+    assert compress.collapse_repeats(lines) == [
+        "start", "ok  [repeated 5x]", "fetched item 0 in 0.0s", "[... 8 similar lines ...]",
+        "fetched item 9 in 0.9s", "end",
+    ]
+
+    trace = ["Traceback (most recent call last):"] + [f'  File "m{i}.py", line {i}, in f{i}' for i in range(60)]
+    kept = compress.keep_error_ends(trace + ["ValueError: boom"])
+    assert kept[0] == trace[0] and kept[-1] == "ValueError: boom"
+    assert len(kept) == compress.ERROR_HEAD + compress.ERROR_TAIL + 1
+
+
+def test_tables_keep_head_tail_and_counts():
+    rows = [f"-rw-r--r-- 1 me me {i * 100} Jan 1 12:00 file{i}.txt" for i in range(30)]
+    rows += [f"lrwxrwxrwx 1 me me 4 Jan 1 12:00 link{i} -> file{i}.txt" for i in range(10)]
+    rows += [f"drwxr-xr-x 2 me me 4096 Jan 1 12:00 dir{i}" for i in range(5)]
+    out = compress.summarize_tables(["total 48"] + rows)
+    assert out[:6] == ["total 48"] + rows[:5] and out[-3:] == rows[-3:]
+    assert out[6] == "[... 37 more rows; 45 rows in total; 30 files, 10 links, 5 dirs ...]"
+
+    paths = [f"src/m{i}.py" for i in range(25)] + ["README"]
+    assert "25 .py, 1 (no extension)" in compress.summarize_tables(paths)[5]
+    prose = ["a short line", "then a much longer line of prose here", "x"] * 10
+    assert compress.summarize_tables(prose) == prose
+
+
+def test_compressor_setting_and_savings():
+    assert compress.load_compressor("off") is None
+    assert compress.load_compressor("default") is compress.compress
+    assert compress.load_compressor("gerg.compress:strip_noise") is compress.strip_noise
+    with pytest.raises(ValueError):
+        compress.load_compressor("gerg.compress")
+    out, err, saved = compress.apply(compress.compress, "x\n" * 100, "")
+    assert out == "x  [repeated 100x]\n" and saved == 200 - len(out)
+    assert compress.apply(None, "a", "b") == ("a", "b", 0)
+
+
+def test_verbose_report_survives_a_compressor_that_adds_text(tmp_path, monkeypatch, capsys):
+    import json
+    from gerg import agent, cli, config
+
+    (tmp_path / "padding_compressor.py").write_text(
+        "def pad(stdout, stderr):\n    return stdout or '(no output)', stderr\n"
+    )
+    monkeypatch.syspath_prepend(str(tmp_path))
+    (tmp_path / "config.toml").write_text('observation_compressor = "padding_compressor:pad"\n')
+    monkeypatch.setattr(config, "CONFIG_PATHS", [tmp_path / "config.toml"])
+    monkeypatch.setenv("GERG_HISTORY_DIR", str(tmp_path / "hist"))
+    reply = {"explanation": "nothing", "command": "true", "done": True, "require_confirmation": False}
+    monkeypatch.setattr(agent, "_complete", lambda *a, **k: json.dumps(reply))
+    code = cli.main(["--no-daemon", "--think", "--no-stream", "--no-examples", "--yes", "--verbose",
+                     "--cwd", str(tmp_path), "do", "nothing"])
+    assert code == 0 and "Done." in capsys.readouterr().out
@@ -0,0 +1,36 @@
+from __future__ import annotations
+from pathlib import Path
+from gerg.conversation import ConversationManager
+
+
+def test_conversation_folds_old_steps_and_keeps_prefix_stable():
+    conv = ConversationManager("find big logs", budget=900)
+    for i in range(6):
+        conv.add_step(f"cmd{i}", 0, Path("/tmp"), f"line {i}\n" * 200, "")
+        msgs = conv.messages()
+        assert msgs[0] == {"role": "user", "content": "find big logs"}
+        assert conv.estimate(msgs) <= conv.budget
+        assert msgs[-1]["content"].startswith("OBSERVATION:\n")
+
+    assert conv.folded_steps == 5
+    assert msgs[2]["content"].startswith("OBSERVATION (summarized):")
+    # Summaries do not change once folded
+    assert conv.messages()[:4] == msgs[:4]
+
+
+def test_conversation_attaches_extra_only_when_it_fits():
+    conv = ConversationManager("goal", budget=400)
+    conv.add_step("ls", 0, Path("/"), "a\nb\n", "")
+    assert "RELATED CONTEXT" in conv.messages(extra="some notes")[-1]["content"]
+    assert "RELATED CONTEXT" not in conv.messages(extra="x" * 5000)[-1]["content"]
+
+
+def test_conversation_merges_probe_results_into_one_observation():
+    conv = ConversationManager("goal", budget=4000)
+    text = conv.add_results(Path("/w"), [("ls", 0, "a\n", ""), ("rm a", None, "", "not read-only")])
+    assert text.startswith("OBSERVATION:\nCWD: /w\n[1] $ ls\nEXIT_CODE: 0")
+    assert "[2] $ rm a\nNOT RUN: not read-only" in text
+    msgs = conv.messages()
+    assert msgs[1]["content"] == "Executed:\n[1] ls (exit_code=0)\n[2] rm a (exit_code=not run)"
+    # A single result keeps the plain single-command format
+    assert conv.add_results(Path("/w"), [("pwd", 0, "/w\n", "")]).startswith("OBSERVATION:\nCWD: /w\nEXIT_CODE: 0")
@@ -0,0 +1,77 @@
+from __future__ import annotations
+import io
+import json
+import sys
+import threading
+import pytest
+from gerg import agent, cli, daemon
+from gerg.config import load_settings
+
+
+@pytest.fixture
+def served(tmp_path, monkeypatch):
+    monkeypatch.setenv("GERG_HISTORY_DIR", str(tmp_path / "hist"))
+    monkeypatch.setattr(sys, "stdin", io.StringIO("y\n"))
+    d = daemon.Daemon(tmp_path / "gerg.sock", cli._run)
+    d.bind()
+    t = threading.Thread(target=d.serve_forever, daemon=True)
+    t.start()
+    yield d
+    d.shutdown()
+    t.join(5)
+
+
+def _fake_plan(commands, confirm=True):
+    def fake_complete(base_url, payload, timeout, on_partial=None, stats=None):
+        return json.dumps({"explanation": "x", "commands": commands, "require_confirmation": confirm})
+
+    return fake_complete
+
+
+def test_run_is_served_and_commands_run_on_the_client(served, tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(agent, "_complete", _fake_plan(["echo hi > out.txt"]))
+    work = tmp_path / "work"
+    work.mkdir()
+    code = daemon.run_client(
+        ["--no-stream", "--no-cache", "--cwd", str(work), "write", "a", "file"],
+        load_settings(), cli._LocalHost, path=served.path,
+    )
+    assert code == 0
+    assert (work / "out.txt").read_text() == "hi\n"
+    out = capsys.readouterr().out
+    assert "Proceed to run these commands?" in out and "echo hi > out.txt" in out
+
+
+def test_think_probes_run_on_the_client(served, tmp_path, monkeypatch):
+    work = tmp_path / "work"
+    work.mkdir()
+    (work / "notes.txt").write_text("remember\n")
+    seen = []
+
+    def fake_complete(base_url, payload, timeout, on_partial=None, stats=None):
+        seen.append(payload["messages"][-1]["content"])
+        return json.dumps({"explanation": "x", "command": "", "done": len(seen) > 1,
+                           "require_confirmation": False, "probes": ["cat notes.txt", "pwd"]})
+
+    monkeypatch.setattr(agent, "_complete", fake_complete)
+    argv = ["--think", "--no-stream", "--no-examples", "--cwd", str(work), "read", "notes"]
+    assert daemon.run_client(argv, load_settings(), cli._LocalHost, path=served.path) == 0
+    assert "STDOUT:\nremember" in seen[1] and f"STDOUT:\n{work}" in seen[1]
+
+
+def test_argument_errors_come_back_as_exit_codes(served, capsys):
+    assert daemon.run_client(["--max-steps", "x", "goal"], load_settings(), cli._LocalHost, path=served.path) == 2
+    assert "invalid int value" in capsys.readouterr().err
+
+
+def test_falls_back_without_a_matching_daemon(served, tmp_path, monkeypatch):
+    settings = load_settings()
+    assert daemon.run_client(["goal"], settings, cli._LocalHost, path=tmp_path / "missing.sock") is None
+    monkeypatch.setenv("GERG_MODEL", "other")
+    assert daemon.run_client(["goal"], settings, cli._LocalHost, path=served.path) is None
+
+
+def test_completed_process_round_trip(tmp_path):
+    cp = cli._LocalHost(tmp_path).run_step(f"cd {tmp_path}", tmp_path, None, None)
+    back = daemon._decode_completed("cd", json.loads(json.dumps(daemon._encode_completed(cp))))
+    assert back.new_cwd == tmp_path and back.returncode == 0 and not back.streamed
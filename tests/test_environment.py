@@ -0,0 +1,60 @@
+from __future__ import annotations
+import json
+import os
+from gerg import agent, cli, environment
+
+
+def _fake_tools(tmp_path, monkeypatch):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    for name, version in (("sed", "sed (GNU sed) 4.9"), ("git", "git version 2.43.0"), ("jq", "jq-1.7")):
+        tool = bin_dir / name
+        tool.write_text(f"#!/bin/sh\necho '{version}'\n")
+        tool.chmod(0o755)
+    monkeypatch.setenv("PATH", str(bin_dir))
+    monkeypatch.setattr(environment, "_memo", {})
+    return bin_dir
+
+
+def test_fingerprint_is_cached_until_a_path_directory_changes(tmp_path, monkeypatch):
+    bin_dir = _fake_tools(tmp_path, monkeypatch)
+    builds = []
+    real_build = environment.build
+    monkeypatch.setattr(environment, "build", lambda path_var: builds.append(path_var) or real_build(path_var))
+
+    text = environment.fingerprint(str(tmp_path))
+    assert "Userland: GNU sed" in text
+    assert "git 2.43.0" in text and "jq" in text
+    assert "NOT installed (do not use): python3, curl" in text
+    # Warm: the memo, then (in a new process) the file under history_dir
+    assert environment.fingerprint(str(tmp_path)) == text
+    monkeypatch.setattr(environment, "_memo", {})
+    assert environment.fingerprint(str(tmp_path)) == text
+    assert len(builds) == 1
+    assert json.loads((tmp_path / environment.CACHE_FILE).read_text())["fingerprint"]["tools"] == ["git", "jq"]
+
+    # Installing a program touches its directory
+    (bin_dir / "rg").write_text("#!/bin/sh\n")
+    (bin_dir / "rg").chmod(0o755)
+    os.utime(bin_dir, ns=(0, os.stat(bin_dir).st_mtime_ns + 1))
+    assert "rg" not in environment.fingerprint(str(tmp_path)).split("NOT installed")[1]
+    assert len(builds) == 2
+
+
+def test_cli_puts_the_fingerprint_in_the_system_prompt(tmp_path, monkeypatch):
+    _fake_tools(tmp_path, monkeypatch)
+    monkeypatch.setenv("GERG_HISTORY_DIR", str(tmp_path))
+    prompts = []
+
+    def fake_complete(base_url, payload, timeout, on_partial=None, stats=None):
+        prompts.append(payload["messages"][0]["content"])
+        return json.dumps({"explanation": "x", "commands": ["ls"], "require_confirmation": False})
+
+    monkeypatch.setattr(agent, "_complete", fake_complete)
+    assert cli.main(["--no-daemon", "--print", "--no-cache", "--no-examples", "list", "files"]) == 0
+    assert prompts[0].startswith(agent.AGENT_SYSTEM_PROMPT)
+    assert prompts[0].endswith(environment.fingerprint(str(tmp_path)))
+
+    monkeypatch.setenv("GERG_ENVIRONMENT_FINGERPRINT", "0")
+    assert cli.main(["--no-daemon", "--print", "--no-cache", "--no-examples", "list", "files"]) == 0
+    assert prompts[1] == agent.AGENT_SYSTEM_PROMPT
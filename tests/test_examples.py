@@ -0,0 +1,81 @@
+from __future__ import annotations
+import json
+import sqlite3
+from gerg import agent
+from gerg.examples import Example, format_examples, trigrams
+from gerg.history import HistoryStore
+
+
+def _success(goal, command, ts):
+    return {"goal": goal, "status": "success", "plan": {"commands": [command]}, "ts": ts}
+
+
+def test_similar_goals_rank_by_trigram_overlap(tmp_path):
+    store = HistoryStore.open(str(tmp_path))
+    store.add([
+        _success("list pdf files in Downloads", "find ~/Downloads -name '*.pdf'", 1),
+        _success("restart nginx", "sudo systemctl restart nginx", 2),
+        _success("List PDF files in  downloads", "ls ~/Downloads/*.pdf", 3),  # same goal, newer
+        _success("list pdf files in Documents", "ls ~/Documents/*.pdf", 4),
+    ])
+    hits = store.similar_goals("list the pdf files in downloads", k=3)
+    assert [h["commands"] for h in hits] == [["ls ~/Downloads/*.pdf"], ["ls ~/Documents/*.pdf"]]
+    assert hits[0]["score"] > hits[1]["score"]
+    assert store.similar_goals("compile the kernel") == []
+    assert " ab" in trigrams("AB")
+
+
+def test_example_index_is_kept_in_the_database(tmp_path):
+    store = HistoryStore.open(str(tmp_path))
+    store.add([_success("rotate nginx logs", "logrotate -f /etc/logrotate.d/nginx", 1)])
+    store.close()
+    # A database written before the index existed is indexed once on open
+    db = sqlite3.connect(str(tmp_path / "history.sqlite3"))
+    with db:
+        db.execute("DELETE FROM example_grams")
+        db.execute("DELETE FROM examples")
+        db.execute("PRAGMA user_version = 0")
+    db.close()
+    store = HistoryStore.open(str(tmp_path))
+    assert store.similar_goals("rotate the nginx logs")[0]["commands"] == ["logrotate -f /etc/logrotate.d/nginx"]
+    store.add([_success("rotate nginx logs", "logrotate /etc/logrotate.conf", 2)])
+    assert [h["commands"] for h in store.similar_goals("rotate the nginx logs")] == [["logrotate /etc/logrotate.conf"]]
+
+
+def test_format_examples_respects_the_budget():
+    examples = [Example("a" * 50, ["x" * 200]), Example("short", ["ls"])]
+    text = format_examples(examples, max_chars=100)
+    assert text == "Goal: short\n$ ls\n"
+    assert format_examples(examples, max_chars=5) is None
+
+
+def test_index_uses_only_successful_runs(tmp_path):
+    store = HistoryStore.open(str(tmp_path))
+    store.add([
+        {"goal": "tail the syslog", "status": "success", "plan": {"commands": ["tail /var/log/syslog"]}, "ts": 1},
+        {"goal": "tail the syslog file", "status": "failed", "plan": {"commands": ["tail syslog"]}, "ts": 2},
+        {"mode": "think", "goal": "tail the auth log", "status": "success", "ts": 3,
+         "steps": [{"command": "ls /var/log"}, {"command": "tail /var/log/auth.log"}],
+         "few_shot": 1, "steps_to_done": 2, "failed_steps": 0},
+        {"mode": "think", "goal": "tail kern log", "status": "max_steps_reached", "ts": 4,
+         "steps": [{"command": "tail kern"}], "few_shot": 0, "failed_steps": 1},
+    ])
+    hits = store.similar_goals("tail the syslog please")
+    assert hits[0]["commands"] == ["tail /var/log/syslog"]
+    assert all(h["commands"] != ["tail syslog"] for h in hits)
+    think = store.stats()["think"]
+    assert think["with_examples"] == {"runs": 1, "avg_steps_to_done": 2, "avg_failed_steps": 0, "success_rate": 1}
+    assert think["without_examples"]["avg_steps_to_done"] is None
+
+
+def test_examples_go_into_the_prompt(monkeypatch):
+    sent = []
+
+    def fake_complete(base_url, payload, timeout, on_partial=None, stats=None):
+        sent.append(payload["messages"])
+        return json.dumps({"explanation": "x", "commands": ["ls"], "require_confirmation": False})
+
+    monkeypatch.setattr(agent, "_complete", fake_complete)
+    agent.request_plan("http://x", "m", "list pdfs", examples="Goal: list docs\n$ ls ~/Documents\n")
+    assert [m["role"] for m in sent[0]] == ["system", "system", "user"]
+    assert "$ ls ~/Documents" in sent[0][1]["content"]
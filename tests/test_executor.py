@@ -0,0 +1,50 @@
+from __future__ import annotations
+import io
+import time
+from pathlib import Path
+from gerg.executor import KILLED_EXIT_CODE, OutputBuffer, run_captured, run_streaming
+
+
+def test_output_buffer_keeps_head_and_tail():
+    buf = OutputBuffer(head=10, tail=10)
+    for i in range(1000):
+        buf.write(f"{i:04d}\n")
+    text = buf.getvalue()
+    assert text.startswith("0000\n0001")
+    assert text.endswith("0998\n0999\n")
+    assert f"[{5000 - 20} chars omitted]" in text
+
+
+def test_run_streaming_echoes_and_bounds_output(tmp_path):
+    sink = io.StringIO()
+    cp = run_streaming(
+        "seq 1 100000; echo oops >&2; exit 3",
+        Path(tmp_path),
+        stdout_sink=sink,
+        stderr_sink=io.StringIO(),
+        head_chars=100,
+        tail_chars=100,
+    )
+    assert cp.returncode == 3
+    assert sink.getvalue().endswith("99999\n100000\n")  # everything was echoed live
+    assert len(cp.stdout) < 300 and cp.stdout.endswith("100000\n")
+    assert cp.stderr == "oops\n"
+
+
+def test_run_streaming_enforces_timeout_and_output_limit(tmp_path):
+    start = time.monotonic()
+    cp = run_streaming("echo start; sleep 30", Path(tmp_path), timeout=0.5, echo=False)
+    assert time.monotonic() - start < 10
+    assert cp.timed_out and cp.returncode == KILLED_EXIT_CODE
+    assert cp.stdout == "start\n" and "timed out" in cp.stderr
+
+    cp = run_streaming("yes", Path(tmp_path), max_output_bytes=100_000, echo=False)
+    assert cp.output_limited and cp.returncode == KILLED_EXIT_CODE
+
+
+def test_run_captured_runs_concurrently_in_order(tmp_path):
+    start = time.monotonic()
+    results = run_captured([f"sleep 0.4; echo {i}" for i in range(4)], Path(tmp_path))
+    assert time.monotonic() - start < 1.2
+    assert [cp.stdout for cp in results] == ["0\n", "1\n", "2\n", "3\n"]
+    assert not any(cp.streamed for cp in results)
@@ -0,0 +1,102 @@
+from __future__ import annotations
+import json
+import threading
+import time
+import pytest
+from gerg import agent
+from gerg.agent import PLAN_SCHEMA, NEXT_ACTION_SCHEMA, request_plan, request_next_action
+
+
+def _plan(*commands):
+    return json.dumps({"explanation": "x", "commands": list(commands), "require_confirmation": False})
+
+
+def test_schemas_follow_the_reply_dataclasses():
+    assert PLAN_SCHEMA["required"] == ["explanation", "commands", "require_confirmation"]
+    assert PLAN_SCHEMA["properties"]["commands"] == {"type": "array", "items": {"type": "string"}}
+    assert PLAN_SCHEMA["properties"]["depends_on"]["items"]["items"] == {"type": "integer"}
+    assert NEXT_ACTION_SCHEMA["properties"]["done"] == {"type": "boolean"}
+
+
+def test_invalid_reply_gets_one_repair_round_trip(monkeypatch):
+    calls = []
+
+    def fake_complete(base_url, payload, timeout, on_partial=None, stats=None):
+        calls.append(payload)
+        return '{"explanation": "x", "commands": "ls"}' if len(calls) == 1 else _plan("ls")
+
+    monkeypatch.setattr(agent, "_complete", fake_complete)
+    plan = request_plan("http://x", "m", "list files")
+    assert plan.commands == ["ls"]
+    assert calls[0]["format"] == PLAN_SCHEMA
+    repair = calls[1]
+    assert repair["options"]["temperature"] == 0
+    assert repair["messages"][-2] == {"role": "assistant", "content": '{"explanation": "x", "commands": "ls"}'}
+    assert "Plan.commands must be a list of strings" in repair["messages"][-1]["content"]
+
+
+def test_repair_failure_raises_original_error(monkeypatch):
+    monkeypatch.setattr(agent, "_complete", lambda *a, **k: "not json")
+    with pytest.raises(ValueError, match="Failed to parse next-action JSON"):
+        request_next_action("http://x", "m", "goal", [{"role": "user", "content": "goal"}])
+
+
+def test_hedged_request_takes_first_valid_safe_sample_and_cancels_the_rest(monkeypatch):
+    cancelled = threading.Event()
+
+    def fake_stream(base_url, payload, timeout, on_partial=None, stats=None, cancel=None):
+        temp = payload["options"]["temperature"]
+        if temp == 0.2:  # slow sample: must be abandoned
+            while not cancel.is_set():
+                time.sleep(0.01)
+            cancelled.set()
+            raise agent._Cancelled()
+        if temp == 0.5:
+            return _plan("shutdown -h now")  # valid but risky
+        time.sleep(0.05)
+        stats["eval_count"] = 7
+        return _plan("ls -la")
+
+    monkeypatch.setattr(agent, "_stream_ollama", fake_stream)
+    stats = {}
+    start = time.monotonic()
+    plan = request_plan("http://x", "m", "list files", hedge=3, stats=stats)
+    assert plan.commands == ["ls -la"]
+    assert stats == {"eval_count": 7}
+    assert time.monotonic() - start < 1.0
+    assert cancelled.wait(1.0)
+
+
+def test_repaired_stream_reprints_the_validated_plan(tmp_path, monkeypatch, capsys):
+    from gerg import cli
+
+    monkeypatch.setenv("GERG_HISTORY_DIR", str(tmp_path))
+    monkeypatch.setenv("GERG_ENVIRONMENT_FINGERPRINT", "0")
+
+    def fake_complete(base_url, payload, timeout, on_partial=None, stats=None):
+        if on_partial is None:  # the repair round trip
+            return json.dumps({"explanation": "list files", "commands": ["ls"], "require_confirmation": False})
+        on_partial(("explanation",), "clean up")
+        on_partial(("commands", 0), "rm -rf build")
+        return '{"explanation": "clean up", "commands": ["rm -rf build", 1]}'
+
+    monkeypatch.setattr(agent, "_complete", fake_complete)
+    assert cli.main(["--no-daemon", "--print", "--no-cache", "--no-examples", "list"]) == 0
+    out = capsys.readouterr().out
+    shown, corrected = out.split("has been corrected")
+    assert "rm -rf build" in shown
+    assert "rm -rf build" not in corrected
+    assert "1. ls" in corrected
+
+
+def test_repaired_stream_reprints_the_validated_step(capsys):
+    from gerg.agent import NextAction
+    from gerg.cli import _StepStreamPrinter
+
+    printer = _StepStreamPrinter(1)
+    printer(("explanation",), "look around")
+    printer(("command",), "rm -rf build")
+    printer.finish(NextAction(explanation="look around", command="ls", done=False, require_confirmation=False))
+    out = capsys.readouterr().out
+    assert out.index("rm -rf build") < out.index("corrected") < out.index("Command:\x1b[0m ls")
+    assert out.count("Step 1:") == 2
@@ -0,0 +1,76 @@
+from __future__ import annotations
+import json
+import threading
+import time
+from gerg.cli import main
+from gerg.history import HistoryLog, HistoryStore
+
+
+def _run(goal, status="success", commands=("ls",), **extra):
+    return dict({"goal": goal, "model": "m", "status": status, "plan": {"commands": list(commands)}}, **extra)
+
+
+def test_store_search_last_and_stats(tmp_path):
+    store = HistoryStore.open(str(tmp_path))
+    assert store.path.parent == tmp_path
+    store.add([
+        _run("list pdfs in downloads", commands=["ls ~/Downloads/*.pdf"], ts=1.0, cwd="/a"),
+        _run("compress logs", status="failed", commands=["tar czf logs.tgz logs"], ts=2.0, cwd="/b"),
+        {"mode": "think", "goal": "find big files", "status": "success", "ts": 3.0,
+         "steps": [{"command": "du -sh *"}, {"command": "sort -h"}]},
+    ])
+    assert store._db.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert [r["goal"] for r in store.search("pdf")] == ["list pdfs in downloads"]
+    assert [r["goal"] for r in store.search("tar logs")] == ["compress logs"]
+    assert store.search("sort")[0]["commands"] == ["du -sh *", "sort -h"]
+    assert [r["goal"] for r in store.last(2)] == ["find big files", "compress logs"]
+    assert [r["goal"] for r in store.last(5, status="success", cwd="/a")] == ["list pdfs in downloads"]
+    stats = store.stats()
+    assert stats["runs"] == 3 and stats["by_status"] == {"success": 2, "failed": 1}
+    assert stats["by_mode"] == {"plan": 2, "think": 1}
+
+
+def test_import_jsonl_only_adds_new_lines(tmp_path):
+    legacy = tmp_path / "proj" / ".gerg_history.jsonl"
+    legacy.parent.mkdir()
+    legacy.write_text(json.dumps(_run("one")) + "\nnot json\n" + json.dumps(_run("two")) + "\n")
+    store = HistoryStore.open(str(tmp_path / "hist"))
+    assert store.import_jsonl(legacy) == 2
+    assert store.import_jsonl(legacy) == 0
+    with open(legacy, "a") as f:
+        f.write(json.dumps(_run("three")) + "\n" + '{"goal": "partial')
+    assert store.import_jsonl(legacy) == 1
+    assert {r["cwd"] for r in store.last(10)} == {str(legacy.parent.resolve())}
+
+
+def test_history_log_writes_in_the_background(tmp_path, monkeypatch):
+    # The store cannot even be opened until every write() has returned
+    release = threading.Event()
+    open_store = HistoryStore.open
+
+    def blocked_open(history_dir):
+        if not release.wait(10):
+            raise AssertionError("write() waited for the database")
+        return open_store(history_dir)
+
+    monkeypatch.setattr(HistoryStore, "open", staticmethod(blocked_open))
+    log = HistoryLog(str(tmp_path))
+    for i in range(200):
+        log.write(tmp_path, _run(f"goal {i}"))
+    release.set()
+    log.close()
+    monkeypatch.undo()
+    store = HistoryStore.open(str(tmp_path))
+    rows = store.last(500)
+    assert len(rows) == 200 and rows[0]["cwd"] == str(tmp_path)
+
+
+def test_history_subcommands(tmp_path, monkeypatch, capsys):
+    monkeypatch.setenv("GERG_HISTORY_DIR", str(tmp_path))
+    HistoryStore.open(str(tmp_path)).add([_run("list pdfs", ts=time.time())])
+    assert main(["history", "search", "pdfs", "--json"]) == 0
+    assert json.loads(capsys.readouterr().out)["goal"] == "list pdfs"
+    assert main(["history", "stats", "--json"]) == 0
+    assert json.loads(capsys.readouterr().out)["last_24h"] == 1
+    assert main(["history", "last"]) == 0
+    assert "$ ls" in capsys.readouterr().out
@@ -0,0 +1,38 @@
+from __future__ import annotations
+import io
+import time
+import pytest
+from gerg.agent import Plan
+from gerg.executor import run_dependency_graph
+
+
+def test_plan_depends_on_is_optional_and_validated():
+    plain = Plan.from_obj({"explanation": "x", "commands": ["a", "b"], "require_confirmation": False})
+    assert plain.depends_on is None
+
+    obj = {"explanation": "x", "commands": ["a", "b", "c"], "require_confirmation": False,
+           "depends_on": [[], [], [2, 1, 1]]}
+    assert Plan.from_obj(obj).depends_on == [[], [], [1, 2]]
+
+    for bad in ([[], []], [[], [2], []], [[], [], [3]], [[], [True], []], "1,2"):
+        with pytest.raises(ValueError):
+            Plan.from_obj(dict(obj, depends_on=bad))
+
+
+def test_dependency_graph_runs_in_parallel_and_skips_dependents(tmp_path):
+    out, err = io.StringIO(), io.StringIO()
+    start = time.monotonic()
+    results = run_dependency_graph(
+        ["sleep 0.4; echo a", "sleep 0.4; echo b", "sleep 0.4; false", "echo after-ab", "echo after-fail", "echo chained"],
+        [[], [], [], [1, 2], [3], [5]],
+        tmp_path,
+        max_workers=3,
+        stdout_sink=out,
+        stderr_sink=err,
+    )
+    assert time.monotonic() - start < 1.2  # the three sleeps overlapped
+    assert results == [0, 0, 1, 0, None, None]
+    lines = out.getvalue().splitlines()
+    assert "[1] a" in lines and "[2] b" in lines and "[4] after-ab" in lines
+    assert "after-fail" not in out.getvalue()
+    assert "[5] skipped" in err.getvalue() and "[6] skipped" in err.getvalue()
@@ -0,0 +1,98 @@
+from __future__ import annotations
+import io
+import json
+import shutil
+import subprocess
+import sys
+import pytest
+from gerg import agent, cli
+from gerg.history import HistoryStore
+from gerg.conversation import probe_results
+from gerg.safety import is_read_only, probe_refusals
+
+
+def test_read_only_classifier_is_conservative():
+    for cmd in [
+        "ls -la ~", "cat a | grep x | wc -l", "test -f x && echo yes", "find . -name '*.py' -newer x",
+        "sort -u f", "[ -d /tmp ] || echo no",
+    ]:
+        assert is_read_only(cmd), cmd
+    for cmd in [
+        "", "rm x", "ls > f", "echo $(rm x)", "echo `id`", "find . -delete", "find . -exec cat {} ;",
+        "sort -ro out f", "git commit -m x", "git -C repo status", "sudo ls", "X=1 ls", "ls &", "(ls)",
+        "date -s now", "tail -f log", "/bin/ls", "xargs ls", "bash -c ls", "cat 'unterminated",
+        "ls\nrm -rf build", "ls\ntouch x", "ls\r\ntouch x", "cat 'a\nb'", "ls\n",
+        "git status --short", "git log -n3 --oneline", "git diff", "ls && git show",
+    ]:
+        assert not is_read_only(cmd), cmd
+
+
+def test_probe_refusals_and_results_keep_probe_order():
+    probes = ["ls", "rm x", "cat a", "pwd"]
+    refusals = probe_refusals(probes, max_probes=3)
+    assert refusals[0] is None and refusals[2] is None
+    assert "not read-only" in refusals[1] and "limit of 3" in refusals[3]
+    ran = [subprocess.CompletedProcess("ls", 0, "a\n", ""), subprocess.CompletedProcess("cat a", 1, None, "no")]
+    assert probe_results(probes, refusals, ran) == [
+        ("ls", 0, "a\n", ""), ("rm x", None, "", refusals[1]), ("cat a", 1, "", "no"), ("pwd", None, "", refusals[3]),
+    ]
+
+
+def _think_replies(*replies):
+    requests = []
+
+    def fake_complete(base_url, payload, timeout, on_partial=None, stats=None):
+        requests.append(payload["messages"])
+        return json.dumps(replies[len(requests) - 1])
+
+    return fake_complete, requests
+
+
+def test_think_step_runs_probes_concurrently_in_one_round_trip(tmp_path, monkeypatch, capsys):
+    monkeypatch.setenv("GERG_HISTORY_DIR", str(tmp_path / "hist"))
+    monkeypatch.setattr(sys, "stdin", io.StringIO(""))  # nothing may ask for confirmation
+    work = tmp_path / "work"
+    work.mkdir()
+    (work / "a.txt").write_text("alpha\n")
+    fake, requests = _think_replies(
+        {"explanation": "look", "command": "", "done": False, "require_confirmation": False,
+         "probes": ["ls", "cat a.txt", "rm a.txt", "ls\ntouch PWNED"]},
+        {"explanation": "seen", "command": "", "done": True, "require_confirmation": False,
+         "probes": ["wc -l a.txt"]},
+    )
+    monkeypatch.setattr(agent, "_complete", fake)
+    code = cli.main(["--no-daemon", "--think", "--no-stream", "--no-examples", "--cwd", str(work), "inspect", "a"])
+    assert code == 0 and len(requests) == 2
+    assert (work / "a.txt").exists() and not (work / "PWNED").exists()
+    observation = requests[1][-1]["content"]
+    assert "[1] $ ls\nEXIT_CODE: 0" in observation and "a.txt" in observation
+    assert "[2] $ cat a.txt\nEXIT_CODE: 0\nSTDOUT:\nalpha" in observation
+    assert "[3] $ rm a.txt\nNOT RUN" in observation
+    assert "Probe skipped (not read-only):" in capsys.readouterr().out
+
+    cli._history_log(str(tmp_path / "hist")).flush()
+    store = HistoryStore.open(str(tmp_path / "hist"))
+    record = store.record(store.last(1)[0]["id"])
+    assert record["status"] == "success" and record["steps"][0]["exit_code"] is None
+    assert [p["exit_code"] for p in record["steps"][0]["probes"]] == [0, 0, None, None]
+
+
+@pytest.mark.skipif(shutil.which("git") is None, reason="needs git")
+def test_git_probes_do_not_run_in_a_hostile_checkout(tmp_path, monkeypatch):
+    monkeypatch.setenv("GERG_HISTORY_DIR", str(tmp_path / "hist"))
+    monkeypatch.setattr(sys, "stdin", io.StringIO(""))
+    work = tmp_path / "work"
+    work.mkdir()
+    subprocess.run(["git", "init", "-q", str(work)], check=True)
+    with open(work / ".git" / "config", "a") as f:
+        f.write(f'[core]\n\tfsmonitor = "touch {work}/FSMONITOR; false"\n'
+                f'[diff]\n\texternal = "touch {work}/EXTDIFF"\n')
+    # A plain `git status` in this checkout would run the fsmonitor hook
+    fake, requests = _think_replies(
+        {"explanation": "look", "command": "", "done": True, "require_confirmation": False,
+         "probes": ["git status", "git diff", "git log -n1"]},
+    )
+    monkeypatch.setattr(agent, "_complete", fake)
+    code = cli.main(["--no-daemon", "--think", "--no-stream", "--no-examples", "--cwd", str(work), "inspect"])
+    assert code == 0
+    assert not (work / "FSMONITOR").exists() and not (work / "EXTDIFF").exists()
@@ -0,0 +1,156 @@
+from __future__ import annotations
+import os
+import tracemalloc
+from gerg import rag
+from gerg.cli import _read_rag_context
+from gerg.rag import RagIndex, chunk_text
+
+
+def test_chunk_text_respects_size():
+    text = "\n\n".join(f"para {i} " + "word " * 50 for i in range(20))
+    chunks = chunk_text(text, size=400)
+    assert all(len(c) <= 400 for c in chunks)
+    assert "para 0" in chunks[0] and "para 19" in chunks[-1]
+
+
+def test_rag_index_ranks_and_refreshes_incrementally(tmp_path):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    (docs / "nginx.md").write_text("Restart nginx with systemctl restart nginx.\n")
+    (docs / "backup.txt").write_text("Backups are written by rsync to /srv/backup nightly.\n")
+    (docs / "image.png").write_bytes(b"\x89PNG")
+    hist = tmp_path / "hist"
+
+    index = RagIndex.open(str(docs), str(hist))
+    hits = index.search("how do I restart nginx", k=2)
+    assert hits[0][1] == "nginx.md"
+    assert "rsync" in index.context("where do backups go")
+    assert len(index.context("nginx backups", max_chars=30)) <= 30
+
+    # Unchanged files are not re-read; changed and deleted ones are picked up
+    reopened = RagIndex.open(str(docs), str(hist))
+    assert reopened.refresh() is False
+    (docs / "backup.txt").write_text("Backups now go to s3 via restic.\n")
+    os.utime(docs / "backup.txt", ns=(1, 1))
+    (docs / "nginx.md").unlink()
+    assert reopened.refresh() is True
+    assert "restic" in reopened.context("backups")
+    assert reopened.search("nginx") == []
+
+
+def test_rag_index_context_falls_back_to_leading_chunks(tmp_path):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    (docs / "a.md").write_text("Deploys run from the release branch.\n")
+    (docs / "b.md").write_text("The database lives on db1.\n")
+    index = RagIndex.open(str(docs), str(tmp_path / "hist"))
+    assert index.search("compress old logs") == []
+    context = index.context("compress old logs")
+    assert context.index("# File: a.md") < context.index("release branch") < context.index("db1")
+    assert len(index.context("compress old logs", max_chars=20)) == 20
+    assert index.context("compress old logs", skip=context) is None
+
+
+def _fake_embed(calls):
+    vocab = ["nginx", "backup", "restic", "disk"]
+
+    def embed(texts):
+        calls.append(len(texts))
+        return [[float(t.lower().count(w)) + 0.01 for w in vocab] for t in texts]
+
+    return embed
+
+
+def test_embedding_index_is_incremental_and_ranks_by_cosine(tmp_path):
+    from gerg.rag import EmbeddingIndex
+
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    (docs / "nginx.md").write_text("nginx nginx reload\n")
+    (docs / "backup.md").write_text("backup with restic\n")
+    hist = tmp_path / "hist"
+    calls = []
+
+    index = EmbeddingIndex.open(str(docs), str(hist), "fake", _fake_embed(calls))
+    assert calls == [2]  # both chunks in one multi-input request
+    assert index.search("nginx", k=1)[0][1] == "nginx.md"
+    assert "restic" in index.context(["restic", "backup"], k=1)
+    index.close()
+
+    calls.clear()
+    (docs / "disk.md").write_text("disk usage\n")
+    reopened = EmbeddingIndex.open(str(docs), str(hist), "fake", _fake_embed(calls))
+    assert calls == [1]  # only the new chunk is embedded
+    assert reopened.search("disk", k=1)[0][1] == "disk.md"
+    assert reopened.search("nginx", k=1)[0][1] == "nginx.md"
+
+
+def _big_log(path, lines):
+    with open(path, "w") as f:
+        for i in range(lines):
+            f.write(f"2024-01-01 12:00:00 INFO request {i} served\n")
+        f.write("2024-01-02 09:00:00 ERROR disk full on /var\n")
+
+
+def test_large_files_are_read_through_head_and_tail_windows(tmp_path):
+    log = tmp_path / "app.log"
+    _big_log(log, 200_000)  # ~8 MB
+    tracemalloc.start()
+    try:
+        segments = rag.read_windows(log)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert peak < 3 * (rag.HEAD_BYTES + rag.TAIL_BYTES)
+    head, tail = segments
+    assert head.startswith("2024-01-01 12:00:00 INFO request 0 served\n") and head.endswith("\n")
+    assert tail.endswith("ERROR disk full on /var\n") and tail.startswith("2024-01-01")
+    assert "request 100000 " not in head + tail
+
+    (tmp_path / "blob.log").write_bytes(b"\x7fELF\x02\x01\x01\x00" + os.urandom(4096))
+    assert rag.read_windows(tmp_path / "blob.log") is None
+
+    index = RagIndex.open(str(tmp_path), str(tmp_path / "hist"))
+    assert set(index.files) == {"app.log"}
+    assert "disk full" in index.context("disk full error")
+
+    context = _read_rag_context(str(tmp_path), max_chars=2000)
+    assert len(context) <= 2000
+    assert "request 0 served" in context and "ERROR disk full on /var" in context
+
+
+def test_think_rag_for_goal_and_observation_shares_one_budget(tmp_path, monkeypatch):
+    import io
+    import json
+    import sys
+    from gerg import agent, cli, config
+
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    for i in range(40):
+        (docs / f"a{i}.md").write_text("Web server runbook, see the wiki. " * 30)
+        (docs / f"disk{i}.md").write_text("disk usage quota notes. " * 40)
+    monkeypatch.setenv("GERG_HISTORY_DIR", str(tmp_path / "hist"))
+    (tmp_path / "config.toml").write_text("think_token_budget = 100000\n")
+    monkeypatch.setattr(config, "CONFIG_PATHS", [tmp_path / "config.toml"])
+    monkeypatch.setattr(sys, "stdin", io.StringIO(""))
+    sent = []
+    replies = [
+        {"explanation": "look", "command": "", "done": False, "require_confirmation": False,
+         "probes": ["echo disk usage quota"]},
+        {"explanation": "done", "command": "", "done": True, "require_confirmation": False, "probes": ["true"]},
+    ]
+
+    def fake_complete(base_url, payload, timeout, on_partial=None, stats=None):
+        sent.append(payload["messages"])
+        return json.dumps(replies[len(sent) - 1])
+
+    monkeypatch.setattr(agent, "_complete", fake_complete)
+    code = cli.main(["--no-daemon", "--think", "--no-stream", "--no-examples", "--rag-dir", str(docs),
+                     "--cwd", str(tmp_path), "reload", "nginx"])
+    assert code == 0 and len(sent) == 2
+    goal_rag = next(m["content"] for m in sent[1] if m["content"].startswith("RAG CONTEXT"))
+    related = sent[1][-1]["content"].split("RELATED CONTEXT (read-only):\n", 1)[1]
+    # Nothing matches the goal, so its share is filled with the leading chunks
+    assert "runbook" in goal_rag and "disk usage" in related
+    assert len(goal_rag) - len("RAG CONTEXT (read-only):\n") + len(related) <= 20000
@@ -0,0 +1,56 @@
+from __future__ import annotations
+import json
+import pytest
+from gerg import agent, cli
+from gerg.history import HistoryStore
+from gerg.routing import Router, start_tier
+
+
+def test_start_tier_needs_two_hard_signals_to_skip_the_small_model():
+    long_goal = "find every log file over a gigabyte and compress the ones older than a week please"
+    assert start_tier(3, "list pdfs") == 0
+    assert start_tier(3, "list pdfs", think=True) == 0
+    assert start_tier(3, long_goal, think=True) == 1
+    assert start_tier(3, long_goal, think=True, rag=True) == 2
+    assert start_tier(1, long_goal, think=True, rag=True) == 0
+
+
+def test_router_escalates_on_invalid_and_rejected_replies():
+    def request(model):
+        if model == "small":
+            raise agent.ReplyError("bad json", "{")
+        return model
+
+    router = Router(["small", "medium", "large"])
+    assert router.call(request, accept=lambda m: m == "large") == "large"
+    assert [a["outcome"] for a in router.attempts] == ["invalid", "rejected", "ok"]
+    assert [e["reason"] for e in router.escalations] == ["invalid reply", "rejected reply"]
+    # Sticky: the next request starts where the last one ended
+    assert router.call(lambda m: m) == "large"
+    # On the last tier a rejected reply is returned and an invalid one raises
+    assert router.call(request, accept=lambda m: False) == "large"
+    with pytest.raises(agent.ReplyError):
+        Router(["small"]).call(request)
+
+
+def test_cli_plans_with_the_cascade_and_records_it(tmp_path, monkeypatch):
+    monkeypatch.setenv("GERG_HISTORY_DIR", str(tmp_path))
+    monkeypatch.setenv("GERG_MODELS", "small, big")
+    models = []
+
+    def fake_complete(base_url, payload, timeout, on_partial=None, stats=None):
+        models.append(payload["model"])
+        commands = ["sudo rm -rf /"] if payload["model"] == "small" else ["ls"]
+        return json.dumps({"explanation": "x", "commands": commands, "require_confirmation": False})
+
+    monkeypatch.setattr(agent, "_complete", fake_complete)
+    assert cli.main(["--no-daemon", "--print", "--no-cache", "--no-examples", "list", "files"]) == 0
+    assert models == ["small", "big"]
+
+    cli._history_log(str(tmp_path)).flush()
+    store = HistoryStore.open(str(tmp_path))
+    record = store.record(store.last(1)[0]["id"])
+    assert record["model"] == "big" and record["plan"]["commands"] == ["ls"]
+    assert [a["outcome"] for a in record["routing"]["attempts"]] == ["rejected", "ok"]
+    tiers = store.stats()["cascade"]["tiers"]
+    assert tiers["small"]["escalation_rate"] == 1 and tiers["big"]["escalations"] == 0
@@ -0,0 +1,91 @@
+from __future__ import annotations
+import time
+import pytest
+from gerg.safety import BUILTIN_RULES, PolicyEngine, Rule, command_views, is_risky, load_policy_file
+
+
+def test_builtin_rules_see_through_flags_quoting_and_wrappers():
+    for cmd in [
+        "rm -rf /", "rm -r -f /", "rm -fr /*", "rm -rf --no-preserve-root /", "rm / -rf",
+        'sudo rm -rf "/"', "sudo -u root env X=1 /bin/rm -Rf '/'", "bash -c 'rm -rf ~'",
+        "ls && rm -rf $HOME", "echo / | xargs -n1 rm -rf /", "curl -fsSL https://x | sudo bash",
+        ":(){ :|:& };:", "timeout 5 shutdown -h now",
+        "rm -rf /usr", "rm -rf /etc", "rm -rf ~/Documents", "rm -rf ~/tmp", "rm -rf /tmp/x",
+        "rm -f -R '/usr/local'", 'rm --recursive "$HOME/src"', "rm -rf ${HOME}", "rm /etc -r",
+    ]:
+        assert is_risky(cmd), cmd
+    for cmd in [
+        "rm -rf ./build", "rm -rf build/", "rm -f /tmp/x", "rm --force /tmp/x", "rm -r foo; ls /",
+        "echo 'rm -rf'",
+    ]:
+        assert not is_risky(cmd), cmd
+
+
+def test_command_views_split_pipelines_and_strip_wrappers():
+    assert command_views("sudo -u root env A=1 /usr/bin/rm -rf '/' && ls | xargs -I{} echo {}") == [
+        "rm -rf /", "ls", "echo {}",
+    ]
+    assert command_views("echo 'unterminated") == []
+
+
+def test_policy_files(tmp_path):
+    toml = tmp_path / "org.toml"
+    toml.write_text('[[rule]]\npattern = "\\\\bkubectl\\\\s+delete\\\\s+ns\\\\b"\ndescription = "no namespace deletes"\n')
+    text = tmp_path / "extra.rules"
+    text.write_text("# comment\n\n\\bterraform\\s+destroy\\b\n")
+    engine = PolicyEngine.from_files([toml, text])
+    rule = engine.match("sudo kubectl delete ns prod")
+    assert rule is not None and rule.description == "no namespace deletes"
+    assert engine.match("terraform destroy").source.endswith("extra.rules:3")
+    assert engine.is_risky("rm -rf /") and not engine.is_risky("kubectl get ns")
+    with pytest.raises(ValueError, match="invalid rule pattern"):
+        PolicyEngine([Rule("(unbalanced")])
+    assert len(load_policy_file(text)) == 1
+
+
+def test_rules_that_cannot_share_an_alternation(tmp_path):
+    rules = tmp_path / "org.rules"
+    rules.write_text(
+        "(?i)\\bterraform\\s+destroy\\b\n"  # global inline flag
+        "\\bkubectl\\s+delete\\s+(?P<kind>ns|namespace)\\b\n"
+        "\\bkubectl\\s+drain\\s+(?P<kind>\\S+)\n"  # the same group name again
+        "\\bcp\\s+(\\S+)\\s+\\1\\b\n"  # backreference: copy a file onto itself
+    )
+    engine = PolicyEngine.from_files([rules])
+    assert engine.match("TERRAFORM destroy").source.endswith("org.rules:1")
+    assert engine.match("kubectl delete namespace prod").source.endswith("org.rules:2")
+    assert engine.match("sudo kubectl drain node-1").source.endswith("org.rules:3")
+    assert engine.match("cp a.txt a.txt").source.endswith("org.rules:4")
+    assert not engine.is_risky("cp a.txt b.txt") and not engine.is_risky("kubectl get ns")
+    assert engine.is_risky("rm -rf /")
+    with pytest.raises(ValueError, match="org2.rules:1: invalid rule pattern"):
+        bad = tmp_path / "org2.rules"
+        bad.write_text("\\bfoo(?i)bar\n")
+        PolicyEngine.from_files([bad])
+
+
+def _per_command_cost(rule_count: int, commands) -> float:
+    rules = list(BUILTIN_RULES) + [
+        Rule(rf"\btool{i}\s+--(?:purge|wipe)\b") for i in range(rule_count)
+    ]
+    engine = PolicyEngine(rules)
+    best = float("inf")
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(20):
+            for cmd in commands:
+                engine._match(cmd)  # bypass the verdict cache
+        best = min(best, time.perf_counter() - start)
+    return best / (20 * len(commands))
+
+
+def test_cost_per_command_stays_flat_as_rules_grow():
+    commands = [
+        "ls -la ~/Downloads | grep pdf", "find . -name '*.log' -mtime +7 -delete",
+        "sudo apt-get install -y ripgrep", "tool42 --purge cache", "git status && git diff --stat",
+    ]
+    small = _per_command_cost(10, commands)
+    large = _per_command_cost(5000, commands)
+    assert PolicyEngine(list(BUILTIN_RULES) + [Rule(r"\btool42\s+--purge\b")]).is_risky(commands[3])
+    # A linear scan would be ~500x slower; allow generous noise.
+    assert large < small * 3, (small, large)
@@ -0,0 +1,35 @@
+from __future__ import annotations
+import io
+from pathlib import Path
+from gerg.shell import ShellSession
+
+
+def _run(session, cmd, **kw):
+    return session.run(cmd, stdout_sink=io.StringIO(), stderr_sink=io.StringIO(), **kw)
+
+
+def test_shell_session_keeps_cwd_and_env(tmp_path):
+    (tmp_path / "sub").mkdir()
+    with ShellSession(tmp_path) as sh:
+        assert _run(sh, "cd sub && export GERG_T=42").returncode == 0
+        assert sh.cwd == tmp_path / "sub"
+        cp = _run(sh, 'printf "%s:" "$GERG_T"; pwd')
+        assert cp.stdout == f"42:{tmp_path / 'sub'}\n"
+        assert cp.new_cwd == tmp_path / "sub"
+
+        cp = _run(sh, "printf no-newline; echo err >&2; false")
+        assert (cp.stdout, cp.stderr, cp.returncode) == ("no-newline", "err\n", 1)
+
+        # Syntax errors do not kill the session; `exit` does, and it restarts
+        assert _run(sh, "if then").returncode != 0
+        assert _run(sh, "echo alive").stdout == "alive\n"
+        assert _run(sh, "exit 7").returncode == 7
+        cp = _run(sh, "pwd")
+        assert cp.stdout == f"{tmp_path / 'sub'}\n" and "restarted" in cp.stderr
+
+
+def test_shell_session_timeout(tmp_path):
+    with ShellSession(tmp_path) as sh:
+        cp = _run(sh, "sleep 30", timeout=0.3)
+        assert cp.timed_out and "timed out" in cp.stderr
+        assert _run(sh, "echo ok").stdout == "ok\n"
@@ -0,0 +1,60 @@
+from __future__ import annotations
+import os
+import re
+import subprocess
+import sys
+import pytest
+
+# Cumulative import time budgets in milliseconds (best of a few runs, with
+# bytecode cached). Wall-clock limits depend on the machine and its load, so
+# they are only checked with GERG_IMPORT_BUDGET=1; GERG_IMPORT_BUDGET_SCALE
+# loosens them on slow machines.
+CHECK_BUDGET = os.environ.get("GERG_IMPORT_BUDGET", "").lower() in {"1", "true", "yes"}
+CLI_BUDGET_MS = 40  # what `gerg --help`, argument errors and `gerg history` pay
+PLAN_BUDGET_MS = 100  # everything a plain `gerg --print` run imports
+SCALE = float(os.environ.get("GERG_IMPORT_BUDGET_SCALE", "1"))
+
+# Modules that importing gerg.cli must not load (they load when a run needs them).
+LAZY = [
+    "requests", "urllib3", "http.client", "sqlite3", "subprocess", "concurrent.futures",
+    "gerg.agent", "gerg.transport", "gerg.rag", "gerg.shell", "gerg.executor",
+    "gerg.batch", "gerg.conversation", "gerg.history", "gerg.examples", "gerg.compress",
+    "gerg.environment", "gerg.aio",
+]
+
+
+def _python(code: str, *flags: str) -> subprocess.CompletedProcess:
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)  # measure imports, not compiles
+    return subprocess.run(
+        [sys.executable, *flags, "-c", code], capture_output=True, text=True, env=env, check=True
+    )
+
+
+def _import_ms(modules: str) -> float:
+    """Best-of-3 sum of the cumulative -X importtime of each top-level import."""
+    code = f"import {modules}"
+    _python(code)  # warm the bytecode cache
+    best = float("inf")
+    for _ in range(3):
+        total = 0
+        for line in _python(code, "-X", "importtime").stderr.splitlines():
+            m = re.match(r"import time:\s+\d+ \|\s+(\d+) \| (\S.*)$", line)
+            if m and m.group(2).strip() in modules.split(", "):
+                total += int(m.group(1))
+        best = min(best, total / 1000)
+    return best
+
+
+def test_cli_import_keeps_heavy_modules_lazy():
+    loaded = set(_python("import sys, gerg.cli; print('\\n'.join(sys.modules))").stdout.split())
+    assert not loaded & set(LAZY), sorted(loaded & set(LAZY))
+
+
+@pytest.mark.skipif(not CHECK_BUDGET, reason="timing check; set GERG_IMPORT_BUDGET=1")
+def test_import_time_budget():
+    cli = _import_ms("gerg.cli")
+    plan = _import_ms("gerg.cli, gerg.agent, gerg.cache, gerg.history, gerg.environment")
+    print(f"import gerg.cli: {cli:.1f} ms; plan run: {plan:.1f} ms")
+    assert cli < CLI_BUDGET_MS * SCALE, cli
+    assert plan < PLAN_BUDGET_MS * SCALE, plan
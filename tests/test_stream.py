@@ -0,0 +1,34 @@
+from __future__ import annotations
+import json
+from gerg.agent import PartialJSONParser
+
+
+def _feed_in_pieces(parser, text, size=3):
+    for i in range(0, len(text), size):
+        parser.feed(text[i:i + size])
+
+
+def test_partial_parser_reports_fields_as_they_finish():
+    seen = []
+    parser = PartialJSONParser(lambda path, value: seen.append((path, value)))
+    obj = {"explanation": "List \"PDFs\"", "commands": ["ls ~", "echo {}"], "require_confirmation": False}
+    text = json.dumps(obj)
+
+    _feed_in_pieces(parser, text[:text.index("echo")])
+    assert (("explanation",), 'List "PDFs"') in seen
+    assert (("commands", 0), "ls ~") in seen
+    assert not parser.complete
+
+    _feed_in_pieces(parser, text[text.index("echo"):] + "\n trailing")
+    assert parser.complete
+    assert (("commands", 1), "echo {}") in seen
+    assert (("require_confirmation",), False) in seen
+    assert json.loads(parser.text) == obj
+
+
+def test_partial_parser_fails_early_on_invalid_input():
+    for bad in ['Sure! {"a": 1}', '{"a" 1}', '{"a": [1,, 2]}', '{"a": tru }', '{,']:
+        parser = PartialJSONParser()
+        _feed_in_pieces(parser, bad, size=1)
+        assert parser.error, bad
+        assert not parser.complete
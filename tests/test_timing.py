@@ -0,0 +1,67 @@
+from __future__ import annotations
+import sys
+from pathlib import Path
+from gerg import agent, timing
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "benchmarks"))
+from mock_ollama import MockConfig, MockOllama  # noqa: E402
+
+
+def test_spans_nest_and_export():
+    timings = timing.Timings()
+    token = timings.activate()
+    try:
+        with timing.span("rag"):
+            pass
+        for step in (1, 2):
+            with timing.span("model", step=step) as args:
+                args["eval_count"] = 10
+                timing.model_metrics({"prompt_eval_count": 50, "eval_count": 10, "eval_duration": 2_000_000})
+    finally:
+        timing.Timings.deactivate(token)
+
+    breakdown = timings.breakdown()
+    assert list(breakdown) == ["rag", "model", "model/eval"]
+    assert breakdown["model"]["count"] == 2
+    assert abs(breakdown["model/eval"]["ms"] - 4.0) < 1e-6
+    summary = timings.summary()
+    assert summary["model"] == {"requests": 2, "prompt_eval_count": 100, "eval_count": 20, "eval_ms": 4.0}
+    events = timings.chrome_trace()["traceEvents"]
+    assert {e["name"] for e in events} == {"rag", "model", "eval"}
+    assert all(e["ph"] == "X" and e["dur"] >= 0 for e in events)
+    assert "20 generated" in timings.format()
+
+
+def test_spans_cost_nothing_without_a_run():
+    with timing.span("model", a=1) as args:
+        assert args == {"a": 1}
+    assert timing.current() is None
+
+
+def test_streamed_and_hedged_requests_record_model_metrics():
+    with MockOllama(MockConfig(latency=0.0, token_rate=0)) as server:
+        timings = timing.Timings()
+        token = timings.activate()
+        try:
+            agent.request_plan(server.url, "m", "list files", on_partial=lambda path, value: None)
+            agent.request_plan(server.url, "m", "list files", hedge=2)
+        finally:
+            timing.Timings.deactivate(token)
+    breakdown = timings.breakdown()
+    assert breakdown["model"]["count"] == 1 and breakdown["hedge/model"]["count"] >= 1
+    assert "parse" in breakdown
+    # The final chunk is read after the object completes, so metrics survive streaming
+    assert timings.model["requests"] >= 2 and timings.model["prompt_eval_count"] >= 200
+    assert timings.summary()["model"]["first_token_ms"] >= 0
+
+
+def test_keep_alive_is_sent_and_warm_up_only_loads_the_model():
+    with MockOllama(MockConfig(latency=0.0, token_rate=0)) as server:
+        agent.warm_up(server.url, "m", keep_alive="30m").join(5)
+        load = server.last_payload["/api/generate"]
+        assert load["model"] == "m" and load["keep_alive"] == "30m"
+        assert not load.get("prompt")
+        for on_partial in (None, lambda path, value: None):
+            server.last_payload.pop("/api/chat", None)
+            agent.request_plan(server.url, "m", "list files", on_partial=on_partial, keep_alive="30m")
+            assert server.last_payload["/api/chat"]["keep_alive"] == "30m"
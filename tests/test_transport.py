@@ -0,0 +1,110 @@
+from __future__ import annotations
+import json
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from gerg import transport
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    connections = set()
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self._send(200, {"version": "test"})
+
+    def do_POST(self):
+        _Handler.connections.add(self.client_address)
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if self.path == "/api/missing":
+            self._send(404, {"error": "model 'x' not found"})
+        elif body.get("stream"):
+            self.send_response(200)
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for i in range(3):
+                line = json.dumps({"n": i}).encode() + b"\n"
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+            self.wfile.write(b"0\r\n\r\n")
+        else:
+            self._send(200, {"echo": body, "path": self.path})
+
+    def _send(self, status, obj):
+        data = json.dumps(obj).encode()
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+@pytest.fixture
+def server():
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    _Handler.connections.clear()
+    yield f"http://127.0.0.1:{srv.server_address[1]}"
+    srv.shutdown()
+    srv.server_close()
+
+
+def test_post_json_reuses_the_connection(server):
+    for i in range(3):
+        assert transport.post_json(server + "/", "/api/chat", {"i": i}) == {"echo": {"i": i}, "path": "/api/chat"}
+    assert len(_Handler.connections) == 1
+
+
+def test_stream_lines_and_errors(server):
+    with transport.post_stream(server, "/api/chat", {"stream": True}) as lines:
+        assert [json.loads(line) for line in lines] == [{"n": 0}, {"n": 1}, {"n": 2}]
+    assert transport.post_json(server, "/api/chat", {})["path"] == "/api/chat"
+    assert len(_Handler.connections) == 1
+    with pytest.raises(transport.HTTPError, match="HTTP 404: model 'x' not found"):
+        transport.post_json(server, "/api/missing", {})
+
+
+def _dead_url():
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return f"http://127.0.0.1:{port}"
+
+
+def test_requests_fail_over_to_a_healthy_host(server):
+    base_url = f"{_dead_url()}, {server}"
+    for i in range(3):
+        assert transport.post_json(base_url, "/api/chat", {"i": i})["echo"] == {"i": i}
+    with transport.post_stream(base_url, "/api/chat", {"stream": True}) as lines:
+        assert len(list(lines)) == 3
+    down, up = transport._BALANCERS[base_url].endpoints
+    assert down.failures >= 1 and up.failures == 0 and up.latency is not None
+    assert down.outstanding == up.outstanding == 0
+    # Every host missing the model: the last error surfaces
+    with pytest.raises(transport.HTTPError, match="404"):
+        transport.post_json(f"{server},{server}/", "/api/missing", {})
+
+
+def test_least_outstanding_selection_and_circuit_breaker(server):
+    balancer = transport._Balancer([_dead_url(), _dead_url(), server])
+    held = [balancer.acquire([]) for _ in range(3)]
+    assert len({id(ep) for ep in held}) == 3
+    balancer.release(held[1])
+    assert balancer.acquire([]) is held[1]
+    assert balancer.acquire([held[1]]) is not held[1]
+
+    for ep in held:
+        balancer.release(ep)
+    balancer.release(held[1])
+    for _ in range(transport.FAILURE_THRESHOLD):
+        balancer.failed(held[0])
+        balancer.failed(held[2])
+    # Open circuits are the last resort, whatever their load
+    held[1].outstanding = 5
+    assert balancer.acquire([]) is held[1]
+    # A successful health probe closes the circuit again
+    assert balancer.probe(held[2]) and held[2].open_until == 0
+    assert not balancer.probe(held[0]) and held[0].open_until > 0